@@ -1,33 +1,64 @@
 from django.contrib import admin
 
-from .models import BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch, BatchIngredient
+from .models import BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch, BatchIngredient, UnitOfMeasure, ExportJob
+from .services.numbering import save_numbered
 
 @admin.register(BillOfMaterials)
 class BillOfMaterialsAdmin(admin.ModelAdmin):
-    list_display = ['name', 'code', 'output_quantity', 'is_active', 'created_at']
+    list_display = ['name', 'code', 'output_quantity', 'unit_cost', 'is_active', 'created_at']
     search_fields = ['name', 'code', 'notes']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['unit_cost', 'created_at', 'updated_at']
 
 @admin.register(BOMLine)
 class BOMLineAdmin(admin.ModelAdmin):
-    list_display = ['bom', 'description', 'quantity', 'unit', 'created_at']
+    list_display = ['bom', 'description', 'quantity', 'unit', 'unit_cost', 'created_at']
+    list_select_related = ['bom']
     search_fields = ['description', 'unit']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['base_quantity', 'base_unit', 'created_at', 'updated_at']
 
 @admin.register(ProductionOrder)
 class ProductionOrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'batch_number', 'bom', 'quantity', 'status', 'start_date', 'created_at']
+    list_select_related = ['bom']
     search_fields = ['order_number', 'batch_number', 'status', 'notes']
     readonly_fields = ['created_at', 'updated_at']
 
+    def save_model(self, request, obj, form, change):
+        if obj.order_number:
+            super().save_model(request, obj, form, change)
+        else:
+            save_numbered(obj, 'order')
+
 @admin.register(ProductionBatch)
 class ProductionBatchAdmin(admin.ModelAdmin):
     list_display = ['batch_number', 'production_order', 'quantity_produced', 'production_date', 'quality_status', 'created_at']
+    list_select_related = ['production_order']
     search_fields = ['batch_number', 'notes']
     readonly_fields = ['created_at', 'updated_at']
 
+    def save_model(self, request, obj, form, change):
+        if obj.batch_number:
+            super().save_model(request, obj, form, change)
+        else:
+            save_numbered(obj, 'batch')
+
 @admin.register(BatchIngredient)
 class BatchIngredientAdmin(admin.ModelAdmin):
-    list_display = ['batch', 'description', 'supplier_lot', 'quantity_used', 'unit', 'created_at']
+    list_display = ['batch', 'description', 'supplier_lot', 'source_batch', 'quantity_used', 'unit', 'created_at']
+    list_select_related = ['batch', 'source_batch']
+    raw_id_fields = ['batch', 'source_batch']
     search_fields = ['description', 'supplier_lot']
+    readonly_fields = ['base_quantity', 'base_unit', 'created_at', 'updated_at']
+
+@admin.register(UnitOfMeasure)
+class UnitOfMeasureAdmin(admin.ModelAdmin):
+    list_display = ['code', 'name', 'dimension', 'factor', 'created_at']
+    list_filter = ['dimension']
+    search_fields = ['code', 'name']
     readonly_fields = ['created_at', 'updated_at']
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'file_format', 'status', 'rows_done', 'rows_total', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind', 'file_format']
+    readonly_fields = ['params', 'rows_done', 'rows_total', 'file_name', 'error', 'started_at', 'finished_at', 'created_at', 'updated_at']
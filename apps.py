@@ -9,4 +9,9 @@ class ManufacturingConfig(AppConfig):
     verbose_name = _('Manufacturing & BOM')
 
     def ready(self):
-        pass
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        from .services.search import repair_search_indexes
+
+        post_migrate.connect(repair_search_indexes, sender=self, dispatch_uid='manufacturing_search_repair')
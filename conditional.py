@@ -0,0 +1,55 @@
+"""
+Conditional GET for HTMX partials.
+
+``versioned_etag(*models)`` wraps a view so that HTMX ``GET`` requests get
+an ETag built from the hub's change versions of ``models`` (one primary-key
+lookup, see services/versions.py) plus everything else the response
+depends on: the full path with its query string, the HTMX target, the user
+and the language. When the browser revalidates with a matching
+``If-None-Match`` the view is not called at all and a 304 is returned.
+
+Only ETags are used: a Last-Modified date has a one-second resolution and
+would miss a change made in the same second as the previous response.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.translation import get_language
+from django.views.decorators.http import condition
+
+from .services.versions import get_versions
+
+
+def _etag_func(models):
+    def etag(request, *args, **kwargs):
+        if request.method != 'GET' or not request.headers.get('HX-Request') or 'export' in request.GET:
+            return None
+        hub_id = request.session.get('hub_id')
+        if not hub_id:
+            return None
+        key = '|'.join(str(part) for part in (
+            request.get_full_path(),
+            request.headers.get('HX-Target', ''),
+            request.session.get('local_user_id', ''),
+            get_language(),
+            *get_versions(hub_id, *models),
+        ))
+        return hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+    return etag
+
+
+def versioned_etag(*models):
+    def decorator(view):
+        conditional_view = condition(etag_func=_etag_func(models))(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                # Cacheable by the browser only, and always revalidated.
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ('HX-Request', 'HX-Target'))
+            return response
+        return wrapper
+    return decorator
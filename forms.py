@@ -6,11 +6,12 @@ from .models import BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch,
 class BillOfMaterialsForm(forms.ModelForm):
     class Meta:
         model = BillOfMaterials
-        fields = ['name', 'code', 'output_quantity', 'notes', 'is_active']
+        fields = ['name', 'code', 'output_quantity', 'daily_capacity', 'notes', 'is_active']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
             'code': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
             'output_quantity': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'number'}),
+            'daily_capacity': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'number'}),
             'notes': forms.Textarea(attrs={'class': 'textarea textarea-sm w-full', 'rows': 3}),
             'is_active': forms.CheckboxInput(attrs={'class': 'toggle'}),
         }
@@ -18,18 +19,20 @@ class BillOfMaterialsForm(forms.ModelForm):
 class BOMLineForm(forms.ModelForm):
     class Meta:
         model = BOMLine
-        fields = ['bom', 'description', 'quantity', 'unit']
+        fields = ['bom', 'component_bom', 'description', 'quantity', 'unit', 'unit_cost']
         widgets = {
             'bom': forms.Select(attrs={'class': 'select select-sm w-full'}),
+            'component_bom': forms.Select(attrs={'class': 'select select-sm w-full'}),
             'description': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
             'quantity': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'number'}),
             'unit': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
+            'unit_cost': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'number'}),
         }
 
 class ProductionOrderForm(forms.ModelForm):
     class Meta:
         model = ProductionOrder
-        fields = ['order_number', 'bom', 'quantity', 'batch_number', 'expiry_date', 'status', 'start_date', 'end_date', 'notes']
+        fields = ['order_number', 'bom', 'quantity', 'batch_number', 'expiry_date', 'status', 'start_date', 'end_date', 'due_date', 'notes']
         widgets = {
             'order_number': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
             'bom': forms.Select(attrs={'class': 'select select-sm w-full'}),
@@ -39,6 +42,7 @@ class ProductionOrderForm(forms.ModelForm):
             'status': forms.Select(attrs={'class': 'select select-sm w-full'}),
             'start_date': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'date'}),
             'end_date': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'date'}),
+            'due_date': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'date'}),
             'notes': forms.Textarea(attrs={'class': 'textarea textarea-sm w-full', 'rows': 3}),
         }
 
@@ -60,11 +64,12 @@ class ProductionBatchForm(forms.ModelForm):
 class BatchIngredientForm(forms.ModelForm):
     class Meta:
         model = BatchIngredient
-        fields = ['batch', 'description', 'supplier_lot', 'quantity_used', 'unit']
+        fields = ['batch', 'description', 'supplier_lot', 'source_batch', 'quantity_used', 'unit']
         widgets = {
             'batch': forms.Select(attrs={'class': 'select select-sm w-full'}),
             'description': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
             'supplier_lot': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
+            'source_batch': forms.Select(attrs={'class': 'select select-sm w-full'}),
             'quantity_used': forms.TextInput(attrs={'class': 'input input-sm w-full', 'type': 'number', 'step': '0.01'}),
             'unit': forms.TextInput(attrs={'class': 'input input-sm w-full'}),
         }
@@ -0,0 +1,35 @@
+"""Move old soft-deleted rows and closed orders to the archive table."""
+from django.core.management.base import BaseCommand
+
+from manufacturing.models import ManufacturingSettings
+from manufacturing.services.archive import CHUNK_SIZE, archive_hub, cutoffs
+from manufacturing.services.counters import TOTAL_FIELDS
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive the records deleted, and the done or cancelled orders closed, longer ago than '
+        "each hub's retention settings, a chunk at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to archive (repeatable). Defaults to every hub.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows archived per transaction.')
+
+    def handle(self, *args, **options):
+        hub_ids = options['hubs']
+        if not hub_ids:
+            hub_ids = set()
+            for model in TOTAL_FIELDS:
+                hub_ids.update(
+                    model.all_objects.exclude(hub_id=None).order_by().values_list('hub_id', flat=True).distinct()
+                )
+            hub_ids = sorted(hub_ids, key=str)
+
+        chunk_size = max(options['chunk_size'], 1)
+        for hub_id in hub_ids:
+            deleted_before, closed_before = cutoffs(ManufacturingSettings.for_hub(hub_id))
+            result = archive_hub(hub_id, deleted_before, closed_before, chunk_size)
+            rows = ', '.join(f'{count} {name}' for name, count in sorted(result.rows.items())) or 'nothing'
+            self.stdout.write(f'{hub_id}: {rows}')
+        self.stdout.write(self.style.SUCCESS('Archive done.'))
@@ -0,0 +1,27 @@
+"""Generate missing batch ingredients from the bills of materials."""
+from django.core.management.base import BaseCommand
+
+from manufacturing.models import ProductionBatch
+from manufacturing.services.backflush import backflush_batches
+
+
+class Command(BaseCommand):
+    help = 'Backflush the ingredients of batches of every hub (or --hub) that have a BOM but no ingredients yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to backflush (repeatable). Defaults to every hub with batches.')
+
+    def handle(self, *args, **options):
+        hub_ids = options['hubs']
+        if not hub_ids:
+            hub_ids = sorted(
+                set(
+                    ProductionBatch.objects.exclude(hub_id=None)
+                    .order_by().values_list('hub_id', flat=True).distinct()
+                ),
+                key=str,
+            )
+        for hub_id in hub_ids:
+            result = backflush_batches(hub_id)
+            self.stdout.write(f'{hub_id}: {result.batches} batches, {result.ingredients} ingredients')
+        self.stdout.write(self.style.SUCCESS('Backflush done.'))
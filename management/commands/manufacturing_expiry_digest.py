@@ -0,0 +1,48 @@
+"""Print the daily digest of batches about to expire."""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from manufacturing.models import ManufacturingSettings
+from manufacturing.services.expiry import DEFAULT_DAYS, digest_batches, expiry_window, watched_hubs
+
+
+class Command(BaseCommand):
+    help = (
+        'List, per hub and in expiry date order, the live batches expiring within the hub expiry warning '
+        '(or --days) from today (or --date). Meant to run once a day, e.g. from cron with its output mailed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to scan (repeatable). Defaults to every hub with batches.')
+        parser.add_argument('--days', type=int, help='Days ahead to watch. Defaults to each hub\'s expiry warning setting.')
+        parser.add_argument('--date', help='First day of the window (YYYY-MM-DD). Defaults to today.')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid --date {options['date']!r}, expected YYYY-MM-DD.")
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days cannot be negative.')
+        hub_ids = options['hubs'] or watched_hubs()
+        warning_days = {
+            str(pk): days
+            for pk, days in ManufacturingSettings.objects.filter(pk__in=hub_ids).values_list('pk', 'expiry_warning_days')
+        }
+        total = 0
+        for hub_id in hub_ids:
+            days = options['days'] if options['days'] is not None else warning_days.get(str(hub_id), DEFAULT_DAYS)
+            start, end = expiry_window(days, today)
+            lines = [
+                f'  {expiry_date}  {batch_number}  {quality_status}  {quantity}  {order_number or "-"}'
+                for expiry_date, batch_number, quality_status, quantity, order_number
+                in digest_batches(hub_id, start, end)
+            ]
+            total += len(lines)
+            if lines:
+                self.stdout.write(f'{hub_id}: {len(lines)} batches expiring from {start} to {end}')
+                self.stdout.write('\n'.join(lines))
+        self.stdout.write(self.style.SUCCESS(f'Expiry digest done: {total} batches.'))
@@ -0,0 +1,30 @@
+"""Import BOM lines for one hub from a CSV or XLSX file."""
+from django.core.management.base import BaseCommand, CommandError
+
+from manufacturing.services.bom_import import IMPORT_CHUNK_SIZE, BOMImportError, import_bom_lines, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import BOM lines (bom_code, description, quantity, unit[, component_code]) from a CSV or XLSX file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file to import.')
+        parser.add_argument('--hub', required=True, help='Hub id the lines belong to.')
+        parser.add_argument('--partial', action='store_true', help='Keep the valid rows when some rows have errors.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows inserted per bulk_create.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_bom_lines(
+                    options['hub'], read_rows(fileobj, options['path']),
+                    strict=not options['partial'], chunk_size=max(options['chunk_size'], 1),
+                )
+        except (OSError, BOMImportError) as exc:
+            raise CommandError(str(exc))
+
+        for error in result.errors:
+            self.stderr.write(f'Row {error.row}: {error.message}')
+        if result.rolled_back:
+            raise CommandError(f'{len(result.errors)} of {result.rows} rows have errors; nothing was imported.')
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} of {result.rows} rows.'))
@@ -0,0 +1,18 @@
+"""Delete old background export jobs and their files."""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from manufacturing.services.export_jobs import purge_exports
+
+
+class Command(BaseCommand):
+    help = 'Delete background export jobs (and the files they wrote) older than --days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Keep the jobs of the last N days (default 7).')
+
+    def handle(self, *args, **options):
+        purged = purge_exports(timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'{purged} export jobs purged.'))
@@ -0,0 +1,18 @@
+"""Re-read every row into the manufacturing search index."""
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from manufacturing.services.search import install_search_indexes, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Create missing search index objects and rebuild the SQLite FTS tables (run after VACUUM).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias to rebuild.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        install_search_indexes(connection)
+        rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,30 @@
+"""Recompute the per-hub dashboard counters from the live tables."""
+from django.core.management.base import BaseCommand
+
+from manufacturing.models import ManufacturingCounters
+from manufacturing.services.counters import TOTAL_FIELDS, reconcile_hubs
+
+
+class Command(BaseCommand):
+    help = 'Recompute manufacturing dashboard counters, a chunk of hubs at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to reconcile (repeatable). Defaults to every hub.')
+        parser.add_argument('--chunk-size', type=int, default=200, help='Hubs recomputed per batch of grouped queries.')
+
+    def handle(self, *args, **options):
+        hub_ids = options['hubs']
+        if not hub_ids:
+            hub_ids = set(ManufacturingCounters.objects.values_list('hub_id', flat=True))
+            for model in TOTAL_FIELDS:
+                hub_ids.update(
+                    model.all_objects.exclude(hub_id=None).order_by().values_list('hub_id', flat=True).distinct()
+                )
+            hub_ids = sorted(hub_ids, key=str)
+
+        chunk_size = max(options['chunk_size'], 1)
+        for start in range(0, len(hub_ids), chunk_size):
+            chunk = hub_ids[start:start + chunk_size]
+            reconcile_hubs(chunk)
+            self.stdout.write(f'Reconciled {start + len(chunk)}/{len(hub_ids)} hubs')
+        self.stdout.write(self.style.SUCCESS('Counters reconciled.'))
@@ -0,0 +1,30 @@
+"""Recompute the rolled-up unit cost of bills of materials."""
+from django.core.management.base import BaseCommand
+
+from manufacturing.models import BillOfMaterials
+from manufacturing.services.costing import recost_boms
+
+
+class Command(BaseCommand):
+    help = 'Recompute stale BOM unit costs of every hub (or --hub); --all recosts the whole catalog, e.g. after a price update.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to recost (repeatable). Defaults to every hub with BOMs.')
+        parser.add_argument('--all', action='store_true', dest='full', help='Recompute every BOM, not only the stale ones.')
+
+    def handle(self, *args, **options):
+        hub_ids = options['hubs']
+        if not hub_ids:
+            hub_ids = sorted(
+                set(
+                    BillOfMaterials.objects.exclude(hub_id=None)
+                    .order_by().values_list('hub_id', flat=True).distinct()
+                ),
+                key=str,
+            )
+        for hub_id in hub_ids:
+            result = recost_boms(hub_id, full=options['full'])
+            self.stdout.write(f'{hub_id}: {len(result)} recosted, {len(result.errors)} left stale')
+            for bom_id, message in sorted(result.errors.items(), key=lambda item: str(item[0])):
+                self.stderr.write(f'  {bom_id}: {message}')
+        self.stdout.write(self.style.SUCCESS('Recosting done.'))
@@ -0,0 +1,30 @@
+"""Schedule confirmed production orders against daily capacity."""
+from django.core.management.base import BaseCommand
+
+from manufacturing.models import ProductionOrder
+from manufacturing.services.scheduler import schedule_hub
+
+
+class Command(BaseCommand):
+    help = 'Reschedule confirmed production orders of every hub (or --hub) and save their start/end dates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hub', action='append', dest='hubs', help='Hub id to schedule (repeatable). Defaults to every hub with open orders.')
+
+    def handle(self, *args, **options):
+        hub_ids = options['hubs']
+        if not hub_ids:
+            hub_ids = sorted(
+                set(
+                    ProductionOrder.objects.filter(status='confirmed').exclude(hub_id=None)
+                    .order_by().values_list('hub_id', flat=True).distinct()
+                ),
+                key=str,
+            )
+        for hub_id in hub_ids:
+            result = schedule_hub(hub_id)
+            self.stdout.write(
+                f'{hub_id}: {len(result)} scheduled, {result.changed} changed, '
+                f'{len(result.late)} late, {len(result.unscheduled)} without capacity'
+            )
+        self.stdout.write(self.style.SUCCESS('Scheduling done.'))
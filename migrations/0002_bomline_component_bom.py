@@ -0,0 +1,17 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bomline',
+            name='component_bom',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='used_in_lines', to='manufacturing.billofmaterials', verbose_name='Sub-assembly'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0002_bomline_component_bom'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'code'], name='mfg_bom_hub_code_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'name'], name='mfg_bom_hub_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'is_active'], name='mfg_bom_hub_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'output_quantity'], name='mfg_bom_hub_outqty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'created_at'], name='mfg_bom_hub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bomline',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'bom'], name='mfg_bomline_hub_bom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bomline',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'quantity'], name='mfg_bomline_hub_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bomline',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'description'], name='mfg_bomline_hub_desc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bomline',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'unit'], name='mfg_bomline_hub_unit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bomline',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'created_at'], name='mfg_bomline_hub_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'order_number'], name='mfg_po_hub_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'bom'], name='mfg_po_hub_bom_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'status'], name='mfg_po_hub_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'quantity'], name='mfg_po_hub_qty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'start_date'], name='mfg_po_hub_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'end_date'], name='mfg_po_hub_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'created_at'], name='mfg_po_hub_created_idx'),
+        ),
+    ]
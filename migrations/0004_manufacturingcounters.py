@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0003_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManufacturingCounters',
+            fields=[
+                ('hub_id', models.UUIDField(primary_key=True, serialize=False, verbose_name='Hub')),
+                ('bill_of_materialses', models.BigIntegerField(default=0)),
+                ('bom_lines', models.BigIntegerField(default=0)),
+                ('production_orders', models.BigIntegerField(default=0)),
+                ('orders_draft', models.BigIntegerField(default=0)),
+                ('orders_confirmed', models.BigIntegerField(default=0)),
+                ('orders_in_progress', models.BigIntegerField(default=0)),
+                ('orders_done', models.BigIntegerField(default=0)),
+                ('orders_cancelled', models.BigIntegerField(default=0)),
+                ('batches', models.BigIntegerField(default=0)),
+                ('batches_pending', models.BigIntegerField(default=0)),
+                ('batches_approved', models.BigIntegerField(default=0)),
+                ('batches_rejected', models.BigIntegerField(default=0)),
+                ('batches_quarantine', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'manufacturing_counters',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from manufacturing.services.search import install_search_indexes, remove_search_indexes
+
+
+def install(apps, schema_editor):
+    install_search_indexes(schema_editor.connection)
+
+
+def remove(apps, schema_editor):
+    remove_search_indexes(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0004_manufacturingcounters'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, remove),
+    ]
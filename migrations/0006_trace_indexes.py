@@ -0,0 +1,25 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0005_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchingredient',
+            name='source_batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consumed_in', to='manufacturing.productionbatch', verbose_name='Source Batch'),
+        ),
+        migrations.AddIndex(
+            model_name='productionbatch',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'batch_number'], name='mfg_batch_hub_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchingredient',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'supplier_lot'], name='mfg_ingr_hub_lot_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def copy_due_dates(apps, schema_editor):
+    # Hand-typed end dates were the de facto due dates until now.
+    ProductionOrder = apps.get_model('manufacturing', 'ProductionOrder')
+    ProductionOrder.objects.filter(due_date__isnull=True).update(due_date=models.F('end_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0006_trace_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billofmaterials',
+            name='daily_capacity',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Output units per day on a dedicated line. Empty to share the hub capacity.', max_digits=10, null=True, verbose_name='Daily Capacity'),
+        ),
+        migrations.AddField(
+            model_name='productionorder',
+            name='due_date',
+            field=models.DateField(blank=True, null=True, verbose_name='Due Date'),
+        ),
+        migrations.RunPython(copy_due_dates, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ManufacturingSettings',
+            fields=[
+                ('hub_id', models.UUIDField(primary_key=True, serialize=False, verbose_name='Hub')),
+                ('daily_capacity', models.DecimalField(blank=True, decimal_places=2, help_text='Output units per day shared by BOMs without their own capacity.', max_digits=10, null=True, verbose_name='Daily Capacity')),
+                ('work_on_weekends', models.BooleanField(default=False, verbose_name='Work on Weekends')),
+                ('auto_schedule', models.BooleanField(default=False, help_text='Reschedule confirmed orders whenever an order is added or changed.', verbose_name='Reschedule Automatically')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'manufacturing_settings',
+            },
+        ),
+    ]
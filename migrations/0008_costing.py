@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0007_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billofmaterials',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True, verbose_name='Unit Cost'),
+        ),
+        migrations.AddField(
+            model_name='bomline',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=4, default='0', help_text='Cost per unit of a purchased component. Sub-assembly lines use the rolled-up cost of their BOM.', max_digits=12, verbose_name='Unit Cost'),
+        ),
+    ]
@@ -0,0 +1,112 @@
+import uuid
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Case, CharField, DecimalField, F, Value, When
+from django.db.models.functions import Lower, Trim
+
+# Built-in units as of this migration (code -> dimension base unit, factor).
+# Kept here rather than imported from services/units.py so later changes to
+# that table do not rewrite what this migration did.
+BUILTIN_UNITS = {
+    code: (base_unit, Decimal(factor))
+    for base_unit, table in (
+        ('kg', {
+            ('kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms'): '1',
+            ('g', 'gr', 'grs', 'gram', 'grams', 'gramme', 'grammes'): '0.001',
+            ('mg', 'milligram', 'milligrams'): '0.000001',
+            ('t', 'tonne', 'tonnes', 'ton', 'tons'): '1000',
+            ('lb', 'lbs', 'pound', 'pounds'): '0.45359237',
+            ('oz', 'ounce', 'ounces'): '0.028349523125',
+        }),
+        ('l', {
+            ('l', 'lt', 'ltr', 'liter', 'liters', 'litre', 'litres'): '1',
+            ('dl', 'deciliter', 'decilitre'): '0.1',
+            ('cl', 'centiliter', 'centilitre'): '0.01',
+            ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'): '0.001',
+            ('m3', 'cubic meter', 'cubic metre'): '1000',
+            ('gal', 'gallon', 'gallons'): '3.785411784',
+        }),
+        ('m', {
+            ('m', 'meter', 'meters', 'metre', 'metres'): '1',
+            ('cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'): '0.01',
+            ('mm', 'millimeter', 'millimeters', 'millimetre', 'millimetres'): '0.001',
+            ('km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'): '1000',
+        }),
+        ('u', {
+            ('u', 'un', 'unit', 'units', 'pc', 'pcs', 'piece', 'pieces', 'ea', 'each'): '1',
+            ('dozen', 'doz'): '12',
+        }),
+    )
+    for codes, factor in table.items()
+    for code in codes
+}
+
+
+def _backfill(model, quantity_field):
+    quantity = F(quantity_field)
+    quantities = [When(unit__iexact=code, then=quantity * Value(factor)) for code, (_, factor) in BUILTIN_UNITS.items()]
+    base_units = [When(unit__iexact=code, then=Value(base_unit)) for code, (base_unit, _) in BUILTIN_UNITS.items()]
+    model._base_manager.update(
+        base_quantity=Case(*quantities, default=quantity, output_field=DecimalField(max_digits=18, decimal_places=6)),
+        base_unit=Case(*base_units, default=Lower(Trim('unit')), output_field=CharField()),
+    )
+
+
+def normalize_quantities(apps, schema_editor):
+    _backfill(apps.get_model('manufacturing', 'BOMLine'), 'quantity')
+    _backfill(apps.get_model('manufacturing', 'BatchIngredient'), 'quantity_used')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0008_costing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnitOfMeasure',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('hub_id', models.UUIDField(blank=True, db_index=True, editable=False, help_text='Hub this record belongs to (for multi-tenancy)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.UUIDField(blank=True, help_text='UUID of the user who created this record', null=True)),
+                ('updated_by', models.UUIDField(blank=True, help_text='UUID of the user who last updated this record', null=True)),
+                ('is_deleted', models.BooleanField(db_index=True, default=False, help_text='Soft delete flag - record is hidden but not removed')),
+                ('deleted_at', models.DateTimeField(blank=True, help_text='Timestamp when record was soft deleted', null=True)),
+                ('code', models.CharField(max_length=20, verbose_name='Code')),
+                ('name', models.CharField(blank=True, max_length=100, verbose_name='Name')),
+                ('dimension', models.CharField(choices=[('mass', 'Mass'), ('volume', 'Volume'), ('length', 'Length'), ('count', 'Count')], max_length=10, verbose_name='Dimension')),
+                ('factor', models.DecimalField(decimal_places=9, help_text='Base units (kg, l, m or units) in one of this unit.', max_digits=18, verbose_name='Factor')),
+            ],
+            options={
+                'db_table': 'manufacturing_unitofmeasure',
+                'ordering': ['code'],
+                'abstract': False,
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('hub_id', 'code'), name='mfg_uom_hub_code_uniq')],
+            },
+        ),
+        migrations.AddField(
+            model_name='bomline',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, default='0', editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='bomline',
+            name='base_unit',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='batchingredient',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, default='0', editable=False, max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='batchingredient',
+            name='base_unit',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.RunPython(normalize_quantities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+import uuid
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0009_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('hub_id', models.UUIDField(blank=True, db_index=True, editable=False, help_text='Hub this record belongs to (for multi-tenancy)', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.UUIDField(blank=True, help_text='UUID of the user who created this record', null=True)),
+                ('updated_by', models.UUIDField(blank=True, help_text='UUID of the user who last updated this record', null=True)),
+                ('is_deleted', models.BooleanField(db_index=True, default=False, help_text='Soft delete flag - record is hidden but not removed')),
+                ('deleted_at', models.DateTimeField(blank=True, help_text='Timestamp when record was soft deleted', null=True)),
+                ('kind', models.CharField(max_length=50, verbose_name='Export')),
+                ('file_format', models.CharField(choices=[('csv', 'CSV'), ('xlsx', 'Excel')], max_length=10, verbose_name='Format')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('rows_total', models.PositiveIntegerField(default=0, verbose_name='Rows')),
+                ('rows_done', models.PositiveIntegerField(default=0, verbose_name='Rows Written')),
+                ('file_name', models.CharField(blank=True, max_length=255, verbose_name='File')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+            ],
+            options={
+                'db_table': 'manufacturing_exportjob',
+                'ordering': ['-created_at'],
+                'abstract': False,
+            },
+        ),
+    ]
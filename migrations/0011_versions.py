@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0010_export_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ManufacturingVersions',
+            fields=[
+                ('hub_id', models.UUIDField(primary_key=True, serialize=False, verbose_name='Hub')),
+                ('bill_of_materialses', models.BigIntegerField(default=0)),
+                ('bom_lines', models.BigIntegerField(default=0)),
+                ('production_orders', models.BigIntegerField(default=0)),
+                ('batches', models.BigIntegerField(default=0)),
+                ('batch_ingredients', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'manufacturing_versions',
+            },
+        ),
+    ]
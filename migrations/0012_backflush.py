@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0011_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='auto_backflush',
+            field=models.BooleanField(default=True, help_text="Fill in a new batch's ingredients from its BOM, scaled to the quantity produced.", verbose_name='Backflush Ingredients'),
+        ),
+    ]
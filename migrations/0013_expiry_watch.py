@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0012_backflush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='expiry_warning_days',
+            field=models.PositiveSmallIntegerField(default=7, help_text='Batches expiring within this many days are shown on the dashboard and in the daily digest.', verbose_name='Expiry Warning (days)'),
+        ),
+        migrations.AddIndex(
+            model_name='productionbatch',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'expiry_date'], name='mfg_batch_hub_expiry_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productionorder',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'expiry_date'], name='mfg_po_hub_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+
+def number_live_rows(apps, schema_editor):
+    from manufacturing.services.numbering import backfill
+
+    settings = apps.get_model('manufacturing', 'ManufacturingSettings')
+    sequences = apps.get_model('manufacturing', 'NumberSequence')
+    backfill(apps.get_model('manufacturing', 'ProductionOrder'), 'order_number', 'order', settings, sequences)
+    backfill(apps.get_model('manufacturing', 'ProductionBatch'), 'batch_number', 'batch', settings, sequences)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0013_expiry_watch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hub_id', models.UUIDField(verbose_name='Hub')),
+                ('key', models.CharField(max_length=100)),
+                ('last_value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'manufacturing_number_sequence',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='numbersequence',
+            constraint=models.UniqueConstraint(fields=('hub_id', 'key'), name='mfg_numseq_hub_key_uniq'),
+        ),
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='order_number_pattern',
+            field=models.CharField(default='PO-{YYYY}-{seq:06}', help_text='Numbers of new orders, e.g. PO-{YYYY}-{seq:06}. Each prefix has its own sequence.', max_length=50, verbose_name='Order Number Pattern'),
+        ),
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='batch_number_pattern',
+            field=models.CharField(default='LOT-{YYYY}-{seq:06}', help_text='Numbers of new batches, e.g. LOT-{YYYY}-{seq:06}. Each prefix has its own sequence.', max_length=50, verbose_name='Batch Number Pattern'),
+        ),
+        migrations.AlterField(
+            model_name='productionorder',
+            name='order_number',
+            field=models.CharField(blank=True, help_text='Leave blank to number the order automatically.', max_length=50, verbose_name='Order Number'),
+        ),
+        migrations.AlterField(
+            model_name='productionbatch',
+            name='batch_number',
+            field=models.CharField(blank=True, help_text='Leave blank to number the batch automatically.', max_length=50, verbose_name='Batch Number'),
+        ),
+        migrations.RunPython(number_live_rows, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='productionorder',
+            name='mfg_po_hub_number_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productionbatch',
+            name='mfg_batch_hub_number_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='productionorder',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('hub_id', 'order_number'), name='mfg_po_hub_number_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='productionbatch',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('hub_id', 'batch_number'), name='mfg_batch_hub_number_uniq'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0014_numbering'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hub_id', models.UUIDField(blank=True, null=True, verbose_name='Hub')),
+                ('model', models.CharField(max_length=50, verbose_name='Model')),
+                ('record_id', models.UUIDField(verbose_name='Record')),
+                ('lot', models.CharField(blank=True, max_length=100, verbose_name='Lot / Number')),
+                ('parent_id', models.UUIDField(blank=True, null=True)),
+                ('source_id', models.UUIDField(blank=True, null=True)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Data')),
+                ('archived_at', models.DateTimeField(verbose_name='Archived At')),
+            ],
+            options={
+                'db_table': 'manufacturing_archive',
+                'indexes': [
+                    models.Index(fields=['hub_id', 'model', 'lot'], name='mfg_archive_hub_lot_idx'),
+                    models.Index(fields=['hub_id', 'model', 'parent_id'], name='mfg_archive_hub_parent_idx'),
+                    models.Index(fields=['hub_id', 'model', 'source_id'], name='mfg_archive_hub_source_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('model', 'record_id'), name='mfg_archive_record_uniq'),
+                ],
+            },
+        ),
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='archive_deleted_days',
+            field=models.PositiveIntegerField(default=90, help_text='Deleted records are moved to the archive this many days after deletion; 0 keeps them.', verbose_name='Archive Deleted Records After (days)'),
+        ),
+        migrations.AddField(
+            model_name='manufacturingsettings',
+            name='archive_closed_days',
+            field=models.PositiveIntegerField(default=365, help_text='Done and cancelled orders unchanged for this many days are archived with their batches; 0 keeps them.', verbose_name='Archive Closed Orders After (days)'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0015_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billofmaterials',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['hub_id', 'unit_cost'], name='mfg_bom_hub_cost_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0016_bom_cost_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bomline',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, default='0', editable=False, max_digits=24),
+        ),
+        migrations.AlterField(
+            model_name='batchingredient',
+            name='base_quantity',
+            field=models.DecimalField(decimal_places=6, default='0', editable=False, max_digits=24),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
 from apps.core.models.base import HubBaseModel
@@ -11,15 +13,73 @@ PROD_STATUS = [
     ('cancelled', _('Cancelled')),
 ]
 
+UNIT_DIMENSIONS = [
+    ('mass', _('Mass')),
+    ('volume', _('Volume')),
+    ('length', _('Length')),
+    ('count', _('Count')),
+]
+
+EXPORT_STATUS = [
+    ('pending', _('Pending')),
+    ('running', _('Running')),
+    ('done', _('Done')),
+    ('failed', _('Failed')),
+]
+
+EXPORT_FORMATS = [
+    ('csv', 'CSV'),
+    ('xlsx', 'Excel'),
+]
+
+# Default number patterns of new orders and batches (services/numbering.py).
+ORDER_NUMBER_PATTERN = 'PO-{YYYY}-{seq:06}'
+BATCH_NUMBER_PATTERN = 'LOT-{YYYY}-{seq:06}'
+
+# Quantities of each dimension are summed in this unit (services/units.py).
+BASE_UNITS = {'mass': 'kg', 'volume': 'l', 'length': 'm', 'count': 'u'}
+
+QUALITY_STATUS = [
+    ('pending', _('Pending QC')),
+    ('approved', _('Approved')),
+    ('rejected', _('Rejected')),
+    ('quarantine', _('Quarantine')),
+]
+
+# Hub-scoped list views always filter on hub_id + is_deleted=False and sort
+# by one column, so their indexes are partial on live rows (a plain
+# composite index where the backend has no partial indexes). Free-text
+# notes columns are sortable but deliberately left unindexed.
+LIVE = Q(is_deleted=False)
+
 class BillOfMaterials(HubBaseModel):
     name = models.CharField(max_length=255, verbose_name=_('Name'))
     code = models.CharField(max_length=50, blank=True, verbose_name=_('Code'))
     output_quantity = models.DecimalField(max_digits=10, decimal_places=2, default='1', verbose_name=_('Output Quantity'))
     notes = models.TextField(blank=True, verbose_name=_('Notes'))
     is_active = models.BooleanField(default=True, verbose_name=_('Is Active'))
+    daily_capacity = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        verbose_name=_('Daily Capacity'),
+        help_text=_('Output units per day on a dedicated line. Empty to share the hub capacity.'),
+    )
+    # Rolled-up cost per output unit, maintained by services/costing.py.
+    # NULL means stale: it is recomputed on the next costing pass.
+    unit_cost = models.DecimalField(
+        max_digits=14, decimal_places=4, null=True, blank=True, editable=False,
+        verbose_name=_('Unit Cost'),
+    )
 
     class Meta(HubBaseModel.Meta):
         db_table = 'manufacturing_billofmaterials'
+        indexes = [
+            models.Index(fields=['hub_id', 'code'], name='mfg_bom_hub_code_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'name'], name='mfg_bom_hub_name_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'is_active'], name='mfg_bom_hub_active_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'output_quantity'], name='mfg_bom_hub_outqty_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'created_at'], name='mfg_bom_hub_created_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'unit_cost'], name='mfg_bom_hub_cost_idx', condition=LIVE),
+        ]
 
     def __str__(self):
         return self.name
@@ -27,19 +87,45 @@ class BillOfMaterials(HubBaseModel):
 
 class BOMLine(HubBaseModel):
     bom = models.ForeignKey('BillOfMaterials', on_delete=models.CASCADE, related_name='lines')
+    component_bom = models.ForeignKey(
+        'BillOfMaterials', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='used_in_lines',
+        verbose_name=_('Sub-assembly'),
+    )
     description = models.CharField(max_length=255, verbose_name=_('Description'))
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default='1', verbose_name=_('Quantity'))
     unit = models.CharField(max_length=20, blank=True, verbose_name=_('Unit'))
+    unit_cost = models.DecimalField(
+        max_digits=12, decimal_places=4, default='0',
+        verbose_name=_('Unit Cost'),
+        help_text=_('Cost per unit of a purchased component. Sub-assembly lines use the rolled-up cost of their BOM.'),
+    )
+    # ``quantity`` converted to the base unit of its dimension (kg, l, m, u),
+    # maintained by services/units.py so aggregates are a plain SUM. Room for
+    # the largest quantity (8 integer digits) times the largest unit factor
+    # (9 integer digits, see UnitOfMeasure.factor).
+    base_quantity = models.DecimalField(max_digits=24, decimal_places=6, default='0', editable=False)
+    base_unit = models.CharField(max_length=20, blank=True, editable=False)
 
     class Meta(HubBaseModel.Meta):
         db_table = 'manufacturing_bomline'
+        indexes = [
+            models.Index(fields=['hub_id', 'bom'], name='mfg_bomline_hub_bom_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'quantity'], name='mfg_bomline_hub_qty_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'description'], name='mfg_bomline_hub_desc_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'unit'], name='mfg_bomline_hub_unit_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'created_at'], name='mfg_bomline_hub_created_idx', condition=LIVE),
+        ]
 
     def __str__(self):
         return str(self.id)
 
 
 class ProductionOrder(HubBaseModel):
-    order_number = models.CharField(max_length=50, verbose_name=_('Order Number'))
+    order_number = models.CharField(
+        max_length=50, blank=True, verbose_name=_('Order Number'),
+        help_text=_('Leave blank to number the order automatically.'),
+    )
     bom = models.ForeignKey('BillOfMaterials', on_delete=models.SET_NULL, null=True)
     quantity = models.DecimalField(max_digits=10, decimal_places=2, default='1', verbose_name=_('Quantity'))
     batch_number = models.CharField(max_length=50, blank=True, verbose_name=_('Batch/Lot Number'))
@@ -47,10 +133,24 @@ class ProductionOrder(HubBaseModel):
     status = models.CharField(max_length=20, default='draft', choices=PROD_STATUS, verbose_name=_('Status'))
     start_date = models.DateField(null=True, blank=True, verbose_name=_('Start Date'))
     end_date = models.DateField(null=True, blank=True, verbose_name=_('End Date'))
+    due_date = models.DateField(null=True, blank=True, verbose_name=_('Due Date'))
     notes = models.TextField(blank=True, verbose_name=_('Notes'))
 
     class Meta(HubBaseModel.Meta):
         db_table = 'manufacturing_productionorder'
+        indexes = [
+            models.Index(fields=['hub_id', 'bom'], name='mfg_po_hub_bom_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'status'], name='mfg_po_hub_status_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'quantity'], name='mfg_po_hub_qty_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'start_date'], name='mfg_po_hub_start_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'end_date'], name='mfg_po_hub_end_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'expiry_date'], name='mfg_po_hub_expiry_idx', condition=LIVE),
+            models.Index(fields=['hub_id', 'created_at'], name='mfg_po_hub_created_idx', condition=LIVE),
+        ]
+        # Live numbers are unique per hub; the index also serves the number sort.
+        constraints = [
+            models.UniqueConstraint(fields=['hub_id', 'order_number'], condition=LIVE, name='mfg_po_hub_number_uniq'),
+        ]
 
     def __str__(self):
         return str(self.id)
@@ -58,7 +158,10 @@ class ProductionOrder(HubBaseModel):
 
 class ProductionBatch(HubBaseModel):
     """A production batch/lot for traceability."""
-    batch_number = models.CharField(max_length=50, verbose_name=_('Batch Number'))
+    batch_number = models.CharField(
+        max_length=50, blank=True, verbose_name=_('Batch Number'),
+        help_text=_('Leave blank to number the batch automatically.'),
+    )
     production_order = models.ForeignKey(
         'ProductionOrder', on_delete=models.SET_NULL,
         null=True, blank=True, related_name='batches',
@@ -75,13 +178,7 @@ class ProductionBatch(HubBaseModel):
     production_date = models.DateField(null=True, blank=True, verbose_name=_('Production Date'))
     expiry_date = models.DateField(null=True, blank=True, verbose_name=_('Expiry Date'))
     quality_status = models.CharField(
-        max_length=20, default='pending',
-        choices=[
-            ('pending', _('Pending QC')),
-            ('approved', _('Approved')),
-            ('rejected', _('Rejected')),
-            ('quarantine', _('Quarantine')),
-        ],
+        max_length=20, default='pending', choices=QUALITY_STATUS,
         verbose_name=_('Quality Status'),
     )
     notes = models.TextField(blank=True, verbose_name=_('Notes'))
@@ -89,6 +186,13 @@ class ProductionBatch(HubBaseModel):
     class Meta(HubBaseModel.Meta):
         db_table = 'manufacturing_batch'
         ordering = ['-production_date', '-created_at']
+        indexes = [
+            # Expiry watch: range scans over the days ahead (services/expiry.py).
+            models.Index(fields=['hub_id', 'expiry_date'], name='mfg_batch_hub_expiry_idx', condition=LIVE),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['hub_id', 'batch_number'], condition=LIVE, name='mfg_batch_hub_number_uniq'),
+        ]
 
     def __str__(self):
         return self.batch_number
@@ -102,14 +206,246 @@ class BatchIngredient(HubBaseModel):
     )
     description = models.CharField(max_length=255, verbose_name=_('Ingredient'))
     supplier_lot = models.CharField(max_length=100, blank=True, verbose_name=_('Supplier Lot Number'))
+    source_batch = models.ForeignKey(
+        'ProductionBatch', on_delete=models.SET_NULL,
+        null=True, blank=True, related_name='consumed_in',
+        verbose_name=_('Source Batch'),
+    )
     quantity_used = models.DecimalField(
         max_digits=10, decimal_places=2, default='0',
         verbose_name=_('Quantity Used'),
     )
     unit = models.CharField(max_length=20, blank=True, verbose_name=_('Unit'))
+    # ``quantity_used`` in base units, see BOMLine.base_quantity.
+    base_quantity = models.DecimalField(max_digits=24, decimal_places=6, default='0', editable=False)
+    base_unit = models.CharField(max_length=20, blank=True, editable=False)
 
     class Meta(HubBaseModel.Meta):
         db_table = 'manufacturing_batchingredient'
+        indexes = [
+            models.Index(fields=['hub_id', 'supplier_lot'], name='mfg_ingr_hub_lot_idx', condition=LIVE),
+        ]
 
     def __str__(self):
         return f'{self.description} ({self.supplier_lot})'
+
+
+class UnitOfMeasure(HubBaseModel):
+    """A hub-specific unit, on top of the built-in ones in services/units.py."""
+    code = models.CharField(max_length=20, verbose_name=_('Code'))
+    name = models.CharField(max_length=100, blank=True, verbose_name=_('Name'))
+    dimension = models.CharField(max_length=10, choices=UNIT_DIMENSIONS, verbose_name=_('Dimension'))
+    factor = models.DecimalField(
+        max_digits=18, decimal_places=9,
+        verbose_name=_('Factor'),
+        help_text=_('Base units (kg, l, m or units) in one of this unit.'),
+    )
+
+    class Meta(HubBaseModel.Meta):
+        db_table = 'manufacturing_unitofmeasure'
+        ordering = ['code']
+        constraints = [
+            models.UniqueConstraint(fields=['hub_id', 'code'], condition=LIVE, name='mfg_uom_hub_code_uniq'),
+        ]
+
+    def __str__(self):
+        return self.code
+
+    @property
+    def base_unit(self):
+        return BASE_UNITS.get(self.dimension, '')
+
+
+class ExportJob(HubBaseModel):
+    """A list export written to file in the background, see services/export_jobs.py."""
+    kind = models.CharField(max_length=50, verbose_name=_('Export'))
+    file_format = models.CharField(max_length=10, choices=EXPORT_FORMATS, verbose_name=_('Format'))
+    params = models.JSONField(default=dict, blank=True, verbose_name=_('Parameters'))
+    status = models.CharField(max_length=20, choices=EXPORT_STATUS, default='pending', verbose_name=_('Status'))
+    rows_total = models.PositiveIntegerField(default=0, verbose_name=_('Rows'))
+    rows_done = models.PositiveIntegerField(default=0, verbose_name=_('Rows Written'))
+    file_name = models.CharField(max_length=255, blank=True, verbose_name=_('File'))
+    error = models.TextField(blank=True, verbose_name=_('Error'))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Started At'))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_('Finished At'))
+
+    class Meta(HubBaseModel.Meta):
+        db_table = 'manufacturing_exportjob'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.kind}.{self.file_format} ({self.status})'
+
+    @property
+    def progress(self):
+        """Percentage of rows written."""
+        if self.status == 'done':
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(100, self.rows_done * 100 // self.rows_total)
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+
+class ManufacturingCounters(models.Model):
+    """
+    Live (not soft-deleted) row counts per hub, kept up to date incrementally
+    so the dashboard is a single primary-key lookup. See services/counters.py.
+    """
+    hub_id = models.UUIDField(primary_key=True, verbose_name=_('Hub'))
+    bill_of_materialses = models.BigIntegerField(default=0)
+    bom_lines = models.BigIntegerField(default=0)
+    production_orders = models.BigIntegerField(default=0)
+    orders_draft = models.BigIntegerField(default=0)
+    orders_confirmed = models.BigIntegerField(default=0)
+    orders_in_progress = models.BigIntegerField(default=0)
+    orders_done = models.BigIntegerField(default=0)
+    orders_cancelled = models.BigIntegerField(default=0)
+    batches = models.BigIntegerField(default=0)
+    batches_pending = models.BigIntegerField(default=0)
+    batches_approved = models.BigIntegerField(default=0)
+    batches_rejected = models.BigIntegerField(default=0)
+    batches_quarantine = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'manufacturing_counters'
+
+    def __str__(self):
+        return str(self.hub_id)
+
+    def orders_by_status(self):
+        return [(label, getattr(self, f'orders_{status}')) for status, label in PROD_STATUS]
+
+    def batches_by_quality(self):
+        return [(label, getattr(self, f'batches_{status}')) for status, label in QUALITY_STATUS]
+
+
+class ManufacturingVersions(models.Model):
+    """
+    Per-hub change version of each model, bumped on every write (single
+    saves through signals, bulk paths explicitly). List partials derive
+    their ETag from it. See services/versions.py.
+    """
+    hub_id = models.UUIDField(primary_key=True, verbose_name=_('Hub'))
+    bill_of_materialses = models.BigIntegerField(default=0)
+    bom_lines = models.BigIntegerField(default=0)
+    production_orders = models.BigIntegerField(default=0)
+    batches = models.BigIntegerField(default=0)
+    batch_ingredients = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'manufacturing_versions'
+
+    def __str__(self):
+        return str(self.hub_id)
+
+
+class NumberSequence(models.Model):
+    """
+    Last number handed out per hub and sequence key (number kind plus the
+    rendered pattern prefix, e.g. ``order:PO-2026-{seq}``), advanced
+    atomically by services/numbering.py.
+    """
+    hub_id = models.UUIDField(verbose_name=_('Hub'))
+    key = models.CharField(max_length=100)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'manufacturing_number_sequence'
+        constraints = [
+            models.UniqueConstraint(fields=['hub_id', 'key'], name='mfg_numseq_hub_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.hub_id} {self.key}'
+
+
+class ArchivedRecord(models.Model):
+    """
+    A row moved out of a live table by services/archive.py: its fields as
+    JSON, plus the columns traceability looks archived lots up by.
+    """
+    hub_id = models.UUIDField(null=True, blank=True, verbose_name=_('Hub'))
+    model = models.CharField(max_length=50, verbose_name=_('Model'))
+    record_id = models.UUIDField(verbose_name=_('Record'))
+    # Supplier lot, batch number, order number or BOM code.
+    lot = models.CharField(max_length=100, blank=True, verbose_name=_('Lot / Number'))
+    # Batch of an ingredient, order of a batch, BOM of a line or an order.
+    parent_id = models.UUIDField(null=True, blank=True)
+    # Source batch of an ingredient, sub-assembly BOM of a line.
+    source_id = models.UUIDField(null=True, blank=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name=_('Data'))
+    archived_at = models.DateTimeField(verbose_name=_('Archived At'))
+
+    class Meta:
+        db_table = 'manufacturing_archive'
+        indexes = [
+            models.Index(fields=['hub_id', 'model', 'lot'], name='mfg_archive_hub_lot_idx'),
+            models.Index(fields=['hub_id', 'model', 'parent_id'], name='mfg_archive_hub_parent_idx'),
+            models.Index(fields=['hub_id', 'model', 'source_id'], name='mfg_archive_hub_source_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'record_id'], name='mfg_archive_record_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.model} {self.record_id}'
+
+
+class ManufacturingSettings(models.Model):
+    """Per-hub module configuration, one row per hub."""
+    hub_id = models.UUIDField(primary_key=True, verbose_name=_('Hub'))
+    daily_capacity = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True,
+        verbose_name=_('Daily Capacity'),
+        help_text=_('Output units per day shared by BOMs without their own capacity.'),
+    )
+    work_on_weekends = models.BooleanField(default=False, verbose_name=_('Work on Weekends'))
+    auto_schedule = models.BooleanField(
+        default=False, verbose_name=_('Reschedule Automatically'),
+        help_text=_('Reschedule confirmed orders whenever an order is added or changed.'),
+    )
+    auto_backflush = models.BooleanField(
+        default=True, verbose_name=_('Backflush Ingredients'),
+        help_text=_("Fill in a new batch's ingredients from its BOM, scaled to the quantity produced."),
+    )
+    expiry_warning_days = models.PositiveSmallIntegerField(
+        default=7, verbose_name=_('Expiry Warning (days)'),
+        help_text=_('Batches expiring within this many days are shown on the dashboard and in the daily digest.'),
+    )
+    order_number_pattern = models.CharField(
+        max_length=50, default=ORDER_NUMBER_PATTERN, verbose_name=_('Order Number Pattern'),
+        help_text=_('Numbers of new orders, e.g. PO-{YYYY}-{seq:06}. Each prefix has its own sequence.'),
+    )
+    batch_number_pattern = models.CharField(
+        max_length=50, default=BATCH_NUMBER_PATTERN, verbose_name=_('Batch Number Pattern'),
+        help_text=_('Numbers of new batches, e.g. LOT-{YYYY}-{seq:06}. Each prefix has its own sequence.'),
+    )
+    archive_deleted_days = models.PositiveIntegerField(
+        default=90, verbose_name=_('Archive Deleted Records After (days)'),
+        help_text=_('Deleted records are moved to the archive this many days after deletion; 0 keeps them.'),
+    )
+    archive_closed_days = models.PositiveIntegerField(
+        default=365, verbose_name=_('Archive Closed Orders After (days)'),
+        help_text=_('Done and cancelled orders unchanged for this many days are archived with their batches; 0 keeps them.'),
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'manufacturing_settings'
+
+    def __str__(self):
+        return str(self.hub_id)
+
+    @classmethod
+    def for_hub(cls, hub_id):
+        if not hub_id:
+            return cls()
+        obj, _created = cls.objects.get_or_create(pk=hub_id)
+        return obj
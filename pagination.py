@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination for the datatable lists.
+
+Pages are read with ``WHERE (sort, id) > (last_sort, last_id) ... LIMIT n``
+instead of ``OFFSET``, so every page costs the same no matter how deep it
+is. The total row count is approximate: it is cached for a short while
+instead of running ``COUNT(*)`` on every page turn.
+"""
+import base64
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+from uuid import UUID
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+COUNT_CACHE_TIMEOUT = 60
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, template-compatible with ``Page``."""
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _dump(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return value
+
+
+def encode_cursor(value, pk, direction='next'):
+    payload = json.dumps([_dump(value), _dump(pk), direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, field, pk_field):
+    """Return ``(value, pk, direction)`` or None for an empty or invalid cursor."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('next', 'prev'):
+            return None
+        if value is not None:
+            value = field.to_python(value)
+        return value, pk_field.to_python(pk), direction
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _after(attname, value, pk, nullable):
+    """Rows after (value, pk) in ascending order with NULLs first."""
+    if value is None:
+        return Q(**{f'{attname}__isnull': True, 'pk__gt': pk}) | Q(**{f'{attname}__isnull': False})
+    return Q(**{f'{attname}__gt': value}) | Q(**{attname: value, 'pk__gt': pk})
+
+
+def _before(attname, value, pk, nullable):
+    """Rows before (value, pk) in ascending order with NULLs first."""
+    if value is None:
+        return Q(**{f'{attname}__isnull': True, 'pk__lt': pk})
+    condition = Q(**{f'{attname}__lt': value}) | Q(**{attname: value, 'pk__lt': pk})
+    if nullable:
+        condition |= Q(**{f'{attname}__isnull': True})
+    return condition
+
+
+def cached_count(qs, timeout=COUNT_CACHE_TIMEOUT):
+    """Approximate ``qs.count()``, cached per distinct query for ``timeout`` seconds."""
+    qs = qs.order_by()
+    key = 'manufacturing:count:' + hashlib.md5(str(qs.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = qs.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+def keyset_paginate(qs, sort_field, descending, cursor, per_page):
+    """
+    Return the ``KeysetPage`` of ``qs`` at ``cursor``, ordered by
+    ``sort_field`` with the primary key as tiebreaker.
+
+    Ascending order puts NULLs first and descending order is its exact
+    reverse, so the same cursor works on every backend.
+    """
+    field = qs.model._meta.get_field(sort_field)
+    pk_field = qs.model._meta.pk
+    attname = field.attname
+    position = decode_cursor(cursor, field, pk_field)
+    backwards = position is not None and position[2] == 'prev'
+
+    # Read in ascending order when moving forward through an ascending list
+    # or backward through a descending one. NULL placement is only forced on
+    # nullable columns so NOT NULL sorts keep matching their indexes.
+    ascending = descending == backwards
+    if ascending:
+        ordering = [F(attname).asc(nulls_first=True) if field.null else attname, 'pk']
+    else:
+        ordering = [F(attname).desc(nulls_last=True) if field.null else f'-{attname}', '-pk']
+
+    page_qs = qs.order_by(*ordering)
+    if position is not None:
+        value, pk, _direction = position
+        condition = _after if ascending else _before
+        page_qs = page_qs.filter(condition(attname, value, pk, field.null))
+
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        first, last = rows[0], rows[-1]
+        if has_more or backwards:
+            next_cursor = encode_cursor(getattr(last, attname), last.pk, 'next')
+        if position is not None and (has_more or not backwards):
+            previous_cursor = encode_cursor(getattr(first, attname), first.pk, 'prev')
+
+    return KeysetPage(rows, next_cursor, previous_cursor, cached_count(qs))
@@ -0,0 +1,455 @@
+"""
+Resources of the JSON API and their bulk writes.
+
+Each ``Resource`` exposes one model with a fixed set of fields; relations
+are read and written as ids. ``bulk_create`` and ``bulk_update`` validate
+every record of a request before writing any of them: values are cleaned
+as in batch entry (services/batches.py), the related rows of all records
+are looked up with one query per related model and the order or batch
+numbers given with one more. Nothing is written unless every record is
+valid. The records are then inserted with one ``bulk_create`` (updated
+with one ``bulk_update`` per set of changed fields) in one transaction,
+and what the per-row signals would have maintained is updated once for
+the whole request: counters, versions, stale BOM costs and base-unit
+quantities (with the hub units loaded once). Blank numbers are reserved
+from the hub's sequence as one block (services/numbering.py).
+"""
+from collections import Counter, defaultdict, namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import BatchIngredient, BillOfMaterials, BOMLine, ProductionBatch, ProductionOrder
+from . import counters, versions
+from .batches import _clean_field, _clean_value
+from .bom_explosion import CycleGuard
+from .costing import invalidate_boms
+from .numbering import KINDS, SAVE_ATTEMPTS, reserve
+from .units import QUANTITY_FIELDS, UnitRegistry, normalize_instance
+from .workflow import TransitionError, check_transition
+
+MAX_RECORDS = 1000
+INSERT_BATCH_SIZE = 500
+UPDATE_BATCH_SIZE = 500
+
+# ``row`` is the 1-based record of the request, or None for the request itself.
+RowError = namedtuple('RowError', 'row message')
+
+NUMBER_TAKEN = '%s "%s" is already used.'
+NUMBER_REPEATED = '%s "%s" is given to more than one record.'
+WRITE_CONFLICT = 'A number was taken by another entry meanwhile; nothing was saved, send the records again.'
+BOM_CYCLE = 'The component BOM contains the BOM of this line; a BOM cannot contain itself.'
+
+# Cost inputs of services/costing.py: changing one makes the BOM stale.
+COST_FIELDS = {
+    BillOfMaterials: ('output_quantity',),
+    BOMLine: ('bom_id', 'component_bom_id', 'quantity', 'unit_cost'),
+}
+
+
+class FieldSelectionError(ValueError):
+    """``?fields=`` names a field the resource does not have."""
+
+
+class BulkError(ValueError):
+    """Some records are invalid; nothing was saved."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(' '.join(error.message for error in errors))
+
+
+class BulkResult:
+    def __init__(self):
+        # Every record of the request, in order.
+        self.objects = []
+        # ``(obj, original)`` of the records written; ``original`` is None
+        # for new records, else their field values (by attname) before.
+        self.changed = []
+
+
+class Resource:
+    """One model as the API exposes it."""
+
+    def __init__(self, model, fields, writable, sort_fields=(), filters=None, number=None, validate=None):
+        self.model = model
+        self.fields = ('id', *fields, 'created_at', 'updated_at')
+        self.writable = writable
+        self.sort_fields = ('created_at', 'updated_at', *sort_fields)
+        # query parameter -> lookup
+        self.filters = filters or {}
+        # 'order' or 'batch': blank numbers are taken from the hub's sequence.
+        self.number = number
+        # ``validate(obj, original, related)`` returns extra messages and may
+        # fill in derived fields.
+        self.validate = validate
+
+    def attname(self, name):
+        return 'pk' if name == 'id' else self.model._meta.get_field(name).attname
+
+    def select(self, fields=None):
+        """The names in a comma-separated ``fields`` selection, or every field."""
+        names = [name.strip() for name in (fields or '').split(',') if name.strip()]
+        if not names:
+            return self.fields
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise FieldSelectionError('Unknown fields: %s.' % ', '.join(unknown))
+        return tuple(dict.fromkeys(names))
+
+    def serialize(self, obj, fields):
+        return {name: getattr(obj, self.attname(name)) for name in fields}
+
+
+def _validate_line(obj, original, related):
+    messages = []
+    if obj.quantity is not None and obj.quantity <= 0:
+        messages.append('Quantity must be greater than zero.')
+    if obj.unit_cost is not None and obj.unit_cost < 0:
+        messages.append('Unit cost cannot be negative.')
+    if obj.component_bom_id is not None and obj.component_bom_id == obj.bom_id:
+        messages.append('A BOM cannot contain itself.')
+    return messages
+
+
+def _validate_order(obj, original, related):
+    if obj.status is None:
+        return []
+    try:
+        check_transition(original['status'] if original else None, obj.status)
+    except TransitionError as exc:
+        return [str(exc)]
+    return []
+
+
+def _validate_batch(obj, original, related):
+    messages = []
+    if original is None and obj.bom_id is None and obj.production_order_id:
+        # As in batch entry, a new batch makes what its order's BOM makes.
+        order = related.get(ProductionOrder, {}).get(obj.production_order_id)
+        if order is not None:
+            obj.bom_id = order.bom_id
+    if obj.quantity_produced is not None and obj.quantity_produced < 0:
+        messages.append('Quantity produced cannot be negative.')
+    if obj.production_date and obj.expiry_date and obj.expiry_date < obj.production_date:
+        messages.append('The expiry date is before the production date.')
+    return messages
+
+
+def _validate_ingredient(obj, original, related):
+    if obj.quantity_used is not None and obj.quantity_used <= 0:
+        return ['Quantity used must be greater than zero.']
+    return []
+
+
+RESOURCES = {
+    'boms': Resource(
+        BillOfMaterials,
+        fields=('code', 'name', 'output_quantity', 'daily_capacity', 'unit_cost', 'notes', 'is_active'),
+        writable=('code', 'name', 'output_quantity', 'daily_capacity', 'notes', 'is_active'),
+        sort_fields=('code', 'name'),
+        filters={'code': 'code', 'is_active': 'is_active'},
+    ),
+    'lines': Resource(
+        BOMLine,
+        fields=('bom', 'component_bom', 'description', 'quantity', 'unit', 'unit_cost', 'base_quantity', 'base_unit'),
+        writable=('bom', 'component_bom', 'description', 'quantity', 'unit', 'unit_cost'),
+        sort_fields=('description',),
+        filters={'bom': 'bom_id', 'component_bom': 'component_bom_id'},
+        validate=_validate_line,
+    ),
+    'orders': Resource(
+        ProductionOrder,
+        fields=(
+            'order_number', 'bom', 'quantity', 'batch_number', 'expiry_date', 'status',
+            'start_date', 'end_date', 'due_date', 'notes',
+        ),
+        writable=(
+            'order_number', 'bom', 'quantity', 'batch_number', 'expiry_date', 'status',
+            'start_date', 'end_date', 'due_date', 'notes',
+        ),
+        sort_fields=('order_number', 'start_date', 'due_date'),
+        filters={'bom': 'bom_id', 'status': 'status', 'order_number': 'order_number'},
+        number='order',
+        validate=_validate_order,
+    ),
+    'batches': Resource(
+        ProductionBatch,
+        fields=(
+            'batch_number', 'production_order', 'bom', 'quantity_produced', 'production_date', 'expiry_date',
+            'quality_status', 'notes',
+        ),
+        writable=(
+            'batch_number', 'production_order', 'bom', 'quantity_produced', 'production_date', 'expiry_date',
+            'quality_status', 'notes',
+        ),
+        sort_fields=('batch_number', 'production_date', 'expiry_date'),
+        filters={
+            'order': 'production_order_id', 'bom': 'bom_id',
+            'quality_status': 'quality_status', 'batch_number': 'batch_number',
+        },
+        number='batch',
+        validate=_validate_batch,
+    ),
+    'ingredients': Resource(
+        BatchIngredient,
+        fields=('batch', 'description', 'supplier_lot', 'source_batch', 'quantity_used', 'unit', 'base_quantity', 'base_unit'),
+        writable=('batch', 'description', 'supplier_lot', 'source_batch', 'quantity_used', 'unit'),
+        sort_fields=('supplier_lot',),
+        filters={'batch': 'batch_id', 'source_batch': 'source_batch_id', 'supplier_lot': 'supplier_lot'},
+        validate=_validate_ingredient,
+    ),
+}
+
+
+def _snapshot(obj):
+    return {field.attname: getattr(obj, field.attname) for field in type(obj)._meta.concrete_fields}
+
+
+def _clean_record(resource, record, obj, creating, messages):
+    """Set the fields of ``record`` on ``obj``; returns the ``(field, id)`` relations to look up."""
+    model = resource.model
+    extra = [name for name in record if name not in resource.writable and not (name == 'id' and not creating)]
+    for name in extra:
+        if name in resource.fields:
+            messages.append('Field "%s" is read-only.' % name)
+        else:
+            messages.append('Unknown field "%s".' % name)
+    names = resource.writable if creating else [name for name in resource.writable if name in record]
+    relations = []
+    for name in names:
+        field = model._meta.get_field(name)
+        if not field.is_relation:
+            setattr(obj, name, _clean_field(model, name, _clean_value(record.get(name)), messages))
+            continue
+        raw = _clean_value(record.get(name))
+        if not raw:
+            if field.null:
+                setattr(obj, field.attname, None)
+            else:
+                messages.append('%s is required.' % field.verbose_name)
+            continue
+        try:
+            value = field.target_field.to_python(raw)
+        except ValidationError:
+            messages.append('%s "%s" does not exist.' % (field.verbose_name, raw))
+            continue
+        setattr(obj, field.attname, value)
+        relations.append((field, value))
+    return relations
+
+
+def _related(hub_id, relations):
+    """``{model: {pk: obj}}`` of the live rows among every record's ``relations``, one query per model."""
+    wanted = defaultdict(set)
+    for record_relations in relations:
+        for field, value in record_relations:
+            wanted[field.related_model].add(value)
+    return {
+        model: model.objects.filter(hub_id=hub_id, is_deleted=False).in_bulk(list(ids))
+        for model, ids in wanted.items()
+    }
+
+
+def _check_numbers(resource, hub_id, pairs, errors):
+    """Report numbers given twice in the request or used by another live record."""
+    model, field = KINDS[resource.number][:2]
+    label = model._meta.get_field(field).verbose_name
+    given = {}
+    for row, (obj, original) in enumerate(pairs, start=1):
+        number = getattr(obj, field)
+        if not number or (original and original[field] == number):
+            continue
+        if number in given:
+            errors.append(RowError(row, NUMBER_REPEATED % (label, number)))
+        else:
+            given[number] = (row, obj)
+    if not given:
+        return
+    taken = model.objects.filter(hub_id=hub_id, is_deleted=False, **{f'{field}__in': list(given)})
+    for number, pk in taken.order_by().values_list(field, 'pk'):
+        row, obj = given[number]
+        if obj.pk != pk:
+            errors.append(RowError(row, NUMBER_TAKEN % (label, number)))
+
+
+def _check_cycles(hub_id, pairs, errors):
+    """Report the lines whose sub-assembly closes a cycle with the saved lines or the records before them."""
+    failed = {error.row for error in errors}
+    guard = CycleGuard(hub_id, exclude_lines=[obj.pk for obj, original in pairs if original is not None])
+    for row, (obj, _original) in enumerate(pairs, start=1):
+        if row not in failed and not guard.add(obj.bom_id, obj.component_bom_id):
+            errors.append(RowError(row, BOM_CYCLE))
+
+
+def _assign_numbers(resource, hub_id, objs):
+    """Give the records left without a number the next numbers of the hub's pattern, reserved together."""
+    model, field = KINDS[resource.number][:2]
+    given = {getattr(obj, field) for obj in objs} - {''}
+    blank = [obj for obj in objs if not getattr(obj, field)]
+    for _attempt in range(SAVE_ATTEMPTS):
+        if not blank:
+            return
+        numbers = reserve(hub_id, resource.number, len(blank))
+        # Numbers typed in by hand may already use some of the sequence.
+        taken = given | set(
+            model.objects.filter(hub_id=hub_id, is_deleted=False, **{f'{field}__in': numbers})
+            .order_by().values_list(field, flat=True)
+        )
+        for obj, number in zip(blank, numbers):
+            if number not in taken:
+                setattr(obj, field, number)
+        blank = [obj for obj in blank if not getattr(obj, field)]
+    if blank:
+        raise BulkError([RowError(None, WRITE_CONFLICT)])
+
+
+def _validate(hub_id, resource, records, creating):
+    """
+    Clean ``records`` into ``(obj, original)`` pairs, new objects when
+    ``creating``, else the hub's live records named by each ``id``. Raises
+    ``BulkError`` with every problem found.
+    """
+    model = resource.model
+    if len(records) > MAX_RECORDS:
+        raise BulkError([RowError(None, 'At most %d records can be sent at once.' % MAX_RECORDS)])
+    errors = []
+    existing = {}
+    if not creating:
+        ids = []
+        for record in records:
+            try:
+                ids.append(model._meta.pk.to_python(_clean_value(record.get('id'))))
+            except ValidationError:
+                pass
+        existing = model.objects.filter(hub_id=hub_id, is_deleted=False).in_bulk(ids)
+
+    pairs, relations, messages_by_row = [], [], []
+    seen = set()
+    for record in records:
+        messages = []
+        if creating:
+            obj, original = model(hub_id=hub_id), None
+        else:
+            pk = _clean_value(record.get('id'))
+            try:
+                obj = existing.get(model._meta.pk.to_python(pk)) if pk else None
+            except ValidationError:
+                obj = None
+            if not pk:
+                messages.append('The "id" of the record to update is required.')
+            elif obj is None:
+                messages.append('Record "%s" does not exist.' % pk)
+            elif obj.pk in seen:
+                messages.append('Record "%s" is given more than once.' % pk)
+            if obj is None or obj.pk in seen:
+                obj = model(hub_id=hub_id)
+            else:
+                seen.add(obj.pk)
+            original = _snapshot(obj)
+        relations.append(_clean_record(resource, record, obj, creating, messages))
+        pairs.append((obj, original))
+        messages_by_row.append(messages)
+
+    related = _related(hub_id, relations)
+    for row, ((obj, original), record_relations, messages) in enumerate(zip(pairs, relations, messages_by_row), start=1):
+        for field, value in record_relations:
+            if value not in related[field.related_model]:
+                messages.append('%s "%s" does not exist.' % (field.verbose_name, value))
+        if resource.validate:
+            messages.extend(resource.validate(obj, original, related))
+        if messages:
+            errors.append(RowError(row, ' '.join(messages)))
+    if resource.number:
+        _check_numbers(resource, hub_id, pairs, errors)
+    if model is BOMLine:
+        _check_cycles(hub_id, pairs, errors)
+    if errors:
+        raise BulkError(sorted(errors, key=lambda error: error.row or 0))
+    return pairs
+
+
+def bulk_create(hub_id, resource, records):
+    """
+    Validate ``records`` (field name -> value mappings) together and insert
+    them as new rows of ``resource`` for ``hub_id``. Returns a
+    ``BulkResult``; raises ``BulkError`` and saves nothing if any record is
+    invalid.
+    """
+    model = resource.model
+    pairs = _validate(hub_id, resource, records, creating=True)
+    result = BulkResult()
+    result.objects = [obj for obj, _original in pairs]
+    result.changed = pairs
+    objs = result.objects
+    if not objs:
+        return result
+    if resource.number:
+        _assign_numbers(resource, hub_id, objs)
+    if model in QUANTITY_FIELDS:
+        registry = UnitRegistry.for_hub(hub_id)
+        for obj in objs:
+            normalize_instance(obj, registry)
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=INSERT_BATCH_SIZE)
+            if model in counters.TOTAL_FIELDS:
+                counters.apply_deltas(hub_id, counters.objects_deltas(objs))
+            versions.bump(hub_id, model)
+            if model is BOMLine:
+                invalidate_boms({obj.bom_id for obj in objs})
+    except IntegrityError:
+        # A number was taken by a concurrent entry since it was checked.
+        raise BulkError([RowError(None, WRITE_CONFLICT)])
+    return result
+
+
+def bulk_update(hub_id, resource, records):
+    """
+    Validate ``records`` together and write the fields they carry to the
+    hub's live rows named by their ``id``. Returns a ``BulkResult``; raises
+    ``BulkError`` and saves nothing if any record is invalid.
+    """
+    model = resource.model
+    pairs = _validate(hub_id, resource, records, creating=False)
+    result = BulkResult()
+    result.objects = [obj for obj, _original in pairs]
+    if resource.number:
+        _assign_numbers(resource, hub_id, result.objects)
+
+    now = timezone.now()
+    fields = {field.attname: field.name for field in model._meta.concrete_fields}
+    status_field = counters.STATUS_FIELDS.get(model, (None,))[0]
+    registry = None
+    groups = defaultdict(list)
+    deltas = Counter()
+    stale = set()
+    for obj, original in pairs:
+        changed = [attname for attname in fields if getattr(obj, attname) != original[attname]]
+        if not changed:
+            continue
+        if model in QUANTITY_FIELDS and {QUANTITY_FIELDS[model], 'unit'} & set(changed):
+            registry = registry or UnitRegistry.for_hub(hub_id)
+            normalize_instance(obj, registry)
+            changed += [name for name in ('base_quantity', 'base_unit') if name not in changed]
+        obj.updated_at = now
+        groups[tuple(fields[attname] for attname in changed) + ('updated_at',)].append(obj)
+        result.changed.append((obj, original))
+        if status_field in changed:
+            deltas.update(counters.row_deltas(model, original[status_field], sign=-1))
+            deltas.update(counters.row_deltas(model, getattr(obj, status_field), sign=1))
+        if set(COST_FIELDS.get(model, ())) & set(changed):
+            stale.update({obj.pk} if model is BillOfMaterials else {original['bom_id'], obj.bom_id})
+    if not groups:
+        return result
+    try:
+        with transaction.atomic():
+            for names, objs in groups.items():
+                model.objects.bulk_update(objs, names, batch_size=UPDATE_BATCH_SIZE)
+            counters.apply_deltas(hub_id, deltas)
+            versions.bump(hub_id, model)
+            invalidate_boms(stale)
+    except IntegrityError:
+        raise BulkError([RowError(None, WRITE_CONFLICT)])
+    return result
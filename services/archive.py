@@ -0,0 +1,223 @@
+"""
+Archival of soft-deleted and closed records.
+
+Soft-deleted rows whose ``deleted_at`` is older than the hub's
+``archive_deleted_days``, and done or cancelled orders unchanged for
+``archive_closed_days`` together with their batches and the batches'
+ingredients, are copied into ``ArchivedRecord`` and removed from the live
+tables, one chunk of rows per transaction. An archived row keeps its
+primary key and fields as JSON, plus the columns the trace read path
+(services/traceability.py) looks archived lots and batches up by.
+
+Rows are removed children first with plain ``DELETE``s, without the
+per-row delete signals; the counters and versions are adjusted once per
+chunk instead. A row that a row staying in the live tables still points
+to is left alone until that row is archived too: a batch consumed by an
+ingredient of another batch (and the order the batch belongs to), a BOM
+used by orders, batches or other BOMs' lines, and a deleted order whose
+batches are still live.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import ArchivedRecord, BatchIngredient, BillOfMaterials, BOMLine, ProductionBatch, ProductionOrder
+from . import counters, versions
+
+CHUNK_SIZE = 500
+IN_CHUNK_SIZE = 500
+INSERT_BATCH_SIZE = 500
+CLOSED_STATUSES = ('done', 'cancelled')
+
+# model -> (lot, parent, source) columns copied out of the archived row.
+ARCHIVE_KEYS = {
+    BillOfMaterials: ('code', None, None),
+    BOMLine: (None, 'bom_id', 'component_bom_id'),
+    ProductionOrder: ('order_number', 'bom_id', None),
+    ProductionBatch: ('batch_number', 'production_order_id', None),
+    BatchIngredient: ('supplier_lot', 'batch_id', 'source_batch_id'),
+}
+
+
+class ArchiveResult:
+    def __init__(self):
+        self.rows = Counter()
+
+    @property
+    def total(self):
+        return sum(self.rows.values())
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def _pages(qs, chunk_size):
+    """Primary keys of ``qs`` in pk order, ``chunk_size`` at a time; rows left behind are not read again."""
+    qs = qs.order_by('pk')
+    last = None
+    while True:
+        page = qs.filter(pk__gt=last) if last is not None else qs
+        ids = list(page.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def cutoffs(settings, now=None):
+    """``(deleted_before, closed_before)`` of a hub's settings; None where archiving is off."""
+    now = now or timezone.now()
+    deleted = settings.archive_deleted_days
+    closed = settings.archive_closed_days
+    return (
+        now - timedelta(days=deleted) if deleted else None,
+        now - timedelta(days=closed) if closed else None,
+    )
+
+
+def _records(model, ids, field, archived_at):
+    lot, parent, source = ARCHIVE_KEYS[model]
+    name = model._meta.model_name
+    records = []
+    for chunk in _chunks(ids):
+        for row in model.all_objects.filter(**{f'{field}__in': chunk}).order_by().values():
+            records.append(ArchivedRecord(
+                hub_id=row['hub_id'], model=name, record_id=row['id'],
+                lot=(row[lot] or '') if lot else '',
+                parent_id=row[parent] if parent else None,
+                source_id=row[source] if source else None,
+                data=row, archived_at=archived_at,
+            ))
+    return records
+
+
+def _move(hub_id, steps, result):
+    """
+    Archive and delete, in one transaction, the rows of each
+    ``(model, field, ids)`` step whose ``field`` is in ``ids``; children
+    must come before their parents.
+    """
+    archived_at = timezone.now()
+    deltas = Counter()
+    moved = []
+    with transaction.atomic():
+        for model, field, ids in steps:
+            records = _records(model, ids, field, archived_at) if ids else []
+            if not records:
+                continue
+            ArchivedRecord.objects.bulk_create(records, batch_size=INSERT_BATCH_SIZE)
+            # By the primary keys copied, not ``field``: a row added meanwhile stays.
+            for chunk in _chunks(record.record_id for record in records):
+                qs = model.all_objects.filter(pk__in=chunk)
+                if model in counters.TOTAL_FIELDS:
+                    deltas.update(counters.queryset_deltas(qs, sign=-1))
+                # A plain DELETE: no per-row signals, no cascade collection.
+                qs._raw_delete(qs.db)
+            result.rows[model._meta.model_name] += len(records)
+            moved.append(model)
+        counters.apply_deltas(hub_id, deltas)
+        versions.bump(hub_id, *moved)
+
+
+def _consumed_elsewhere(batch_ids):
+    """The batches of ``batch_ids`` used as the source of an ingredient of a batch outside ``batch_ids``."""
+    consumed = set()
+    for chunk in _chunks(batch_ids):
+        uses = BatchIngredient.all_objects.filter(source_batch_id__in=chunk).values_list('source_batch_id', 'batch_id')
+        consumed.update(source for source, batch in uses.order_by() if batch not in batch_ids)
+    return consumed
+
+
+def _archive_orders(hub_id, candidates, with_live_batches, chunk_size, result):
+    for order_ids in _pages(candidates, chunk_size):
+        batches = []
+        for chunk in _chunks(order_ids):
+            batches.extend(
+                ProductionBatch.all_objects.filter(production_order_id__in=chunk).order_by()
+                .values_list('pk', 'production_order_id', 'is_deleted')
+            )
+        consumed = _consumed_elsewhere({pk for pk, _order, _deleted in batches})
+        kept = {order for pk, order, deleted in batches if pk in consumed or (not deleted and not with_live_batches)}
+        order_ids = [pk for pk in order_ids if pk not in kept]
+        batch_ids = [pk for pk, order, _deleted in batches if order not in kept]
+        _move(hub_id, [
+            (BatchIngredient, 'batch_id', batch_ids),
+            (ProductionBatch, 'pk', batch_ids),
+            (ProductionOrder, 'pk', order_ids),
+        ], result)
+
+
+def _archive_batches(hub_id, deleted_before, chunk_size, result):
+    candidates = ProductionBatch.all_objects.filter(hub_id=hub_id, is_deleted=True, deleted_at__lt=deleted_before)
+    for batch_ids in _pages(candidates, chunk_size):
+        consumed = _consumed_elsewhere(set(batch_ids))
+        batch_ids = [pk for pk in batch_ids if pk not in consumed]
+        _move(hub_id, [(BatchIngredient, 'batch_id', batch_ids), (ProductionBatch, 'pk', batch_ids)], result)
+
+
+def _archive_boms(hub_id, deleted_before, chunk_size, result):
+    candidates = BillOfMaterials.all_objects.filter(hub_id=hub_id, is_deleted=True, deleted_at__lt=deleted_before)
+    for bom_ids in _pages(candidates, chunk_size):
+        chunk_ids = set(bom_ids)
+        used = set()
+        for chunk in _chunks(bom_ids):
+            for model in (ProductionOrder, ProductionBatch):
+                used.update(model.all_objects.filter(bom_id__in=chunk).order_by().values_list('bom_id', flat=True))
+            components = BOMLine.all_objects.filter(component_bom_id__in=chunk).values_list('component_bom_id', 'bom_id')
+            used.update(component for component, bom in components.order_by() if bom not in chunk_ids)
+        bom_ids = [pk for pk in bom_ids if pk not in used]
+        _move(hub_id, [(BOMLine, 'bom_id', bom_ids), (BillOfMaterials, 'pk', bom_ids)], result)
+
+
+def _archive_deleted(model, hub_id, deleted_before, chunk_size, result):
+    """Deleted rows nothing else points to: BOM lines and batch ingredients."""
+    candidates = model.all_objects.filter(hub_id=hub_id, is_deleted=True, deleted_at__lt=deleted_before)
+    for ids in _pages(candidates, chunk_size):
+        _move(hub_id, [(model, 'pk', ids)], result)
+
+
+def archive_hub(hub_id, deleted_before=None, closed_before=None, chunk_size=CHUNK_SIZE):
+    """
+    Move the records of ``hub_id`` deleted before ``deleted_before`` and
+    the done or cancelled orders last changed before ``closed_before`` to
+    the archive. Either cutoff may be None to skip it.
+    """
+    result = ArchiveResult()
+    orders = ProductionOrder.all_objects.filter(hub_id=hub_id)
+    if closed_before:
+        closed = orders.filter(status__in=CLOSED_STATUSES, updated_at__lt=closed_before)
+        _archive_orders(hub_id, closed, True, chunk_size, result)
+    if deleted_before:
+        deleted = orders.filter(is_deleted=True, deleted_at__lt=deleted_before)
+        _archive_orders(hub_id, deleted, False, chunk_size, result)
+        _archive_batches(hub_id, deleted_before, chunk_size, result)
+        _archive_deleted(BatchIngredient, hub_id, deleted_before, chunk_size, result)
+        _archive_boms(hub_id, deleted_before, chunk_size, result)
+        _archive_deleted(BOMLine, hub_id, deleted_before, chunk_size, result)
+    return result
+
+
+def restore(model, data):
+    """An unsaved ``model`` instance of an archived row, flagged ``is_archived``, for display."""
+    obj = model(**{
+        field.attname: field.to_python(data[field.attname])
+        for field in model._meta.concrete_fields if field.attname in data
+    })
+    obj.is_archived = True
+    return obj
+
+
+def archived_batches(hub_id, batch_ids):
+    """``{batch_id: ProductionBatch}`` of the archived batches among ``batch_ids``."""
+    batches = {}
+    for chunk in _chunks(batch_ids):
+        qs = ArchivedRecord.objects.filter(hub_id=hub_id, model='productionbatch', record_id__in=chunk)
+        for data in qs.order_by().values_list('data', flat=True):
+            batch = restore(ProductionBatch, data)
+            batches[batch.pk] = batch
+    return batches
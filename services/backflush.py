@@ -0,0 +1,155 @@
+"""
+Backflushing: batch ingredients derived from the bill of materials.
+
+The expected usage of a batch is every live line of its BOM scaled by
+``quantity_produced / output_quantity``. Each line quantity is multiplied
+before dividing, in ``Decimal``, and rounded once (half up) to the precision
+of ``BatchIngredient.quantity_used``; lines that round to nothing are left
+out.
+
+``expected_rows`` gives the usage of one batch as raw ingredient rows for
+``services.batches.record_batch``, which merges them with what the operator
+entered (``merge_rows``). ``backflush_batches`` fills in every batch of a
+hub that has a BOM but no ingredients yet: one query for the batches, one
+for the lines of all their BOMs, one for the hub units and a chunked
+``bulk_create``.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+
+from ..models import BatchIngredient, BOMLine, ProductionBatch
+from . import versions
+from .bom_explosion import _output_quantity
+from .units import UnitRegistry, normalize_instance
+
+QUANTITY_QUANTUM = Decimal('0.01')
+IN_CHUNK_SIZE = 500
+INSERT_BATCH_SIZE = 500
+
+
+class BackflushResult:
+    def __init__(self):
+        self.batches = 0
+        self.ingredients = 0
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def _bom_lines(bom_ids):
+    """``{bom_id: [(output_quantity, description, quantity, unit), ...]}`` in line order."""
+    lines = {}
+    for chunk in _chunks(bom_ids):
+        rows = (
+            BOMLine.objects.filter(bom_id__in=chunk, is_deleted=False, bom__is_deleted=False)
+            .order_by('created_at', 'pk')
+            .values_list('bom_id', 'bom__output_quantity', 'description', 'quantity', 'unit')
+        )
+        for bom_id, *line in rows:
+            lines.setdefault(bom_id, []).append(line)
+    return lines
+
+
+def scale_lines(lines, quantity_produced):
+    """``[(description, quantity_used, unit), ...]`` consumed to produce ``quantity_produced``."""
+    quantity_produced = Decimal(quantity_produced or 0)
+    usage = []
+    if quantity_produced <= 0:
+        return usage
+    for output_quantity, description, quantity, unit in lines:
+        used = (Decimal(quantity) * quantity_produced / _output_quantity(output_quantity)).quantize(
+            QUANTITY_QUANTUM, rounding=ROUND_HALF_UP,
+        )
+        if used > 0:
+            usage.append((description, used, unit))
+    return usage
+
+
+def expected_rows(bom_id, quantity_produced):
+    """The BOM usage of one batch as raw ingredient rows (field name -> value)."""
+    if not bom_id:
+        return []
+    lines = _bom_lines([bom_id]).get(bom_id, [])
+    return [
+        {'description': description, 'quantity_used': str(used), 'unit': unit}
+        for description, used, unit in scale_lines(lines, quantity_produced)
+    ]
+
+
+def _ingredient_key(description):
+    return str(description or '').strip().casefold()
+
+
+def _has_value(row, name):
+    value = row.get(name)
+    return value is not None and str(value).strip() != ''
+
+
+def merge_rows(expected, entered):
+    """
+    Overlay the rows the operator ``entered`` on the ``expected`` BOM rows.
+    A row naming a BOM ingredient (case-insensitively) fills in its supplier
+    lot and source batch and, when it has a quantity, replaces the quantity
+    and unit; any other row is an extra ingredient, added after the BOM ones.
+    """
+    merged = [dict(row) for row in expected]
+    open_rows = {}
+    for row in merged:
+        open_rows.setdefault(_ingredient_key(row['description']), []).append(row)
+    extra = []
+    for row in entered:
+        matches = open_rows.get(_ingredient_key(row.get('description')))
+        if not matches:
+            extra.append(row)
+            continue
+        target = matches.pop(0)
+        for name in ('supplier_lot', 'source_batch'):
+            if _has_value(row, name):
+                target[name] = row[name]
+        if _has_value(row, 'quantity_used'):
+            target['quantity_used'] = row['quantity_used']
+            target['unit'] = row.get('unit') or target['unit']
+    return merged + extra
+
+
+def backflush_batches(hub_id, batch_ids=None):
+    """
+    Generate the ingredients of every live batch of ``hub_id`` (or of
+    ``batch_ids``) that has a BOM, directly or through its production order,
+    a positive quantity produced and no live ingredients yet.
+    """
+    result = BackflushResult()
+    batches = ProductionBatch.objects.filter(hub_id=hub_id, is_deleted=False).exclude(
+        ingredients__is_deleted=False,
+    )
+    if batch_ids is not None:
+        batches = batches.filter(pk__in=batch_ids)
+    batches = list(
+        batches.filter(quantity_produced__gt=0)
+        .order_by()
+        .values_list('pk', 'bom_id', 'production_order__bom_id', 'quantity_produced')
+    )
+    bom_ids = {bom_id or order_bom_id for _pk, bom_id, order_bom_id, _quantity in batches} - {None}
+    if not bom_ids:
+        return result
+    lines = _bom_lines(bom_ids)
+    registry = UnitRegistry.for_hub(hub_id)
+    objs = []
+    for pk, bom_id, order_bom_id, quantity in batches:
+        usage = scale_lines(lines.get(bom_id or order_bom_id, []), quantity)
+        if usage:
+            result.batches += 1
+        for description, used, unit in usage:
+            obj = BatchIngredient(hub_id=hub_id, batch_id=pk, description=description, quantity_used=used, unit=unit)
+            normalize_instance(obj, registry)
+            objs.append(obj)
+    if objs:
+        with transaction.atomic():
+            BatchIngredient.objects.bulk_create(objs, batch_size=INSERT_BATCH_SIZE)
+            versions.bump(hub_id, BatchIngredient)
+    result.ingredients = len(objs)
+    return result
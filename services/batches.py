@@ -0,0 +1,163 @@
+"""
+Production batch entry together with its ingredients.
+
+``record_batch`` validates a batch and all of its ingredient rows first and
+writes nothing unless every row is valid. The batch is then saved and its
+ingredients inserted with one ``bulk_create``, in one transaction. Units are
+resolved with a single ``UnitRegistry`` (one query) and source batches,
+given by batch number, with one query for all rows, so recording a batch
+takes the same number of queries with one ingredient or forty.
+
+With ``backflush`` the ingredients expected from the BOM (services/
+backflush.py) are added to the rows entered, one more query. A batch
+entered without a number gets the next one of the hub's batch pattern
+(services/numbering.py).
+"""
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from ..models import BatchIngredient, ProductionBatch
+from . import versions
+from .backflush import expected_rows, merge_rows
+from .numbering import save_numbered
+from .units import UnitRegistry, normalize_instance
+
+# ``row`` is the 1-based ingredient row, or None for the batch itself.
+EntryError = namedtuple('EntryError', 'row message')
+
+BATCH_FIELDS = ('batch_number', 'quantity_produced', 'production_date', 'expiry_date', 'quality_status', 'notes')
+INGREDIENT_FIELDS = ('description', 'supplier_lot', 'source_batch', 'quantity_used', 'unit')
+
+NUMBER_TAKEN = 'Batch number "%s" is already used.'
+
+
+class BatchEntryError(ValueError):
+    """
+    The batch or some of its ingredient rows are invalid; nothing was saved.
+    ``rows`` are the ingredient rows the error rows are numbered against.
+    """
+
+    def __init__(self, errors, rows=()):
+        self.errors = errors
+        self.rows = rows
+        super().__init__(' '.join(error.message for error in errors))
+
+
+def _clean_value(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _clean_field(model, name, raw, messages):
+    field = model._meta.get_field(name)
+    if raw == '':
+        if field.has_default():
+            raw = field.get_default()
+        elif field.null:
+            return None
+    try:
+        return field.clean(raw, None)
+    except ValidationError as exc:
+        messages.append('%s: %s' % (field.verbose_name, ' '.join(exc.messages)))
+        return None
+
+
+def _is_blank(row):
+    return not any(_clean_value(row.get(name)) for name in INGREDIENT_FIELDS)
+
+
+def _live_batches(hub_id, numbers):
+    """``{batch_number: batch_id}`` of the live batches numbered ``numbers``; ambiguous numbers map to None."""
+    numbers = set(numbers) - {''}
+    found = {}
+    if numbers:
+        qs = ProductionBatch.objects.filter(hub_id=hub_id, is_deleted=False, batch_number__in=numbers)
+        for number, pk in qs.order_by().values_list('batch_number', 'pk'):
+            found[number] = None if number in found else pk
+    return found
+
+
+def _build_batch(order, data, errors):
+    messages = []
+    cleaned = {}
+    for name in BATCH_FIELDS:
+        cleaned[name] = _clean_field(ProductionBatch, name, _clean_value(data.get(name)), messages)
+    if cleaned.get('quantity_produced') is not None and cleaned['quantity_produced'] < 0:
+        messages.append('Quantity produced cannot be negative.')
+    if cleaned.get('production_date') and cleaned.get('expiry_date') and cleaned['expiry_date'] < cleaned['production_date']:
+        messages.append('The expiry date is before the production date.')
+    errors.extend(EntryError(None, message) for message in messages)
+    return ProductionBatch(hub_id=order.hub_id, production_order=order, bom_id=order.bom_id, **cleaned)
+
+
+def _build_ingredient(hub_id, row, sources, registry):
+    """Return ``(BatchIngredient, None)`` or ``(None, message)`` for one row."""
+    messages = []
+    cleaned = {}
+    for name in ('description', 'supplier_lot', 'quantity_used', 'unit'):
+        cleaned[name] = _clean_field(BatchIngredient, name, _clean_value(row.get(name)), messages)
+    if cleaned.get('quantity_used') is not None and cleaned['quantity_used'] <= 0:
+        messages.append('Quantity used must be greater than zero.')
+    source_id = None
+    number = _clean_value(row.get('source_batch'))
+    if number:
+        if number not in sources:
+            messages.append('Source batch "%s" does not exist.' % number)
+        elif sources[number] is None:
+            messages.append('Batch number "%s" is used by more than one batch.' % number)
+        else:
+            source_id = sources[number]
+    if messages:
+        return None, ' '.join(messages)
+    ingredient = BatchIngredient(hub_id=hub_id, source_batch_id=source_id, **cleaned)
+    normalize_instance(ingredient, registry)
+    return ingredient, None
+
+
+def record_batch(order, data, ingredients=(), backflush=False):
+    """
+    Save a batch of ``order`` from ``data`` (field name -> raw value) with
+    its ``ingredients`` (a list of such mappings; blank rows are skipped),
+    merged over the BOM usage when ``backflush`` is set. Returns the batch;
+    raises ``BatchEntryError`` with every problem found.
+    """
+    errors = []
+    batch = _build_batch(order, data, errors)
+    rows = [row for row in ingredients if not _is_blank(row)]
+    if backflush and batch.quantity_produced:
+        rows = merge_rows(expected_rows(batch.bom_id, batch.quantity_produced), rows)
+    # The source batches and the new batch number are looked up together.
+    numbers = [_clean_value(row.get('source_batch')) for row in rows] + [batch.batch_number or '']
+    sources = _live_batches(order.hub_id, numbers)
+    if batch.batch_number in sources:
+        errors.append(EntryError(None, NUMBER_TAKEN % batch.batch_number))
+    objs = []
+    if rows:
+        registry = UnitRegistry.for_hub(order.hub_id)
+        for index, row in enumerate(rows, start=1):
+            obj, message = _build_ingredient(order.hub_id, row, sources, registry)
+            if message:
+                errors.append(EntryError(index, message))
+            else:
+                objs.append(obj)
+    if errors:
+        raise BatchEntryError(errors, rows)
+    try:
+        with transaction.atomic():
+            if batch.batch_number:
+                batch.save()
+            else:
+                save_numbered(batch, 'batch')
+            for obj in objs:
+                obj.batch = batch
+            if objs:
+                BatchIngredient.objects.bulk_create(objs)
+                versions.bump(order.hub_id, BatchIngredient)
+    except IntegrityError:
+        # The number was taken by a concurrent entry since it was checked.
+        raise BatchEntryError([EntryError(None, NUMBER_TAKEN % batch.batch_number)], rows)
+    batch.ingredient_count = len(objs)
+    return batch
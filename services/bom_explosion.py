@@ -0,0 +1,205 @@
+"""
+Multi-level BOM explosion.
+
+A BillOfMaterials can use other BOMs as sub-assemblies through
+``BOMLine.component_bom``. The graph reachable from the requested roots is
+loaded breadth-first, one query per BOM level, and then expanded in memory.
+The per-unit leaf requirements of every BOM are memoized, so a sub-assembly
+shared by many parents is only expanded once per ``BOMExploder``.
+
+Leaf components are keyed and summed in their base unit (see
+services/units.py): lines of one BOM for the same component are added up by
+the loading query itself, so "500 g" and "1 kg" of flour are one component
+of 1.5 kg. Sub-assembly lines keep their raw quantity, which counts output
+units of the sub-assembly BOM.
+"""
+from collections import defaultdict, namedtuple
+from decimal import Decimal
+
+from django.db.models import Sum
+
+from ..models import BOMLine
+
+Component = namedtuple('Component', ['description', 'unit'])
+GraphLine = namedtuple('GraphLine', ['description', 'unit', 'quantity', 'component_bom_id'])
+
+ONE = Decimal('1')
+
+
+class BOMCycleError(ValueError):
+    """A BOM contains itself, directly or through its sub-assemblies."""
+
+    def __init__(self, path):
+        self.path = list(path)
+        super().__init__('BOM cycle detected: %s' % ' -> '.join(str(p) for p in self.path))
+
+
+def _output_quantity(value):
+    # A BOM without a positive output quantity is treated as producing one
+    # unit, instead of failing the whole explosion on a division by zero.
+    if value is None or value <= 0:
+        return ONE
+    return Decimal(value)
+
+
+class BOMGraph:
+    """In-memory adjacency of the BOMs reachable from a set of roots."""
+
+    def __init__(self):
+        self.output_quantities = {}
+        self.lines = defaultdict(list)
+
+    @classmethod
+    def load(cls, bom_ids, hub_id=None):
+        """Load every live line reachable from ``bom_ids``, level by level."""
+        graph = cls()
+        frontier = {bom_id for bom_id in bom_ids if bom_id is not None}
+        seen = set()
+        while frontier:
+            seen |= frontier
+            qs = BOMLine.objects.filter(bom_id__in=frontier, is_deleted=False, bom__is_deleted=False)
+            if hub_id is not None:
+                qs = qs.filter(hub_id=hub_id)
+            rows = (
+                qs.values(
+                    'bom_id', 'bom__output_quantity', 'description', 'base_unit',
+                    'component_bom_id', 'component_bom__is_deleted',
+                )
+                .annotate(total=Sum('quantity'), base_total=Sum('base_quantity'))
+                .order_by()
+                .values_list(
+                    'bom_id', 'bom__output_quantity', 'description', 'base_unit',
+                    'total', 'base_total', 'component_bom_id', 'component_bom__is_deleted',
+                )
+            )
+            next_frontier = set()
+            for bom_id, output_quantity, description, unit, total, base_total, child_id, child_deleted in rows:
+                graph.output_quantities[bom_id] = _output_quantity(output_quantity)
+                if child_deleted:
+                    # A soft-deleted sub-assembly is consumed as a plain component.
+                    child_id = None
+                quantity = base_total if child_id is None else total
+                graph.lines[bom_id].append(GraphLine(description, unit, Decimal(quantity), child_id))
+                if child_id is not None and child_id not in seen:
+                    next_frontier.add(child_id)
+            frontier = next_frontier
+        return graph
+
+    def output_quantity(self, bom_id):
+        return self.output_quantities.get(bom_id, ONE)
+
+
+class BOMExploder:
+    """Expands BOMs of a loaded ``BOMGraph`` into leaf components."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self._per_unit = {}
+        self._path = []
+
+    def per_unit(self, bom_id):
+        """Leaf quantities needed to produce one output unit of ``bom_id``."""
+        cached = self._per_unit.get(bom_id)
+        if cached is not None:
+            return cached
+        if bom_id in self._path:
+            raise BOMCycleError(self._path[self._path.index(bom_id):] + [bom_id])
+
+        self._path.append(bom_id)
+        try:
+            output_quantity = self.graph.output_quantity(bom_id)
+            totals = defaultdict(Decimal)
+            for line in self.graph.lines.get(bom_id, ()):
+                factor = line.quantity / output_quantity
+                if line.component_bom_id is None:
+                    totals[Component(line.description, line.unit)] += factor
+                else:
+                    for component, quantity in self.per_unit(line.component_bom_id).items():
+                        totals[component] += quantity * factor
+        finally:
+            self._path.pop()
+
+        result = dict(totals)
+        self._per_unit[bom_id] = result
+        return result
+
+    def explode(self, bom_id, quantity):
+        """Leaf quantities needed to produce ``quantity`` units of ``bom_id``."""
+        quantity = Decimal(quantity)
+        return {
+            component: per_unit * quantity
+            for component, per_unit in self.per_unit(bom_id).items()
+        }
+
+
+def creates_cycle(bom_id, component_bom_id):
+    """
+    True when a line of ``bom_id`` using ``component_bom_id`` as its
+    sub-assembly would make a BOM contain itself: ``bom_id`` is reachable
+    from ``component_bom_id``, checked one BOM level per query.
+    """
+    if bom_id is None or component_bom_id is None:
+        return False
+    frontier = {component_bom_id}
+    seen = set()
+    while frontier:
+        if bom_id in frontier:
+            return True
+        seen |= frontier
+        children = BOMLine.objects.filter(
+            bom_id__in=frontier, is_deleted=False, component_bom__isnull=False, component_bom__is_deleted=False,
+        ).values_list('component_bom_id', flat=True)
+        frontier = set(children.order_by()) - seen
+    return False
+
+
+class CycleGuard:
+    """
+    ``creates_cycle`` for many new sub-assembly lines of a hub at once, as
+    in a bulk request or an import: the hub's live sub-assembly edges are
+    loaded in one query (leaving out ``exclude_lines``, lines about to be
+    rewritten), and every edge accepted by ``add`` counts for the lines
+    checked after it.
+    """
+
+    def __init__(self, hub_id, exclude_lines=()):
+        self.children = defaultdict(set)
+        rows = BOMLine.objects.filter(
+            hub_id=hub_id, is_deleted=False, component_bom__isnull=False, component_bom__is_deleted=False,
+        ).exclude(pk__in=list(exclude_lines)).values_list('bom_id', 'component_bom_id')
+        for bom_id, child_id in rows.order_by():
+            self.children[bom_id].add(child_id)
+
+    def creates_cycle(self, bom_id, component_bom_id):
+        if bom_id is None or component_bom_id is None:
+            return False
+        stack, seen = [component_bom_id], set()
+        while stack:
+            current = stack.pop()
+            if current == bom_id:
+                return True
+            if current not in seen:
+                seen.add(current)
+                stack.extend(self.children.get(current, ()))
+        return False
+
+    def add(self, bom_id, component_bom_id):
+        """Record the line's edge; False, recording nothing, when it would close a cycle."""
+        if self.creates_cycle(bom_id, component_bom_id):
+            return False
+        if bom_id is not None and component_bom_id is not None:
+            self.children[bom_id].add(component_bom_id)
+        return True
+
+
+def explode_bom(bom, quantity=None):
+    """
+    Explode ``bom`` into leaf components.
+
+    ``quantity`` defaults to the BOM's own output quantity. Returns a dict
+    mapping ``Component(description, base unit)`` to the required ``Decimal``.
+    """
+    if quantity is None:
+        quantity = _output_quantity(bom.output_quantity)
+    graph = BOMGraph.load([bom.pk], hub_id=bom.hub_id)
+    return BOMExploder(graph).explode(bom.pk, quantity)
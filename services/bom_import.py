@@ -0,0 +1,239 @@
+"""
+Bulk BOM line import from CSV or XLSX.
+
+Rows are read and validated in one streaming pass: BOM codes are resolved
+against a code -> id map loaded with a single query, valid rows are
+buffered and written with ``bulk_create`` every ``chunk_size`` rows, and
+every invalid row is reported with its line number. The whole import runs
+in one transaction; in strict mode (the default) any invalid row rolls the
+import back, otherwise the valid rows are kept.
+
+Expected columns (header names are case-insensitive): ``bom_code``,
+``description``, ``quantity``, ``unit`` and optionally ``component_code``
+for sub-assembly lines and ``unit_cost`` for purchased components. A
+sub-assembly line that would make a BOM contain itself, through the saved
+lines or the rows before it, is an invalid row (see ``CycleGuard``). The
+rolled-up cost of every BOM that received lines is invalidated once at the
+end (see services/costing.py), and base-unit quantities are computed with
+the hub's unit registry loaded once (see services/units.py).
+"""
+import codecs
+import csv
+import os
+from collections import Counter, namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from ..models import BillOfMaterials, BOMLine
+from . import counters, versions
+from .bom_explosion import CycleGuard
+from .costing import invalidate_boms
+from .units import UnitRegistry, normalize_instance
+
+IMPORT_CHUNK_SIZE = 2000
+
+COLUMNS = ('bom_code', 'description', 'quantity', 'unit', 'component_code', 'unit_cost')
+REQUIRED_COLUMNS = ('bom_code', 'description', 'quantity')
+HEADER_ALIASES = {
+    'bom': 'bom_code',
+    'bom code': 'bom_code',
+    'code': 'bom_code',
+    'component': 'component_code',
+    'component code': 'component_code',
+    'sub-assembly': 'component_code',
+    'cost': 'unit_cost',
+    'unit cost': 'unit_cost',
+}
+
+RowError = namedtuple('RowError', 'row message')
+
+
+class BOMImportError(ValueError):
+    """The file cannot be imported at all (unreadable, wrong columns)."""
+
+
+class BOMImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.rolled_back = False
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class _Rollback(Exception):
+    pass
+
+
+def _normalize_header(header):
+    key = str(header or '').strip().lower()
+    return HEADER_ALIASES.get(key, key.replace(' ', '_'))
+
+
+def _rows_from_header(rows):
+    """Turn an iterator of value lists (header first) into ``(line, dict)`` pairs."""
+    try:
+        header = [_normalize_header(h) for h in next(rows)]
+    except StopIteration:
+        raise BOMImportError('The file is empty.')
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise BOMImportError('Missing columns: %s.' % ', '.join(missing))
+    for line, values in enumerate(rows, start=2):
+        if not any(v not in (None, '') for v in values):
+            continue
+        yield line, dict(zip(header, values))
+
+
+def read_csv(fileobj, encoding='utf-8-sig'):
+    reader = csv.reader(codecs.getreader(encoding)(fileobj))
+    try:
+        yield from _rows_from_header(iter(reader))
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise BOMImportError('The file is not a valid %s CSV file (%s).' % (encoding, exc))
+
+
+def read_xlsx(fileobj):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise BOMImportError('XLSX import requires openpyxl.')
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception:
+        raise BOMImportError('The file is not a valid XLSX workbook.')
+    try:
+        yield from _rows_from_header(workbook.active.iter_rows(values_only=True))
+    finally:
+        # A read-only workbook keeps the file open until closed.
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    """Rows of ``fileobj``, parsed according to the extension of ``filename``."""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.xlsx':
+        return read_xlsx(fileobj)
+    if extension in ('.csv', '.txt', ''):
+        return read_csv(fileobj)
+    raise BOMImportError('Unsupported file type %s; upload a CSV or XLSX file.' % extension)
+
+
+def _bom_code_map(hub_id):
+    """``{code: bom_id}`` for the hub's live BOMs; ambiguous codes map to None."""
+    codes = {}
+    rows = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False).exclude(code='').values_list('code', 'id')
+    for code, bom_id in rows.order_by():
+        codes[code] = None if code in codes else bom_id
+    return codes
+
+
+def _clean_cell(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _resolve(codes, code, label):
+    if not code:
+        return None, None
+    if code not in codes:
+        return None, '%s "%s" does not exist.' % (label, code)
+    if codes[code] is None:
+        return None, '%s "%s" is used by more than one BOM.' % (label, code)
+    return codes[code], None
+
+
+def _build_line(hub_id, codes, values, fields, registry):
+    """Return ``(BOMLine, None)`` or ``(None, message)`` for one row."""
+    messages = []
+    bom_code = _clean_cell(values.get('bom_code'))
+    bom_id, message = _resolve(codes, bom_code, 'BOM')
+    if not bom_code:
+        message = 'BOM code is required.'
+    if message:
+        messages.append(message)
+    component_id, message = _resolve(codes, _clean_cell(values.get('component_code')), 'Component BOM')
+    if message:
+        messages.append(message)
+    if component_id is not None and component_id == bom_id:
+        messages.append('A BOM cannot contain itself.')
+
+    cleaned = {}
+    for name in ('description', 'quantity', 'unit'):
+        raw = _clean_cell(values.get(name))
+        try:
+            cleaned[name] = fields[name].clean(raw, None)
+        except ValidationError as exc:
+            messages.append('%s: %s' % (fields[name].verbose_name, ' '.join(exc.messages)))
+    if 'quantity' in cleaned and cleaned['quantity'] <= 0:
+        messages.append('Quantity must be greater than zero.')
+    raw = _clean_cell(values.get('unit_cost'))
+    if raw:
+        try:
+            cleaned['unit_cost'] = fields['unit_cost'].clean(raw, None)
+        except ValidationError as exc:
+            messages.append('%s: %s' % (fields['unit_cost'].verbose_name, ' '.join(exc.messages)))
+        else:
+            if cleaned['unit_cost'] < 0:
+                messages.append('Unit cost cannot be negative.')
+
+    if messages:
+        return None, ' '.join(messages)
+    line = BOMLine(hub_id=hub_id, bom_id=bom_id, component_bom_id=component_id, **cleaned)
+    normalize_instance(line, registry)
+    return line, None
+
+
+def import_bom_lines(hub_id, rows, strict=True, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Validate and insert ``rows`` (``(line, dict)`` pairs from ``read_rows``)
+    as BOM lines of ``hub_id``. Returns a ``BOMImportResult``.
+    """
+    result = BOMImportResult()
+    fields = {name: BOMLine._meta.get_field(name) for name in ('description', 'quantity', 'unit', 'unit_cost')}
+    codes = _bom_code_map(hub_id)
+    registry = UnitRegistry.for_hub(hub_id)
+    guard = CycleGuard(hub_id)
+    deltas = Counter()
+    touched = set()
+    buffer = []
+
+    def flush():
+        BOMLine.objects.bulk_create(buffer)
+        deltas.update(counters.objects_deltas(buffer))
+        touched.update(obj.bom_id for obj in buffer)
+        result.created += len(buffer)
+        buffer.clear()
+
+    try:
+        with transaction.atomic():
+            for line, values in rows:
+                result.rows += 1
+                obj, message = _build_line(hub_id, codes, values, fields, registry)
+                if obj is not None and not guard.add(obj.bom_id, obj.component_bom_id):
+                    obj, message = None, 'The component BOM contains the BOM of this line; a BOM cannot contain itself.'
+                if message:
+                    result.errors.append(RowError(line, message))
+                    continue
+                if strict and result.errors:
+                    continue
+                buffer.append(obj)
+                if len(buffer) >= chunk_size:
+                    flush()
+            if strict and result.errors:
+                raise _Rollback
+            if buffer:
+                flush()
+            counters.apply_deltas(hub_id, deltas)
+            if result.created:
+                versions.bump(hub_id, BOMLine)
+            invalidate_boms(touched)
+    except _Rollback:
+        result.created = 0
+        result.rolled_back = True
+    return result
@@ -0,0 +1,180 @@
+"""
+Rolled-up BOM costing.
+
+``BillOfMaterials.unit_cost`` caches the cost of one output unit:
+
+    sum(line.quantity * line cost) / output_quantity
+
+where the line cost is ``BOMLine.unit_cost`` for purchased components and
+the (rolled-up) ``unit_cost`` of the sub-assembly for lines with a live
+``component_bom``.
+
+A NULL ``unit_cost`` means stale. ``invalidate_boms`` clears the cache of
+the changed BOMs and of their ancestors only, walking ``component_bom``
+edges upwards one level per query; it stops at BOMs that are already
+stale, whose ancestors are stale too. ``recost_boms`` recomputes every
+stale BOM of a hub in one pass: one query for the stale BOMs, one for
+their lines (joined to the cached cost of their sub-assemblies), a
+bottom-up evaluation in memory and a ``bulk_update``.
+
+Every write that invalidates a BOM queues a ``recost_boms`` of its hub for
+when the transaction commits, so read paths only ever read ``unit_cost``;
+the ``manufacturing_recost`` command catches up on anything left stale.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from functools import partial
+
+from django.db import transaction
+
+from ..models import BillOfMaterials, BOMLine
+from . import versions
+from .bom_explosion import BOMCycleError, _output_quantity
+
+COST_QUANTUM = Decimal('0.0001')
+IN_CHUNK_SIZE = 500
+UPDATE_BATCH_SIZE = 500
+
+UNCOSTED_CHILD = 'Sub-assembly %s has no cost (it is in a BOM cycle or depends on one).'
+
+
+class RecostResult:
+    def __init__(self):
+        self.costs = {}
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.costs)
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def invalidate_boms(bom_ids):
+    """Mark ``bom_ids`` and every BOM using them as a sub-assembly as stale."""
+    frontier = {bom_id for bom_id in bom_ids if bom_id is not None}
+    seen = set(frontier)
+    stale = set()
+    hub_ids = set()
+    stale_hub_ids = set()
+    while frontier:
+        next_frontier = set()
+        for chunk in _chunks(frontier):
+            rows = BillOfMaterials.all_objects.filter(pk__in=chunk).values_list('pk', 'unit_cost', 'hub_id')
+            for pk, unit_cost, hub_id in rows:
+                hub_ids.add(hub_id)
+                if unit_cost is not None:
+                    stale.add(pk)
+                    stale_hub_ids.add(hub_id)
+            parents = BOMLine.objects.filter(
+                component_bom_id__in=chunk, is_deleted=False, bom__unit_cost__isnull=False,
+            ).values_list('bom_id', flat=True)
+            next_frontier.update(set(parents) - seen)
+        seen |= next_frontier
+        frontier = next_frontier
+    for chunk in _chunks(stale):
+        BillOfMaterials.all_objects.filter(pk__in=chunk).update(unit_cost=None)
+    for hub_id in stale_hub_ids:
+        versions.bump(hub_id, BillOfMaterials)
+    for hub_id in hub_ids:
+        recost_on_commit(hub_id)
+    return stale
+
+
+def recost_on_commit(hub_id):
+    """Recost the hub's stale BOMs once the current transaction commits."""
+    transaction.on_commit(partial(recost_boms, hub_id))
+
+
+def _quantize(value):
+    return value.quantize(COST_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+def recost_boms(hub_id, full=False):
+    """
+    Recompute the unit cost of the hub's stale BOMs (every live BOM with
+    ``full=True``, e.g. after a catalog-wide price update) in one pass.
+    """
+    result = RecostResult()
+    with transaction.atomic():
+        boms = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False)
+        lines = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False, bom__is_deleted=False)
+        if not full:
+            boms = boms.filter(unit_cost__isnull=True)
+            lines = lines.filter(bom__unit_cost__isnull=True)
+        output_quantities = dict(boms.select_for_update().values_list('pk', 'output_quantity'))
+        if not output_quantities:
+            return result
+
+        bom_lines = {bom_id: [] for bom_id in output_quantities}
+        cached = {}
+        rows = lines.values_list(
+            'bom_id', 'quantity', 'unit_cost', 'component_bom_id',
+            'component_bom__is_deleted', 'component_bom__unit_cost',
+        )
+        for bom_id, quantity, unit_cost, child_id, child_deleted, child_cost in rows:
+            if child_deleted:
+                child_id = None
+            if child_id is not None and child_id not in output_quantities:
+                cached[child_id] = child_cost
+            bom_lines[bom_id].append((quantity, unit_cost, child_id))
+
+        costs = result.costs
+        failed = set()
+        path = []
+
+        def cost_of(bom_id):
+            if bom_id in costs:
+                return costs[bom_id]
+            if bom_id in failed:
+                return None
+            if bom_id not in output_quantities:
+                return cached.get(bom_id)
+            if bom_id in path:
+                raise BOMCycleError(path[path.index(bom_id):] + [bom_id])
+            path.append(bom_id)
+            try:
+                total = Decimal('0')
+                for quantity, unit_cost, child_id in bom_lines[bom_id]:
+                    line_cost = unit_cost if child_id is None else cost_of(child_id)
+                    if line_cost is None:
+                        # A sub-assembly that could not be costed keeps its parents stale too.
+                        failed.add(bom_id)
+                        result.errors[bom_id] = UNCOSTED_CHILD % child_id
+                        return None
+                    total += quantity * line_cost
+            except BOMCycleError as exc:
+                # Every BOM on the walk that reached the cycle stays stale.
+                failed.add(bom_id)
+                result.errors[bom_id] = str(exc)
+                raise
+            finally:
+                path.pop()
+            costs[bom_id] = _quantize(total / _output_quantity(output_quantities[bom_id]))
+            return costs[bom_id]
+
+        for bom_id in output_quantities:
+            try:
+                cost_of(bom_id)
+            except BOMCycleError:
+                # cost_of has recorded every BOM of the walk as failed.
+                pass
+
+        BillOfMaterials.objects.bulk_update(
+            [BillOfMaterials(pk=bom_id, unit_cost=cost) for bom_id, cost in costs.items()],
+            ['unit_cost'], batch_size=UPDATE_BATCH_SIZE,
+        )
+        if costs:
+            versions.bump(hub_id, BillOfMaterials)
+    return result
+
+
+def bom_unit_cost(bom):
+    """The rolled-up unit cost of ``bom``, recosting the hub's stale BOMs first if needed."""
+    if bom.unit_cost is None:
+        cost = recost_boms(bom.hub_id).costs.get(bom.pk)
+        if cost is not None:
+            bom.unit_cost = cost
+    return bom.unit_cost
@@ -0,0 +1,146 @@
+"""
+Incrementally maintained dashboard counters.
+
+``ManufacturingCounters`` holds one row per hub with the number of live
+records per model, per production order status and per batch quality
+status. Single-row saves are tracked by the signal handlers in
+``signals.py``; bulk paths that bypass signals (``QuerySet.update`` and
+``bulk_create``) must go through ``bulk_soft_delete`` / ``apply_deltas``.
+``reconcile_hubs`` recomputes rows from scratch and is what the
+``manufacturing_reconcile_counters`` command runs.
+"""
+from collections import Counter
+from uuid import UUID
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from ..models import (
+    PROD_STATUS, QUALITY_STATUS,
+    BillOfMaterials, BOMLine, ManufacturingCounters, ProductionBatch, ProductionOrder,
+)
+from . import versions
+
+TOTAL_FIELDS = {
+    BillOfMaterials: 'bill_of_materialses',
+    BOMLine: 'bom_lines',
+    ProductionOrder: 'production_orders',
+    ProductionBatch: 'batches',
+}
+
+STATUS_FIELDS = {
+    ProductionOrder: ('status', {status: f'orders_{status}' for status, _label in PROD_STATUS}),
+    ProductionBatch: ('quality_status', {status: f'batches_{status}' for status, _label in QUALITY_STATUS}),
+}
+
+
+def counter_fields(model, status=None):
+    """Counter columns incremented by one live ``model`` row with ``status``."""
+    fields = [TOTAL_FIELDS[model]]
+    if model in STATUS_FIELDS:
+        field = STATUS_FIELDS[model][1].get(status)
+        if field:
+            fields.append(field)
+    return fields
+
+
+def row_deltas(model, status=None, sign=1):
+    return Counter({field: sign for field in counter_fields(model, status)})
+
+
+def queryset_deltas(qs, sign=1):
+    """Counter deltas for every live row of ``qs``, in one grouped query."""
+    model = qs.model
+    qs = qs.filter(is_deleted=False).order_by()
+    deltas = Counter()
+    if model in STATUS_FIELDS:
+        status_field = STATUS_FIELDS[model][0]
+        for row in qs.values(status_field).annotate(n=Count('pk')):
+            for field in counter_fields(model, row[status_field]):
+                deltas[field] += sign * row['n']
+    else:
+        deltas[TOTAL_FIELDS[model]] += sign * qs.count()
+    return deltas
+
+
+def objects_deltas(objs, sign=1):
+    """Counter deltas for freshly created (e.g. ``bulk_create``) live objects."""
+    deltas = Counter()
+    for obj in objs:
+        if obj.is_deleted:
+            continue
+        model = type(obj)
+        status = getattr(obj, STATUS_FIELDS[model][0]) if model in STATUS_FIELDS else None
+        deltas.update(row_deltas(model, status, sign))
+    return deltas
+
+
+def apply_deltas(hub_id, deltas):
+    """Atomically add ``deltas`` to the hub's counters, seeding the row if missing."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if hub_id is None or not deltas:
+        return
+    updated = ManufacturingCounters.objects.filter(pk=hub_id).update(
+        updated_at=timezone.now(),
+        **{field: F(field) + delta for field, delta in deltas.items()},
+    )
+    if not updated:
+        # Callers apply deltas after the change, so a full recount already
+        # includes it.
+        reconcile_hubs([hub_id])
+
+
+def bulk_soft_delete(qs, hub_id):
+    """Soft-delete every row of ``qs`` with one UPDATE and adjust the counters and version."""
+    with transaction.atomic():
+        deltas = queryset_deltas(qs, sign=-1)
+        count = qs.filter(is_deleted=False).update(is_deleted=True, deleted_at=timezone.now())
+        apply_deltas(hub_id, deltas)
+        if count:
+            versions.bump(hub_id, qs.model)
+    return count
+
+
+def _grouped_counts(model, hub_ids):
+    qs = model.all_objects.filter(hub_id__in=hub_ids, is_deleted=False).order_by()
+    counts = {}
+    if model in STATUS_FIELDS:
+        status_field = STATUS_FIELDS[model][0]
+        rows = qs.values('hub_id', status_field).annotate(n=Count('pk'))
+        for row in rows:
+            hub_counts = counts.setdefault(row['hub_id'], Counter())
+            for field in counter_fields(model, row[status_field]):
+                hub_counts[field] += row['n']
+    else:
+        for row in qs.values('hub_id').annotate(n=Count('pk')):
+            counts.setdefault(row['hub_id'], Counter())[TOTAL_FIELDS[model]] += row['n']
+    return counts
+
+
+def reconcile_hubs(hub_ids):
+    """Recompute the counters of ``hub_ids`` from the live tables."""
+    hub_ids = [UUID(str(hub_id)) for hub_id in hub_ids]
+    totals = {hub_id: Counter() for hub_id in hub_ids}
+    for model in TOTAL_FIELDS:
+        for hub_id, counts in _grouped_counts(model, hub_ids).items():
+            totals.setdefault(hub_id, Counter()).update(counts)
+
+    all_fields = [f.name for f in ManufacturingCounters._meta.fields if f.name not in ('hub_id', 'updated_at')]
+    for hub_id, counts in totals.items():
+        values = {field: counts.get(field, 0) for field in all_fields}
+        try:
+            with transaction.atomic():
+                ManufacturingCounters.objects.update_or_create(pk=hub_id, defaults=values)
+        except IntegrityError:
+            # Another worker seeded the row concurrently.
+            ManufacturingCounters.objects.filter(pk=hub_id).update(**values)
+
+
+def get_counters(hub_id):
+    """Return the hub's counters, computing them on first use."""
+    counters = ManufacturingCounters.objects.filter(pk=hub_id).first()
+    if counters is None and hub_id:
+        reconcile_hubs([hub_id])
+        counters = ManufacturingCounters.objects.filter(pk=hub_id).first()
+    return counters
@@ -0,0 +1,118 @@
+"""
+Expiry watch: live batches and production orders expiring within N days.
+
+Every query is a range scan of the partial ``(hub_id, expiry_date)``
+indexes, bounded to ``[today, today + days]``, so the cost depends on the
+batches in the window, not on the size of the batch table. The dashboard
+widget needs one grouped ``COUNT`` over that range; the list view and the
+daily digest read the rows in expiry date order.
+"""
+from datetime import timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import QUALITY_STATUS, ManufacturingCounters, ProductionBatch, ProductionOrder
+
+DEFAULT_DAYS = 7
+MAX_DAYS = 365
+DIGEST_CHUNK_SIZE = 500
+
+
+class ExpiryGroup:
+    """The batches of one quality status in the window, soonest first."""
+
+    def __init__(self, status, label):
+        self.status = status
+        self.label = label
+        self.batches = []
+
+    def __len__(self):
+        return len(self.batches)
+
+
+class ExpiryWatch:
+    def __init__(self, start, end, groups, orders):
+        self.start = start
+        self.end = end
+        self.groups = groups
+        self.orders = orders
+
+    @property
+    def days(self):
+        return (self.end - self.start).days
+
+    @property
+    def batches_count(self):
+        return sum(len(group) for group in self.groups)
+
+    def __bool__(self):
+        return bool(self.batches_count or self.orders)
+
+
+def clamp_days(value, default=DEFAULT_DAYS):
+    try:
+        days = int(value)
+    except (TypeError, ValueError):
+        return default
+    return min(max(days, 0), MAX_DAYS)
+
+
+def expiry_window(days, today=None):
+    """``(start, end)`` dates, both inclusive, of a ``days`` long watch from ``today``."""
+    start = today or timezone.localdate()
+    return start, start + timedelta(days=days)
+
+
+def expiring_batches(hub_id, start, end):
+    return (
+        ProductionBatch.objects.filter(hub_id=hub_id, is_deleted=False, expiry_date__range=(start, end))
+        .order_by('expiry_date', 'batch_number')
+    )
+
+
+def expiring_orders(hub_id, start, end):
+    return (
+        ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False, expiry_date__range=(start, end))
+        .exclude(status='cancelled')
+        .order_by('expiry_date', 'order_number')
+    )
+
+
+def expiry_summary(hub_id, days, today=None):
+    """``[(status, label, count), ...]`` of the batches expiring in the window, in QUALITY_STATUS order."""
+    start, end = expiry_window(days, today)
+    counts = dict(
+        expiring_batches(hub_id, start, end).order_by()
+        .values_list('quality_status').annotate(count=Count('pk'))
+    )
+    return [(status, label, counts.get(status, 0)) for status, label in QUALITY_STATUS]
+
+
+def expiry_watch(hub_id, days, today=None):
+    start, end = expiry_window(days, today)
+    groups = {status: ExpiryGroup(status, label) for status, label in QUALITY_STATUS}
+    batches = expiring_batches(hub_id, start, end).select_related('production_order')
+    for batch in batches:
+        group = groups.get(batch.quality_status)
+        if group is None:
+            group = groups[batch.quality_status] = ExpiryGroup(batch.quality_status, batch.quality_status)
+        group.batches.append(batch)
+    orders = list(expiring_orders(hub_id, start, end))
+    return ExpiryWatch(start, end, [group for group in groups.values() if group.batches], orders)
+
+
+def watched_hubs():
+    """Hubs with live batches, from the counters table instead of a scan of the batches."""
+    return sorted(
+        ManufacturingCounters.objects.filter(batches__gt=0).values_list('hub_id', flat=True),
+        key=str,
+    )
+
+
+def digest_batches(hub_id, start, end, chunk_size=DIGEST_CHUNK_SIZE):
+    """Stream the batches of the window in expiry date order, for the daily digest."""
+    rows = expiring_batches(hub_id, start, end).values_list(
+        'expiry_date', 'batch_number', 'quality_status', 'quantity_produced', 'production_order__order_number',
+    )
+    return rows.iterator(chunk_size=chunk_size)
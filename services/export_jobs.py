@@ -0,0 +1,256 @@
+"""
+Background list exports.
+
+``start_export`` records an ``ExportJob`` and hands its id to an executor
+once the transaction commits. The worker rebuilds the queryset from the
+job's parameters (search query and ordering, as chosen in the list),
+streams it with ``values_list(...).iterator()`` and writes it chunk by
+chunk to a file under ``MANUFACTURING_EXPORT_ROOT``: CSV directly, XLSX
+through an openpyxl write-only workbook, so memory stays flat. Progress is
+saved after every chunk with a single-row ``UPDATE`` for the polling view.
+
+The executor is pluggable through ``MANUFACTURING_EXPORT_EXECUTOR`` (the
+dotted path of a class with ``submit(fn, *args)``): an in-process thread
+pool by default, ``SyncExecutor`` to run exports inline (tests, scripts).
+"""
+import csv
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from ..exports import EXPORT_CHUNK_SIZE
+from ..models import BatchIngredient, BillOfMaterials, BOMLine, ExportJob, ProductionOrder
+from .search import search_queryset
+from .yields import annotate_yield
+
+THREAD_POOL_SIZE = 2
+
+# ``annotate`` adds computed columns to the queryset before it is ordered.
+ExportSpec = namedtuple('ExportSpec', 'model columns headers default_order annotate', defaults=(None,))
+
+EXPORTS = {
+    'bill_of_materialses': ExportSpec(
+        BillOfMaterials,
+        ['code', 'name', 'is_active', 'output_quantity', 'unit_cost', 'notes'],
+        ['Code', 'Name', 'Is Active', 'Output Quantity', 'Unit Cost', 'Notes'],
+        'code',
+    ),
+    'bom_lines': ExportSpec(
+        BOMLine,
+        ['bom__name', 'quantity', 'description', 'unit'],
+        ['BillOfMaterials', 'Quantity', 'Description', 'Unit'],
+        'bom',
+    ),
+    'production_orders': ExportSpec(
+        ProductionOrder,
+        [
+            'order_number', 'bom__name', 'status', 'quantity', 'start_date', 'end_date',
+            'produced_quantity', 'approved_quantity', 'rejected_quantity', 'yield_percent', 'variance',
+        ],
+        [
+            'Order Number', 'BillOfMaterials', 'Status', 'Quantity', 'Start Date', 'End Date',
+            'Produced', 'Approved', 'Rejected', 'Yield %', 'Variance',
+        ],
+        'order_number',
+        annotate_yield,
+    ),
+    # One row per ingredient of every batch of the (searched) orders.
+    'production_ingredients': ExportSpec(
+        BatchIngredient,
+        [
+            'batch__production_order__order_number', 'batch__production_order__bom__name',
+            'batch__batch_number', 'batch__production_date', 'batch__quality_status',
+            'description', 'supplier_lot', 'source_batch__batch_number',
+            'quantity_used', 'unit', 'base_quantity', 'base_unit',
+        ],
+        [
+            'Order Number', 'BOM', 'Batch Number', 'Production Date', 'Quality Status',
+            'Ingredient', 'Supplier Lot', 'Source Batch',
+            'Quantity Used', 'Unit', 'Base Quantity', 'Base Unit',
+        ],
+        'batch__production_order__order_number',
+    ),
+}
+
+EXTENSIONS = {'csv': 'csv', 'xlsx': 'xlsx'}
+
+
+class SyncExecutor:
+    """Runs the export in the calling thread."""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class ThreadExecutor:
+    """Runs exports on a small in-process thread pool."""
+
+    def __init__(self, max_workers=THREAD_POOL_SIZE):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='manufacturing-export')
+
+    def submit(self, fn, *args):
+        return self._pool.submit(self._run, fn, *args)
+
+    @staticmethod
+    def _run(fn, *args):
+        try:
+            fn(*args)
+        finally:
+            # Worker threads own their connections; don't leave them open.
+            connections.close_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            path = getattr(settings, 'MANUFACTURING_EXPORT_EXECUTOR', None)
+            _executor = import_string(path)() if path else ThreadExecutor()
+        return _executor
+
+
+def export_root():
+    root = getattr(settings, 'MANUFACTURING_EXPORT_ROOT', None)
+    if not root:
+        media_root = getattr(settings, 'MEDIA_ROOT', '') or tempfile.gettempdir()
+        root = os.path.join(media_root, 'manufacturing_exports')
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def export_path(job):
+    return os.path.join(export_root(), job.file_name)
+
+
+def export_queryset(job):
+    """The rows of ``job``: the hub's live rows, searched and ordered as in the list."""
+    spec = EXPORTS[job.kind]
+    params = job.params or {}
+    query = params.get('q', '')
+    if spec.model is BatchIngredient:
+        qs = BatchIngredient.objects.filter(
+            hub_id=job.hub_id, is_deleted=False, batch__is_deleted=False,
+            batch__production_order__is_deleted=False,
+        )
+        if query:
+            orders = search_queryset(ProductionOrder.objects.filter(hub_id=job.hub_id, is_deleted=False), query)
+            qs = qs.filter(batch__production_order__in=orders.values('pk'))
+        return qs.order_by(spec.default_order, 'batch__batch_number', 'description')
+    qs = spec.model.objects.filter(hub_id=job.hub_id, is_deleted=False)
+    if query:
+        qs = search_queryset(qs, query)
+    if spec.annotate is not None:
+        qs = spec.annotate(qs)
+    return qs.order_by(params.get('order_by') or spec.default_order, 'pk')
+
+
+def start_export(hub_id, kind, file_format, params=None):
+    """Record an export job and queue it once the current transaction commits."""
+    if kind not in EXPORTS:
+        raise ValueError(f'Unknown export: {kind!r}')
+    if file_format not in EXTENSIONS:
+        raise ValueError(f'Unknown export format: {file_format!r}')
+    job = ExportJob.objects.create(hub_id=hub_id, kind=kind, file_format=file_format, params=params or {})
+    transaction.on_commit(lambda: get_executor().submit(run_export, job.pk))
+    return job
+
+
+def _save_progress(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    ExportJob.objects.filter(pk=job.pk).update(updated_at=timezone.now(), **fields)
+
+
+def _csv_writer(path):
+    handle = open(path, 'w', newline='', encoding='utf-8')
+    writer = csv.writer(handle)
+    return writer.writerows, handle.close
+
+
+def _xlsx_cell(value):
+    # openpyxl rejects timezone-aware datetimes.
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+def _xlsx_writer(path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+
+    def write(rows):
+        for row in rows:
+            sheet.append([_xlsx_cell(value) for value in row])
+
+    return write, lambda: workbook.save(path)
+
+
+def run_export(job_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """Write the export file of ``job_id``; failures are recorded on the job."""
+    # Claim the job in one UPDATE so two workers never both run it.
+    now = timezone.now()
+    claimed = ExportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=now, updated_at=now,
+    )
+    if claimed != 1:
+        return None
+    job = ExportJob.objects.get(pk=job_id)
+    spec = EXPORTS[job.kind]
+    file_name = f'{job.kind}-{job.pk}.{EXTENSIONS[job.file_format]}'
+    path = os.path.join(export_root(), file_name)
+    _save_progress(job, file_name=file_name)
+    try:
+        qs = export_queryset(job)
+        _save_progress(job, rows_total=qs.count())
+        open_writer = _xlsx_writer if job.file_format == 'xlsx' else _csv_writer
+        write, finish = open_writer(path)
+        try:
+            write([spec.headers])
+            chunk = []
+            done = 0
+            for row in qs.values_list(*spec.columns).iterator(chunk_size=chunk_size):
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    write(chunk)
+                    done += len(chunk)
+                    chunk = []
+                    _save_progress(job, rows_done=done)
+            write(chunk)
+            done += len(chunk)
+        finally:
+            finish()
+    except Exception as exc:
+        if os.path.exists(path):
+            os.remove(path)
+        _save_progress(job, status='failed', error=str(exc) or exc.__class__.__name__, finished_at=timezone.now())
+        return job
+    _save_progress(job, status='done', rows_done=done, finished_at=timezone.now())
+    return job
+
+
+def purge_exports(before):
+    """Delete the jobs created before ``before`` and their files. Returns the number of jobs."""
+    jobs = ExportJob.all_objects.filter(created_at__lt=before)
+    count = 0
+    for job in jobs.only('pk', 'file_name').iterator():
+        if job.file_name:
+            path = export_path(job)
+            if os.path.exists(path):
+                os.remove(path)
+        count += 1
+    jobs.delete()
+    return count
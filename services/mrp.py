@@ -0,0 +1,109 @@
+"""
+Material requirements planning (MRP).
+
+Gross requirements are computed set-based: open production orders are
+aggregated in the database per (BOM, start date), the BOM graph of the
+distinct BOMs is loaded once, and every aggregate is exploded in memory
+into leaf components keyed by component and date bucket.
+"""
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Count, Sum
+
+from ..models import ProductionOrder
+from .bom_explosion import BOMCycleError, BOMExploder, BOMGraph
+
+OPEN_STATUSES = ('confirmed', 'in_progress')
+
+BUCKETS = ('day', 'week', 'month')
+
+ComponentRequirement = namedtuple(
+    'ComponentRequirement', ['component', 'gross', 'on_hand', 'net', 'buckets'],
+)
+
+
+class MRPResult:
+    """Requirements per component, split by start-date bucket."""
+
+    def __init__(self, bucket, buckets, requirements, orders_count, errors):
+        self.bucket = bucket
+        self.buckets = buckets
+        self.requirements = requirements
+        self.orders_count = orders_count
+        self.errors = errors
+
+    def __iter__(self):
+        return iter(self.requirements)
+
+    def __len__(self):
+        return len(self.requirements)
+
+
+def bucket_start(day, bucket='week'):
+    """Return the first day of the bucket containing ``day`` (None stays None)."""
+    if day is None or bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    raise ValueError(f'Unknown bucket: {bucket}')
+
+
+def compute_requirements(hub_id, bucket='week', on_hand=None):
+    """
+    Compute material requirements for every open production order of a hub.
+
+    ``on_hand`` optionally maps ``Component`` to an available quantity that
+    is netted off the gross requirement. Orders without a start date are
+    reported in the ``None`` bucket.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'Unknown bucket: {bucket}')
+    on_hand = on_hand or {}
+
+    rows = list(
+        ProductionOrder.objects
+        .filter(hub_id=hub_id, is_deleted=False, status__in=OPEN_STATUSES, bom__isnull=False)
+        .values('bom_id', 'start_date')
+        .annotate(total=Sum('quantity'), orders=Count('id'))
+        .order_by()
+    )
+
+    graph = BOMGraph.load({row['bom_id'] for row in rows}, hub_id=hub_id)
+    exploder = BOMExploder(graph)
+
+    gross = defaultdict(lambda: defaultdict(Decimal))
+    errors = {}
+    orders_count = 0
+    for row in rows:
+        bom_id = row['bom_id']
+        if bom_id in errors:
+            continue
+        try:
+            exploded = exploder.explode(bom_id, row['total'])
+        except BOMCycleError as exc:
+            errors[bom_id] = exc
+            continue
+        orders_count += row['orders']
+        key = bucket_start(row['start_date'], bucket)
+        for component, quantity in exploded.items():
+            gross[component][key] += quantity
+
+    buckets = sorted({key for per_bucket in gross.values() for key in per_bucket},
+                     key=lambda d: (d is None, d or date.min))
+    requirements = []
+    for component in sorted(gross, key=lambda c: (c.description.lower(), c.unit)):
+        per_bucket = gross[component]
+        total = sum(per_bucket.values(), Decimal('0'))
+        available = Decimal(on_hand.get(component, 0))
+        requirements.append(ComponentRequirement(
+            component=component,
+            gross=total,
+            on_hand=available,
+            net=max(total - available, Decimal('0')),
+            buckets=[per_bucket.get(key, Decimal('0')) for key in buckets],
+        ))
+    return MRPResult(bucket, buckets, requirements, orders_count, errors)
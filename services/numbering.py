@@ -0,0 +1,248 @@
+"""
+Order and batch numbers from per-hub sequences.
+
+A number pattern such as ``PO-{YYYY}-{seq:06}`` mixes literal text, date
+tokens (``{YYYY}``, ``{YY}``, ``{MM}``, ``{DD}``) and exactly one ``{seq}``
+(``{seq:06}`` pads it to six digits). Everything but the sequence value is
+the prefix, and every prefix has its own ``NumberSequence`` row, so a
+yearly pattern starts again from 1 each year.
+
+``reserve`` advances a row with a single ``UPDATE ... SET last_value =
+last_value + n`` and reads it back in the same transaction: the row lock
+taken by the update serialises concurrent workers, and each gets a
+distinct range of ``n`` numbers. ``NumberAllocator`` reserves a block at
+a time and hands it out from memory, so a busy worker takes the row lock
+once per block instead of once per number; numbers of a block it never
+hands out are skipped, never reused. The unique constraints on the live
+numbers are the last line of defence against numbers typed in by hand;
+``save_numbered`` moves on to the next number when it hits one.
+"""
+import re
+import threading
+from collections import deque
+from datetime import date
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import (
+    BATCH_NUMBER_PATTERN, ORDER_NUMBER_PATTERN,
+    ManufacturingSettings, NumberSequence, ProductionBatch, ProductionOrder,
+)
+
+MAX_LENGTH = 50
+DEFAULT_BLOCK_SIZE = 50
+SAVE_ATTEMPTS = 5
+
+TOKEN_RE = re.compile(r'\{(\w+)(?::0*(\d+))?\}')
+DATE_TOKENS = {'YYYY': '%Y', 'YY': '%y', 'MM': '%m', 'DD': '%d'}
+SEQ = '{seq}'
+# Any date renders the date tokens at their full width.
+SAMPLE_DATE = date(2000, 1, 1)
+
+# kind -> (model, number field, settings pattern field, default pattern)
+KINDS = {
+    'order': (ProductionOrder, 'order_number', 'order_number_pattern', ORDER_NUMBER_PATTERN),
+    'batch': (ProductionBatch, 'batch_number', 'batch_number_pattern', BATCH_NUMBER_PATTERN),
+}
+
+
+class PatternError(ValueError):
+    pass
+
+
+class NumberPattern:
+    """A parsed number pattern."""
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.parts = []
+        self.width = None
+        position = 0
+        for match in TOKEN_RE.finditer(pattern):
+            self._literal(pattern[position:match.start()])
+            name, width = match.groups()
+            if name == 'seq':
+                if self.width is not None:
+                    raise PatternError('The pattern must contain {seq} only once.')
+                self.width = int(width or 0)
+                self.parts.append(SEQ)
+            elif name in DATE_TOKENS and width is None:
+                self.parts.append(('date', DATE_TOKENS[name]))
+            else:
+                raise PatternError('Unknown token "%s" in the pattern.' % match.group())
+            position = match.end()
+        self._literal(pattern[position:])
+        if self.width is None:
+            raise PatternError('The pattern must contain {seq}.')
+        if len(self._render(SAMPLE_DATE, '0' * max(self.width, 1))) > MAX_LENGTH:
+            raise PatternError('Numbers of this pattern are longer than %d characters.' % MAX_LENGTH)
+
+    def _literal(self, text):
+        if '{' in text or '}' in text:
+            raise PatternError('Unbalanced brace in the pattern.')
+        if text:
+            self.parts.append(text)
+
+    def _render(self, today, seq):
+        out = []
+        for part in self.parts:
+            if part is SEQ:
+                out.append(seq)
+            elif isinstance(part, tuple):
+                out.append(today.strftime(part[1]))
+            else:
+                out.append(part)
+        return ''.join(out)
+
+    def prefix(self, today):
+        """The pattern rendered for ``today`` with ``{seq}`` left in: the sequence it draws from."""
+        return self._render(today, SEQ)
+
+    def render(self, today, value):
+        number = self._render(today, str(value).zfill(self.width))
+        if len(number) > MAX_LENGTH:
+            raise PatternError('Number %s is longer than %d characters.' % (number, MAX_LENGTH))
+        return number
+
+
+def parse_pattern(pattern):
+    if isinstance(pattern, NumberPattern):
+        return pattern
+    return NumberPattern(pattern or '')
+
+
+def hub_pattern(hub_id, kind):
+    settings = ManufacturingSettings.for_hub(hub_id)
+    return parse_pattern(getattr(settings, KINDS[kind][2]) or KINDS[kind][3])
+
+
+def _advance(hub_id, key, count):
+    """Add ``count`` to the sequence ``key`` of ``hub_id``, seeding the row if missing; returns the new last value."""
+    updated = NumberSequence.objects.filter(hub_id=hub_id, key=key).update(
+        last_value=F('last_value') + count, updated_at=timezone.now(),
+    )
+    if updated:
+        return NumberSequence.objects.filter(hub_id=hub_id, key=key).values_list('last_value', flat=True).get()
+    try:
+        with transaction.atomic():
+            NumberSequence.objects.create(hub_id=hub_id, key=key, last_value=count)
+    except IntegrityError:
+        # Another worker seeded the row concurrently.
+        return _advance(hub_id, key, count)
+    return count
+
+
+def reserve(hub_id, kind, count=1, today=None, pattern=None):
+    """
+    Allocate ``count`` consecutive numbers of ``kind`` ('order' or 'batch')
+    for ``hub_id`` from the hub's pattern (or ``pattern``) and return them
+    in order.
+    """
+    if hub_id is None:
+        raise ValueError('Numbers are allocated per hub.')
+    pattern = parse_pattern(pattern) if pattern else hub_pattern(hub_id, kind)
+    today = today or timezone.localdate()
+    key = f'{kind}:{pattern.prefix(today)}'
+    with transaction.atomic():
+        last = _advance(hub_id, key, count)
+    return [pattern.render(today, value) for value in range(last - count + 1, last + 1)]
+
+
+def next_number(hub_id, kind, today=None):
+    return reserve(hub_id, kind, 1, today)[0]
+
+
+class NumberAllocator:
+    """
+    Numbers of one kind for one hub, reserved ``block_size`` at a time and
+    shared by the threads of a worker. A new block is reserved when the
+    current one runs out or the date moves the pattern to a new prefix.
+    """
+
+    def __init__(self, hub_id, kind, block_size=DEFAULT_BLOCK_SIZE, pattern=None):
+        self.hub_id = hub_id
+        self.kind = kind
+        self.block_size = block_size
+        self.pattern = parse_pattern(pattern) if pattern else hub_pattern(hub_id, kind)
+        self._lock = threading.Lock()
+        self._prefix = None
+        self._free = deque()
+
+    def next(self, today=None):
+        today = today or timezone.localdate()
+        prefix = self.pattern.prefix(today)
+        with self._lock:
+            if prefix != self._prefix or not self._free:
+                self._free = deque(reserve(self.hub_id, self.kind, self.block_size, today, self.pattern))
+                self._prefix = prefix
+            return self._free.popleft()
+
+
+def save_numbered(obj, kind, allocator=None):
+    """
+    Save the new ``obj`` under the next number of ``kind``. A number already
+    taken by hand makes the insert fail on the unique constraint; the next
+    one is tried, up to ``SAVE_ATTEMPTS`` numbers.
+    """
+    field = KINDS[kind][1]
+    for attempt in range(SAVE_ATTEMPTS):
+        number = allocator.next() if allocator else next_number(obj.hub_id, kind)
+        setattr(obj, field, number)
+        try:
+            with transaction.atomic():
+                obj.save()
+            return obj
+        except IntegrityError:
+            if attempt == SAVE_ATTEMPTS - 1:
+                raise
+
+
+def backfill(model, field, kind, settings_model, sequence_model):
+    """
+    Make the live numbers of ``model`` unique per hub before the unique
+    constraint is added (migration 0014): blank numbers get a number of the
+    hub's pattern dated by the row's creation, later duplicates a ``-2``,
+    ``-3``, ... suffix. Takes historical models.
+    """
+    rows = (
+        model.objects.filter(is_deleted=False, hub_id__isnull=False)
+        .order_by('hub_id', 'created_at', 'pk')
+        .values_list('pk', 'hub_id', field, 'created_at')
+    )
+    taken = {}
+    for hub_id, number in model.objects.filter(is_deleted=False).values_list('hub_id', field):
+        taken.setdefault(hub_id, set()).add(number)
+    seen = set()
+    patterns = {}
+    sequences = {}
+    for pk, hub_id, number, created_at in list(rows):
+        if number and (hub_id, number) not in seen:
+            seen.add((hub_id, number))
+            continue
+        hub_taken = taken[hub_id]
+        if number:
+            suffix = 2
+            while True:
+                candidate = f'{number[:MAX_LENGTH - len(str(suffix)) - 1]}-{suffix}'
+                if candidate not in hub_taken:
+                    break
+                suffix += 1
+        else:
+            if hub_id not in patterns:
+                settings = settings_model.objects.filter(pk=hub_id).first()
+                patterns[hub_id] = parse_pattern(getattr(settings, KINDS[kind][2], None) or KINDS[kind][3])
+            pattern = patterns[hub_id]
+            today = created_at.date() if created_at else timezone.localdate()
+            key = (hub_id, f'{kind}:{pattern.prefix(today)}')
+            while True:
+                sequences[key] = sequences.get(key, 0) + 1
+                candidate = pattern.render(today, sequences[key])
+                if candidate not in hub_taken:
+                    break
+        hub_taken.add(candidate)
+        seen.add((hub_id, candidate))
+        model.objects.filter(pk=pk).update(**{field: candidate})
+    for (hub_id, key), last_value in sequences.items():
+        sequence_model.objects.update_or_create(hub_id=hub_id, key=key, defaults={'last_value': last_value})
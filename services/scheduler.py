@@ -0,0 +1,246 @@
+"""
+Finite-capacity scheduling of confirmed production orders.
+
+Every order is assigned to a resource: its BOM when the BOM has a
+``daily_capacity`` of its own (a dedicated line), otherwise the hub-wide
+line whose capacity is ``ManufacturingSettings.daily_capacity``. Capacity
+is in output units per working day.
+
+Orders are popped from one heap in earliest-due-date order (orders without
+a due date last, then oldest first) and loaded forward from today onto
+their resource's calendar: an order starts on the first day with free
+capacity and ends on the day its quantity is used up. In-progress orders
+keep their dates and book their quantity on those days before anything is
+placed.
+
+``schedule_jobs`` is the pure in-memory engine. ``schedule_hub`` loads
+the hub's orders with one query, runs it and writes back only the dates
+that changed: one ``UPDATE ... WHERE id IN (...)`` per distinct
+``(start_date, end_date)`` pair (split every ``UPDATE_BATCH_SIZE`` ids),
+so the number of statements grows with the distinct slots, not with the
+orders. ``reschedule_order`` does the same for the resources a single
+changed order belongs to.
+"""
+import heapq
+from collections import defaultdict, namedtuple
+from datetime import date, timedelta
+from decimal import ROUND_CEILING, Decimal
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import BillOfMaterials, ManufacturingSettings, ProductionOrder
+from . import versions
+
+HUB_RESOURCE = 'hub'
+SCHEDULED_STATUSES = ('confirmed', 'in_progress')
+UPDATE_BATCH_SIZE = 500
+
+Job = namedtuple('Job', 'id resource quantity due created')
+Booking = namedtuple('Booking', 'resource start end quantity')
+
+_ZERO = Decimal('0')
+_UNCHANGED = object()
+
+
+class ScheduleResult:
+    def __init__(self):
+        self.scheduled = {}
+        self.unscheduled = []
+        self.late = []
+        self.changed = 0
+
+    def __len__(self):
+        return len(self.scheduled)
+
+
+def _is_working_day(day, work_on_weekends):
+    return work_on_weekends or day.weekday() < 5
+
+
+def _next_working_day(day, work_on_weekends):
+    day += timedelta(days=1)
+    while not _is_working_day(day, work_on_weekends):
+        day += timedelta(days=1)
+    return day
+
+
+def _add_working_days(day, count, work_on_weekends):
+    """``day`` (a working day) moved ``count`` working days forward."""
+    if work_on_weekends:
+        return day + timedelta(days=count)
+    weeks, count = divmod(count, 5)
+    day += timedelta(weeks=weeks)
+    for _i in range(count):
+        day = _next_working_day(day, work_on_weekends)
+    return day
+
+
+class _Calendar:
+    """Forward-loading cursor over one resource's working days."""
+
+    def __init__(self, capacity, start, work_on_weekends):
+        self.capacity = capacity
+        self.work_on_weekends = work_on_weekends
+        self.day = start if _is_working_day(start, work_on_weekends) else _next_working_day(start, work_on_weekends)
+        self.used = _ZERO
+        self.booked = {}
+        self.last_booked = None
+
+    def book(self, start, end, quantity):
+        """Reserve ``quantity`` spread evenly over the working days ``start``..``end``."""
+        start = max(start or self.day, self.day)
+        end = max(end or start, start)
+        days = []
+        day = start if _is_working_day(start, self.work_on_weekends) else _next_working_day(start, self.work_on_weekends)
+        while day <= end:
+            days.append(day)
+            day = _next_working_day(day, self.work_on_weekends)
+        if not days:
+            days = [day]
+        share = quantity / len(days)
+        for day in days:
+            self.booked[day] = self.booked.get(day, _ZERO) + share
+        self.last_booked = max(self.last_booked or days[-1], days[-1])
+
+    def _free(self):
+        return self.capacity - self.used - self.booked.get(self.day, _ZERO)
+
+    def _advance(self):
+        self.day = _next_working_day(self.day, self.work_on_weekends)
+        self.used = _ZERO
+
+    def take(self, quantity):
+        """Consume ``quantity`` from the cursor on; return ``(start, end)``."""
+        while self._free() <= 0:
+            self._advance()
+        start = self.day
+        remaining = quantity
+        while True:
+            free = self._free()
+            if remaining <= free:
+                self.used += remaining
+                return start, self.day
+            if free > 0:
+                remaining -= free
+                self.used += free
+            self._advance()
+            if self.last_booked is None or self.day > self.last_booked:
+                # No bookings ahead: jump over whole days arithmetically.
+                days = int((remaining / self.capacity).to_integral_value(rounding=ROUND_CEILING))
+                self.day = _add_working_days(self.day, days - 1, self.work_on_weekends)
+                self.used = remaining - (days - 1) * self.capacity
+                return start, self.day
+
+
+def schedule_jobs(jobs, capacities, start, bookings=(), work_on_weekends=False):
+    """
+    Place ``jobs`` onto their resources' calendars in earliest-due-date order.
+
+    ``capacities`` maps resource -> units per day; jobs on a resource without
+    positive capacity are reported as unscheduled.
+    """
+    result = ScheduleResult()
+    calendars = {}
+    for resource, capacity in capacities.items():
+        if capacity and capacity > 0:
+            calendars[resource] = _Calendar(Decimal(capacity), start, work_on_weekends)
+    for booking in bookings:
+        calendar = calendars.get(booking.resource)
+        if calendar is not None and (booking.end is None or booking.end >= start):
+            calendar.book(booking.start, booking.end, Decimal(booking.quantity or 0))
+
+    heap = [(job.due or date.max, job.created, index) for index, job in enumerate(jobs)]
+    heapq.heapify(heap)
+    while heap:
+        _due, _created, index = heapq.heappop(heap)
+        job = jobs[index]
+        calendar = calendars.get(job.resource)
+        if calendar is None:
+            result.unscheduled.append(job.id)
+            continue
+        span = calendar.take(max(Decimal(job.quantity or 0), _ZERO))
+        result.scheduled[job.id] = span
+        if job.due is not None and span[1] > job.due:
+            result.late.append(job.id)
+    return result
+
+
+def _capacities(hub_id, settings):
+    capacities = dict(
+        BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False, daily_capacity__gt=0)
+        .values_list('pk', 'daily_capacity')
+    )
+    capacities[HUB_RESOURCE] = settings.daily_capacity
+    return capacities
+
+
+def _resource_filter(resources, capacities):
+    dedicated = [r for r in resources if r != HUB_RESOURCE]
+    condition = Q(bom_id__in=dedicated)
+    if HUB_RESOURCE in resources:
+        shared = [r for r in capacities if r != HUB_RESOURCE]
+        condition |= Q(bom_id__isnull=True) | ~Q(bom_id__in=shared)
+    return condition
+
+
+def schedule_hub(hub_id, resources=None, today=None):
+    """
+    Schedule the hub's confirmed orders (all resources, or only
+    ``resources``) and save the new dates. Returns the ``ScheduleResult``.
+    """
+    settings = ManufacturingSettings.for_hub(hub_id)
+    capacities = _capacities(hub_id, settings)
+    start = today or timezone.localdate()
+
+    orders = ProductionOrder.objects.filter(
+        hub_id=hub_id, is_deleted=False, status__in=SCHEDULED_STATUSES,
+    ).only('id', 'bom_id', 'quantity', 'status', 'start_date', 'end_date', 'due_date', 'created_at')
+    if resources is not None:
+        orders = orders.filter(_resource_filter(resources, capacities))
+
+    def resource_of(order):
+        return order.bom_id if order.bom_id in capacities else HUB_RESOURCE
+
+    jobs, bookings, confirmed = [], [], {}
+    for order in orders.order_by():
+        if order.status == 'confirmed':
+            confirmed[order.pk] = order
+            jobs.append(Job(order.pk, resource_of(order), order.quantity, order.due_date, order.created_at))
+        else:
+            bookings.append(Booking(resource_of(order), order.start_date, order.end_date, order.quantity))
+
+    result = schedule_jobs(jobs, capacities, start, bookings, settings.work_on_weekends)
+
+    groups = defaultdict(list)
+    for pk, dates in result.scheduled.items():
+        order = confirmed[pk]
+        if (order.start_date, order.end_date) != dates:
+            groups[dates].append(pk)
+    # Orders sharing a date pair get one UPDATE, so the query count follows
+    # the number of distinct slots rather than the number of orders.
+    now = timezone.now()
+    with transaction.atomic():
+        for (start_date, end_date), pks in groups.items():
+            for i in range(0, len(pks), UPDATE_BATCH_SIZE):
+                ProductionOrder.objects.filter(pk__in=pks[i:i + UPDATE_BATCH_SIZE]).update(
+                    start_date=start_date, end_date=end_date, updated_at=now,
+                )
+        if groups:
+            versions.bump(hub_id, ProductionOrder)
+    result.changed = sum(len(pks) for pks in groups.values())
+    return result
+
+
+def reschedule_order(order, previous_bom_id=_UNCHANGED, today=None):
+    """
+    Reschedule only the resource(s) ``order`` is on after it changed; pass
+    ``previous_bom_id`` when its BOM changed so the old line is replanned too.
+    """
+    capacities = _capacities(order.hub_id, ManufacturingSettings.for_hub(order.hub_id))
+    bom_ids = {order.bom_id}
+    if previous_bom_id is not _UNCHANGED:
+        bom_ids.add(previous_bom_id)
+    resources = {bom_id if bom_id in capacities else HUB_RESOURCE for bom_id in bom_ids}
+    return schedule_hub(order.hub_id, resources=resources, today=today)
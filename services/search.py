@@ -0,0 +1,215 @@
+"""
+Indexed search for the datatable lists.
+
+The list views call ``search_queryset(qs, query)``, which delegates to the
+search backend of the queryset's database:
+
+* SQLite: FTS5 tables with the ``trigram`` tokenizer, external-content
+  tables over the model tables kept in sync by triggers (so ``save()`` and
+  ``QuerySet.update()`` are both covered). Trigram matching is
+  case-insensitive substring matching, i.e. the same semantics as
+  ``icontains``, for queries of three characters or more.
+* PostgreSQL: the plain ``icontains`` filter, served by ``pg_trgm`` GIN
+  indexes on ``UPPER(column)``, the expression Django's ``icontains``
+  compiles to.
+* Anything else, or a missing index: the plain ``icontains`` filter.
+
+``install_search_indexes`` creates the backend objects; it runs from the
+migration and again after every ``migrate`` to repair triggers that SQLite
+drops when a migration rebuilds a table.
+"""
+from functools import reduce
+import operator
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+# db_table -> searchable columns. Kept as plain table/column names so the
+# migration does not depend on the current models.
+SEARCH_TABLES = {
+    'manufacturing_billofmaterials': ('name', 'code', 'notes'),
+    'manufacturing_bomline': ('description', 'unit'),
+    'manufacturing_productionorder': ('order_number', 'status', 'notes'),
+}
+
+TRIGRAM_MIN_LENGTH = 3
+
+
+def fts_table(table):
+    return f'{table}_fts'
+
+
+# ----------------------------------------------------------------------
+# Schema objects
+# ----------------------------------------------------------------------
+
+def _sqlite_trigger_sql(table, columns):
+    fts = fts_table(table)
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN '
+        f'INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new}); END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); END",
+        f'CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN '
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); "
+        f'INSERT INTO {fts}(rowid, {cols}) VALUES (new.rowid, {new}); END',
+    ]
+
+
+def _sqlite_supports_trigram(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.manufacturing_fts_probe USING fts5(x, tokenize='trigram')")
+    except Exception:
+        return False
+    cursor.execute('DROP TABLE temp.manufacturing_fts_probe')
+    return True
+
+
+def _install_sqlite(connection, repair_only=False):
+    with connection.cursor() as cursor:
+        if not _sqlite_supports_trigram(cursor):
+            return
+        existing = set(connection.introspection.table_names(cursor))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row[0] for row in cursor.fetchall()}
+        for table, columns in SEARCH_TABLES.items():
+            if table not in existing:
+                continue
+            fts = fts_table(table)
+            expected = {f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+            if fts in existing and expected <= triggers:
+                continue
+            if repair_only and fts not in existing:
+                continue
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5('
+                f"{', '.join(columns)}, content='{table}', content_rowid='rowid', tokenize='trigram')"
+            )
+            for sql in _sqlite_trigger_sql(table, columns):
+                cursor.execute(sql)
+            # Rowids may have changed if the table was rebuilt.
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _install_postgresql(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCH_TABLES.items():
+            for column in columns:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                    f'ON {table} USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+                )
+
+
+def install_search_indexes(connection):
+    """Create (or repair) the search index objects for ``connection``."""
+    if connection.vendor == 'sqlite':
+        _install_sqlite(connection)
+    elif connection.vendor == 'postgresql':
+        _install_postgresql(connection)
+
+
+def repair_search_indexes(sender, using='default', **kwargs):
+    """``post_migrate`` hook: re-create SQLite triggers dropped by table rebuilds."""
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        _install_sqlite(connection, repair_only=True)
+
+
+def remove_search_indexes(connection):
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_TABLES.items():
+            if connection.vendor == 'sqlite':
+                fts = fts_table(table)
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts}')
+            elif connection.vendor == 'postgresql':
+                for column in columns:
+                    cursor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+def rebuild_search_index(connection):
+    """Re-read every row into the SQLite FTS tables (e.g. after VACUUM)."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        existing = set(connection.introspection.table_names(cursor))
+        for table in SEARCH_TABLES:
+            fts = fts_table(table)
+            if fts in existing:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+
+class IcontainsSearchBackend:
+    """Case-insensitive substring match on every searchable column."""
+
+    def filter(self, qs, query):
+        columns = SEARCH_TABLES[qs.model._meta.db_table]
+        return qs.filter(reduce(operator.or_, (Q(**{f'{c}__icontains': query}) for c in columns)))
+
+
+class SQLiteFTSSearchBackend(IcontainsSearchBackend):
+    """FTS5 trigram lookup, falling back to ``icontains`` when it cannot apply."""
+
+    def __init__(self):
+        self._available = {}
+
+    def _has_index(self, connection, table):
+        # Cached either way: without the FTS table (migration not applied,
+        # SQLite built without FTS5) every search would introspect again.
+        key = (connection.alias, table)
+        if key not in self._available:
+            with connection.cursor() as cursor:
+                self._available[key] = fts_table(table) in connection.introspection.table_names(cursor)
+        return self._available[key]
+
+    def filter(self, qs, query):
+        table = qs.model._meta.db_table
+        connection = connections[qs.db]
+        if len(query) < TRIGRAM_MIN_LENGTH or not self._has_index(connection, table):
+            return super().filter(qs, query)
+        fts = fts_table(table)
+        pk = qs.model._meta.pk.column
+        phrase = '"%s"' % query.replace('"', '""')
+        matches = RawSQL(
+            f'SELECT t."{pk}" FROM "{table}" t JOIN "{fts}" f ON f.rowid = t.rowid WHERE "{fts}" MATCH %s',
+            (phrase,),
+        )
+        return qs.filter(pk__in=matches)
+
+
+_backends = {}
+
+
+def get_search_backend(using='default'):
+    connection = connections[using]
+    key = connection.vendor
+    if key not in _backends:
+        path = getattr(settings, 'MANUFACTURING_SEARCH_BACKEND', None)
+        if path:
+            _backends[key] = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backends[key] = SQLiteFTSSearchBackend()
+        else:
+            _backends[key] = IcontainsSearchBackend()
+    return _backends[key]
+
+
+def search_queryset(qs, query):
+    """Filter ``qs`` down to rows matching the datatable search ``query``."""
+    query = query.strip()
+    if not query:
+        return qs
+    return get_search_backend(qs.db).filter(qs, query)
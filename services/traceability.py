@@ -0,0 +1,227 @@
+"""
+Forward and backward lot traceability.
+
+The genealogy is a graph of batches: each ``BatchIngredient`` links the
+batch it was used in to where it came from, either a supplier lot (a leaf)
+or another batch consumed as an ingredient (``source_batch``).
+
+Traces walk that graph breadth-first with one query per generation over
+the indexed ``supplier_lot`` / ``batch`` / ``source_batch`` columns, load
+every batch reached in one more query, and build the tree in memory. A
+batch reached through several paths is expanded once; later occurrences
+are marked ``repeated``.
+
+Archived ingredients and batches (services/archive.py) are part of the
+graph: every edge query is a ``UNION`` with the archived ingredients, so a
+generation still costs one query, and batches not found in the live table
+are restored from the archive, one more query only when there are any.
+"""
+from collections import defaultdict
+
+from django.db.models import DecimalField, F
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+
+from ..models import ArchivedRecord, BatchIngredient, ProductionBatch
+from .archive import archived_batches
+
+MODES = ('lot', 'sources', 'uses')
+
+# Keeps ``IN (...)`` lists under the bound-parameter limit of every backend.
+IN_CHUNK_SIZE = 500
+
+_EDGE_FIELDS = ('batch_id', 'source_batch_id', 'supplier_lot', 'description', 'quantity_used', 'unit')
+
+# Ingredient lookups -> the same lookups on archived ingredients.
+_ARCHIVE_LOOKUPS = {
+    'supplier_lot': 'lot',
+    'batch_id__in': 'parent_id__in',
+    'source_batch_id__in': 'source_id__in',
+}
+
+
+class TraceNode:
+    """A supplier lot or a batch in the trace tree, with the quantity on the edge to its parent."""
+
+    def __init__(self, batch=None, lot='', description='', quantity=None, unit=''):
+        self.batch = batch
+        self.lot = lot
+        self.description = description
+        self.quantity = quantity
+        self.unit = unit
+        self.children = []
+        self.repeated = False
+
+    @property
+    def is_batch(self):
+        return self.batch is not None
+
+    @property
+    def label(self):
+        return self.batch.batch_number if self.batch is not None else self.lot
+
+
+def _batch_order(batch):
+    return batch.production_date is None, batch.production_date, batch.batch_number
+
+
+class TraceResult:
+    def __init__(self, mode, query, roots, batches, lots):
+        self.mode = mode
+        self.query = query
+        self.roots = roots
+        self.batches = sorted(batches.values(), key=_batch_order)
+        self.lots = sorted(lots)
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __bool__(self):
+        return bool(self.roots)
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), IN_CHUNK_SIZE):
+        yield values[start:start + IN_CHUNK_SIZE]
+
+
+def _archived_edges(hub_id, **filters):
+    qs = ArchivedRecord.objects.filter(
+        hub_id=hub_id, model='batchingredient', **{_ARCHIVE_LOOKUPS[name]: value for name, value in filters.items()}
+    )
+    # Annotated in _EDGE_FIELDS order, the column order of the UNION.
+    return qs.annotate(
+        batch_id=F('parent_id'),
+        source_batch_id=F('source_id'),
+        supplier_lot=F('lot'),
+        description=KeyTextTransform('description', 'data'),
+        quantity_used=Cast(KeyTextTransform('quantity_used', 'data'), DecimalField(max_digits=10, decimal_places=2)),
+        unit=KeyTextTransform('unit', 'data'),
+    ).values(*_EDGE_FIELDS).order_by()
+
+
+def _edges(hub_id, **filters):
+    live = BatchIngredient.objects.filter(hub_id=hub_id, is_deleted=False, **filters).values(*_EDGE_FIELDS).order_by()
+    return live.union(_archived_edges(hub_id, **filters), all=True)
+
+
+def _walk(hub_id, frontier, key, follow):
+    """
+    Breadth-first load of ingredient edges: ``{frontier batch id (key): [edge, ...]}``
+    plus every batch id reached through ``follow``.
+    """
+    edges = defaultdict(list)
+    reached = set(frontier)
+    while frontier:
+        next_frontier = set()
+        for chunk in _chunks(frontier):
+            for edge in _edges(hub_id, **{f'{key}__in': chunk}):
+                edges[edge[key]].append(edge)
+                batch_id = edge[follow]
+                if batch_id is not None and batch_id not in reached:
+                    reached.add(batch_id)
+                    next_frontier.add(batch_id)
+        frontier = next_frontier
+    return edges, reached
+
+
+def _load_batches(hub_id, batch_ids):
+    batches = {}
+    for chunk in _chunks(batch_ids):
+        qs = ProductionBatch.objects.filter(hub_id=hub_id, is_deleted=False, pk__in=chunk)
+        batches.update((batch.pk, batch) for batch in qs.select_related('production_order'))
+    missing = set(batch_ids) - set(batches)
+    if missing:
+        batches.update(archived_batches(hub_id, missing))
+    return batches
+
+
+def _edge_order(follow, batches):
+    def key(edge):
+        batch = batches.get(edge[follow])
+        return edge['description'], edge['supplier_lot'], batch.batch_number if batch else ''
+    return key
+
+
+def _expand(pending, edges, follow, batches, lots):
+    """
+    Attach children to every ``(node, batch id)`` of ``pending``, depth-first
+    in display order so the first occurrence of a batch is the expanded one.
+    """
+    stack = list(reversed(pending))
+    expanded = set()
+    order = _edge_order(follow, batches)
+    while stack:
+        node, batch_id = stack.pop()
+        if batch_id in expanded:
+            node.repeated = True
+            continue
+        expanded.add(batch_id)
+        children = []
+        for edge in sorted(edges.get(batch_id, ()), key=order):
+            child_id = edge[follow]
+            if child_id is None:
+                if not edge['supplier_lot']:
+                    continue
+                lots.add(edge['supplier_lot'])
+                node.children.append(TraceNode(
+                    lot=edge['supplier_lot'], description=edge['description'],
+                    quantity=edge['quantity_used'], unit=edge['unit'],
+                ))
+            elif child_id in batches:
+                child = TraceNode(
+                    batches[child_id], description=edge['description'],
+                    quantity=edge['quantity_used'], unit=edge['unit'],
+                )
+                node.children.append(child)
+                children.append((child, child_id))
+        stack.extend(reversed(children))
+
+
+def trace_lot(hub_id, supplier_lot):
+    """Every batch that contains ``supplier_lot``, directly or through intermediate batches."""
+    direct = list(_edges(hub_id, supplier_lot=supplier_lot))
+    edges, reached = _walk(hub_id, {edge['batch_id'] for edge in direct}, 'source_batch_id', 'batch_id')
+    batches = _load_batches(hub_id, reached)
+
+    root = TraceNode(lot=supplier_lot)
+    pending = []
+    for edge in sorted(direct, key=_edge_order('batch_id', batches)):
+        if edge['batch_id'] in batches:
+            child = TraceNode(
+                batches[edge['batch_id']], description=edge['description'],
+                quantity=edge['quantity_used'], unit=edge['unit'],
+            )
+            root.children.append(child)
+            pending.append((child, edge['batch_id']))
+    _expand(pending, edges, 'batch_id', batches, set())
+    roots = [root] if root.children else []
+    return TraceResult('lot', supplier_lot, roots, batches, {supplier_lot} if roots else set())
+
+
+def trace_batch(hub_id, batch_number, mode='sources'):
+    """
+    Genealogy of the batches numbered ``batch_number``: what went into them
+    (``sources``) or which batches they went into (``uses``).
+    """
+    live = ProductionBatch.objects.filter(hub_id=hub_id, is_deleted=False, batch_number=batch_number)
+    archived = ArchivedRecord.objects.filter(hub_id=hub_id, model='productionbatch', lot=batch_number)
+    seeds = list(
+        live.order_by().values_list('pk', flat=True)
+        .union(archived.order_by().values_list('record_id', flat=True), all=True)
+    )
+    key, follow = ('batch_id', 'source_batch_id') if mode == 'sources' else ('source_batch_id', 'batch_id')
+    edges, reached = _walk(hub_id, set(seeds), key, follow)
+    batches = _load_batches(hub_id, reached)
+
+    roots = [TraceNode(batch) for batch in sorted((batches[pk] for pk in seeds if pk in batches), key=_batch_order)]
+    lots = set()
+    _expand([(root, root.batch.pk) for root in roots], edges, follow, batches, lots)
+    return TraceResult(mode, batch_number, roots, batches, lots)
+
+
+def trace(hub_id, query, mode='lot'):
+    if mode == 'lot':
+        return trace_lot(hub_id, query)
+    return trace_batch(hub_id, query, mode)
@@ -0,0 +1,166 @@
+"""
+Unit-of-measure normalization.
+
+``BOMLine.unit`` and ``BatchIngredient.unit`` are free text. Every unit is
+resolved (case-insensitively) to a dimension and a factor to that
+dimension's base unit, from the built-in table below or the hub's own
+``UnitOfMeasure`` rows, which take precedence. The quantity converted to
+the base unit is stored next to the raw one (``base_quantity`` /
+``base_unit``) on every save and bulk import, so aggregates over mixed
+units are a plain ``SUM`` grouped by ``base_unit``. Unknown units are kept
+as they are, lower-cased, so "Box" and "box" still add up.
+
+When a hub unit is added, changed or removed, the affected rows are
+recomputed in the database with one ``UPDATE`` per table.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Case, CharField, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Lower, Trim
+
+from ..models import BASE_UNITS, BatchIngredient, BOMLine, UnitOfMeasure
+from . import versions
+
+Unit = namedtuple('Unit', 'dimension factor')
+
+_MASS = {
+    ('kg', 'kgs', 'kilo', 'kilos', 'kilogram', 'kilograms'): '1',
+    ('g', 'gr', 'grs', 'gram', 'grams', 'gramme', 'grammes'): '0.001',
+    ('mg', 'milligram', 'milligrams'): '0.000001',
+    ('t', 'tonne', 'tonnes', 'ton', 'tons'): '1000',
+    ('lb', 'lbs', 'pound', 'pounds'): '0.45359237',
+    ('oz', 'ounce', 'ounces'): '0.028349523125',
+}
+_VOLUME = {
+    ('l', 'lt', 'ltr', 'liter', 'liters', 'litre', 'litres'): '1',
+    ('dl', 'deciliter', 'decilitre'): '0.1',
+    ('cl', 'centiliter', 'centilitre'): '0.01',
+    ('ml', 'milliliter', 'milliliters', 'millilitre', 'millilitres'): '0.001',
+    ('m3', 'cubic meter', 'cubic metre'): '1000',
+    ('gal', 'gallon', 'gallons'): '3.785411784',
+}
+_LENGTH = {
+    ('m', 'meter', 'meters', 'metre', 'metres'): '1',
+    ('cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'): '0.01',
+    ('mm', 'millimeter', 'millimeters', 'millimetre', 'millimetres'): '0.001',
+    ('km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'): '1000',
+}
+_COUNT = {
+    ('u', 'un', 'unit', 'units', 'pc', 'pcs', 'piece', 'pieces', 'ea', 'each'): '1',
+    ('dozen', 'doz'): '12',
+}
+
+BUILTIN_UNITS = {
+    code: Unit(dimension, Decimal(factor))
+    for dimension, table in (('mass', _MASS), ('volume', _VOLUME), ('length', _LENGTH), ('count', _COUNT))
+    for codes, factor in table.items()
+    for code in codes
+}
+
+# Model -> name of the raw quantity field that ``base_quantity`` mirrors.
+QUANTITY_FIELDS = {BOMLine: 'quantity', BatchIngredient: 'quantity_used'}
+
+
+def unit_key(unit):
+    return (unit or '').strip().lower()
+
+
+def _to_base(quantity, unit, found):
+    quantity = Decimal(quantity or 0)
+    if found is None:
+        return quantity, unit_key(unit)
+    return quantity * found.factor, BASE_UNITS[found.dimension]
+
+
+def _hub_units(hub_id, **filters):
+    rows = UnitOfMeasure.objects.filter(hub_id=hub_id, is_deleted=False, **filters).values_list('code', 'dimension', 'factor')
+    return {unit_key(code): Unit(dimension, factor) for code, dimension, factor in rows}
+
+
+class UnitRegistry:
+    """Built-in units overlaid with one hub's ``UnitOfMeasure`` rows."""
+
+    def __init__(self, custom=None):
+        self.units = dict(BUILTIN_UNITS)
+        self.units.update(custom or {})
+
+    @classmethod
+    def for_hub(cls, hub_id):
+        return cls(_hub_units(hub_id))
+
+    def lookup(self, unit):
+        return self.units.get(unit_key(unit))
+
+    def normalize(self, quantity, unit):
+        """``(base_quantity, base_unit)`` for ``quantity`` expressed in ``unit``."""
+        return _to_base(quantity, unit, self.lookup(unit))
+
+    def convert(self, quantity, from_unit, to_unit):
+        """Convert between two units of the same dimension; ``ValueError`` otherwise."""
+        if unit_key(from_unit) == unit_key(to_unit):
+            return Decimal(quantity)
+        source, target = self.lookup(from_unit), self.lookup(to_unit)
+        if source is None or target is None or source.dimension != target.dimension:
+            raise ValueError(f'Cannot convert {from_unit!r} to {to_unit!r}')
+        return Decimal(quantity) * source.factor / target.factor
+
+
+def normalize_instance(instance, registry=None):
+    """
+    Set ``base_quantity``/``base_unit`` of a ``BOMLine`` or ``BatchIngredient``.
+    Without a ``registry`` the hub's definition of the unit is looked up.
+    """
+    quantity = getattr(instance, QUANTITY_FIELDS[type(instance)])
+    if registry is not None:
+        found = registry.lookup(instance.unit)
+    else:
+        key = unit_key(instance.unit)
+        custom = _hub_units(instance.hub_id, code__iexact=key) if instance.hub_id and key else {}
+        found = custom.get(key) or BUILTIN_UNITS.get(key)
+    instance.base_quantity, instance.base_unit = _to_base(quantity, instance.unit, found)
+
+
+def _conversion(quantity_field, units):
+    """``UPDATE`` values converting rows with the ``units`` (key -> Unit) and keeping the rest as they are."""
+    quantity = F(quantity_field)
+    quantities, base_units = [], []
+    for key, unit in units.items():
+        quantities.append(When(unit__iexact=key, then=quantity * Value(unit.factor)))
+        base_units.append(When(unit__iexact=key, then=Value(BASE_UNITS[unit.dimension])))
+    return {
+        'base_quantity': Case(*quantities, default=quantity, output_field=DecimalField(max_digits=24, decimal_places=6)),
+        'base_unit': Case(*base_units, default=Lower(Trim('unit')), output_field=CharField()),
+    }
+
+
+def renormalize(hub_id, codes):
+    """Recompute, in the database, the base quantities of the hub's rows whose unit is one of ``codes``."""
+    keys = {unit_key(code) for code in codes} - {''}
+    if not keys:
+        return 0
+    custom = {key: unit for key, unit in _hub_units(hub_id).items() if key in keys}
+    units = {key: custom.get(key) or BUILTIN_UNITS[key] for key in keys if key in custom or key in BUILTIN_UNITS}
+    matches = Q()
+    for key in keys:
+        matches |= Q(unit__iexact=key)
+    updated = 0
+    for model, quantity_field in QUANTITY_FIELDS.items():
+        qs = model.all_objects.filter(matches, hub_id=hub_id)
+        changed = qs.update(**_conversion(quantity_field, units))
+        if changed:
+            versions.bump(hub_id, model)
+        updated += changed
+    return updated
+
+
+def sum_base_quantities(qs, *fields):
+    """
+    Aggregate ``qs`` (of a model with ``base_quantity``) in the database:
+    one row per ``fields`` + ``base_unit`` with the summed ``quantity``.
+    """
+    return (
+        qs.values(*fields, 'base_unit')
+        .annotate(quantity=Sum('base_quantity'))
+        .order_by(*fields, 'base_unit')
+    )
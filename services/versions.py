@@ -0,0 +1,50 @@
+"""
+Per-hub change versions.
+
+``ManufacturingVersions`` holds one counter per model and hub, incremented
+in the same transaction as every write to that model: single-row saves and
+deletes through the signal handlers in ``signals.py``, bulk
+``QuerySet.update``/``bulk_create``/``bulk_update`` paths by calling
+``bump`` themselves. A list partial depends on a few models; the tuple of
+their versions changes whenever anything it shows may have, so it is
+enough to build an ETag (see ``conditional.py``) with one primary-key
+lookup instead of running the list query.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import BatchIngredient, BillOfMaterials, BOMLine, ManufacturingVersions, ProductionBatch, ProductionOrder
+
+VERSION_FIELDS = {
+    BillOfMaterials: 'bill_of_materialses',
+    BOMLine: 'bom_lines',
+    ProductionOrder: 'production_orders',
+    ProductionBatch: 'batches',
+    BatchIngredient: 'batch_ingredients',
+}
+
+
+def bump(hub_id, *models):
+    """Increment the hub's version of ``models``, seeding the row if missing."""
+    fields = {VERSION_FIELDS[model] for model in models}
+    if hub_id is None or not fields:
+        return
+    updated = ManufacturingVersions.objects.filter(pk=hub_id).update(
+        updated_at=timezone.now(), **{field: F(field) + 1 for field in fields},
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            ManufacturingVersions.objects.create(pk=hub_id, **{field: 1 for field in fields})
+    except IntegrityError:
+        # Another worker seeded the row concurrently.
+        bump(hub_id, *models)
+
+
+def get_versions(hub_id, *models):
+    """The hub's current versions of ``models``, in order (zeros before the first write)."""
+    fields = [VERSION_FIELDS[model] for model in models]
+    row = ManufacturingVersions.objects.filter(pk=hub_id).values_list(*fields).first()
+    return row or (0,) * len(fields)
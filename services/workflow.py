@@ -0,0 +1,101 @@
+"""
+Production order status workflow.
+
+Orders move draft -> confirmed -> in_progress -> done and can be cancelled
+from any status before done. ``bulk_transition`` applies one move to any
+number of orders with one ``UPDATE ... WHERE status = <source>`` per
+allowed source status (at most three), counts the rejected orders per
+status with one grouped query and adjusts the dashboard counters once.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from ..models import PROD_STATUS, ProductionOrder
+from . import counters, versions
+
+STATUSES = tuple(status for status, _label in PROD_STATUS)
+INITIAL_STATUSES = ('draft', 'confirmed')
+
+TRANSITIONS = {
+    'draft': ('confirmed', 'cancelled'),
+    'confirmed': ('in_progress', 'cancelled'),
+    'in_progress': ('done', 'cancelled'),
+    'done': (),
+    'cancelled': (),
+}
+
+
+class TransitionError(ValueError):
+    """A status change the workflow does not allow."""
+
+
+class TransitionResult:
+    def __init__(self, target):
+        self.target = target
+        self.moved = Counter()
+        self.rejected = Counter()
+
+    @property
+    def moved_total(self):
+        return sum(self.moved.values())
+
+    @property
+    def rejected_total(self):
+        return sum(self.rejected.values())
+
+
+def allowed_targets(status):
+    return TRANSITIONS.get(status, ())
+
+
+def allowed_sources(target):
+    return tuple(status for status, targets in TRANSITIONS.items() if target in targets)
+
+
+def check_transition(current, target):
+    """Raise ``TransitionError`` unless ``current`` may become ``target`` (unchanged is fine)."""
+    if target not in TRANSITIONS:
+        raise TransitionError(f'Unknown status: {target!r}')
+    if current not in TRANSITIONS:
+        # New orders, and legacy rows saved with a free-text status.
+        if target not in INITIAL_STATUSES:
+            raise TransitionError(f'An order starts as draft or confirmed, not {target!r}')
+    elif current != target and target not in allowed_targets(current):
+        raise TransitionError(f'Cannot move an order from {current!r} to {target!r}')
+
+
+def bulk_transition(hub_id, ids, target):
+    """Move the hub's live orders ``ids`` to ``target`` where allowed. Returns a ``TransitionResult``."""
+    if target not in TRANSITIONS:
+        raise TransitionError(f'Unknown status: {target!r}')
+    result = TransitionResult(target)
+    sources = allowed_sources(target)
+    qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False, id__in=list(ids)).order_by()
+    now = timezone.now()
+    with transaction.atomic():
+        for row in qs.exclude(status__in=sources).values('status').annotate(n=Count('pk')):
+            result.rejected[row['status']] += row['n']
+        deltas = Counter()
+        for source in sources:
+            moved = qs.filter(status=source).update(status=target, updated_at=now)
+            if moved:
+                result.moved[source] = moved
+                deltas.update(counters.row_deltas(ProductionOrder, source, sign=-moved))
+                deltas.update(counters.row_deltas(ProductionOrder, target, sign=moved))
+        counters.apply_deltas(hub_id, deltas)
+        if result.moved:
+            versions.bump(hub_id, ProductionOrder)
+    return result
+
+
+def status_choices(current=None):
+    """``(value, label)`` pairs an order in ``current`` (None for a new order) can be saved with."""
+    labels = dict(PROD_STATUS)
+    if current in TRANSITIONS:
+        values = (current, *allowed_targets(current))
+    else:
+        values = INITIAL_STATUSES
+    return [(value, labels[value]) for value in values]
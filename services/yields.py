@@ -0,0 +1,151 @@
+"""
+Planned-vs-actual yield of production orders.
+
+``annotate_yield`` adds to an order queryset, per order: the quantity
+produced by its live batches, the approved and rejected part of it, the
+yield (produced as a percentage of the planned ``quantity``, NULL without a
+planned quantity) and the variance (produced minus planned). The sums are
+correlated subqueries on the indexed ``production_order_id`` of the
+batches, so a paginated list gets them for the rows of its page in its
+own query instead of one lookup per row, and can sort and export them.
+
+``bom_yield_report`` totals the same figures per BOM over the orders
+ending in a date range, with one grouped query over the orders and one
+over their batches.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+
+from ..models import ProductionBatch, ProductionOrder
+
+ZERO = Decimal('0')
+PERCENT_QUANTUM = Decimal('0.1')
+
+
+class QuantizedDecimalField(DecimalField):
+    """
+    Output field of the yield annotations. Backends such as SQLite return
+    computed decimals as they come (``3``, ``33.3333333333333``); this
+    rounds them to ``decimal_places`` when read.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        quantum = Decimal(1).scaleb(-self.decimal_places)
+        return Decimal(value).quantize(quantum, rounding=ROUND_HALF_UP)
+
+
+QUANTITY = QuantizedDecimalField(max_digits=14, decimal_places=2)
+PERCENT = QuantizedDecimalField(max_digits=10, decimal_places=1)
+
+# List sort key -> annotation.
+YIELD_SORT_FIELDS = {
+    'produced': 'produced_quantity',
+    'yield': 'yield_percent',
+    'variance': 'variance',
+}
+
+
+def _produced(quality_status=None):
+    batches = ProductionBatch.objects.filter(production_order=OuterRef('pk'), is_deleted=False)
+    if quality_status:
+        batches = batches.filter(quality_status=quality_status)
+    total = batches.order_by().values('production_order').annotate(total=Sum('quantity_produced')).values('total')
+    return Coalesce(Subquery(total, output_field=QUANTITY), Value(ZERO), output_field=QUANTITY)
+
+
+def annotate_yield(qs):
+    """Annotate ``produced_quantity``, ``approved_quantity``, ``rejected_quantity``, ``yield_percent`` and ``variance``."""
+    qs = qs.annotate(
+        produced_quantity=_produced(),
+        approved_quantity=_produced('approved'),
+        rejected_quantity=_produced('rejected'),
+    )
+    # Through floats: SQLite divides integral NUMERIC values as integers.
+    ratio = Cast('produced_quantity', FloatField()) * 100 / Cast('quantity', FloatField())
+    return qs.annotate(
+        yield_percent=Case(When(quantity__gt=0, then=Cast(Round(ratio, 1), PERCENT)), default=None, output_field=PERCENT),
+        variance=ExpressionWrapper(F('produced_quantity') - F('quantity'), output_field=QUANTITY),
+    )
+
+
+def yield_percent(produced, planned):
+    if not planned:
+        return None
+    return (Decimal(produced) * 100 / Decimal(planned)).quantize(PERCENT_QUANTUM, rounding=ROUND_HALF_UP)
+
+
+class BOMYield:
+    """Planned and actual output of one BOM over the report range."""
+
+    def __init__(self, bom_id, code, name, orders, planned):
+        self.bom_id = bom_id
+        self.code = code
+        self.name = name
+        self.orders = orders
+        self.planned = planned or ZERO
+        self.produced = ZERO
+        self.approved = ZERO
+        self.rejected = ZERO
+
+    @property
+    def yield_percent(self):
+        return yield_percent(self.produced, self.planned)
+
+    @property
+    def variance(self):
+        return self.produced - self.planned
+
+
+class YieldReport:
+    def __init__(self, start, end, rows):
+        self.start = start
+        self.end = end
+        self.rows = rows
+        self.total = BOMYield(None, '', '', sum(row.orders for row in rows), sum((row.planned for row in rows), ZERO))
+        for name in ('produced', 'approved', 'rejected'):
+            setattr(self.total, name, sum((getattr(row, name) for row in rows), ZERO))
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def bom_yield_report(hub_id, start, end):
+    """Yield per BOM of the live, not cancelled orders of ``hub_id`` ending between ``start`` and ``end``."""
+    orders = (
+        ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False, bom__isnull=False, end_date__range=(start, end))
+        .exclude(status='cancelled')
+    )
+    planned = (
+        orders.order_by().values('bom_id', 'bom__code', 'bom__name')
+        .annotate(orders=Count('pk'), planned=Sum('quantity'))
+    )
+    rows = {
+        row['bom_id']: BOMYield(row['bom_id'], row['bom__code'], row['bom__name'], row['orders'], row['planned'])
+        for row in planned
+    }
+    if rows:
+        actual = (
+            ProductionBatch.objects.filter(is_deleted=False, production_order__in=orders.values('pk'))
+            .order_by().values('production_order__bom_id')
+            .annotate(
+                produced=Sum('quantity_produced'),
+                approved=Sum('quantity_produced', filter=Q(quality_status='approved')),
+                rejected=Sum('quantity_produced', filter=Q(quality_status='rejected')),
+            )
+        )
+        for row in actual:
+            target = rows.get(row['production_order__bom_id'])
+            if target is not None:
+                target.produced = row['produced'] or ZERO
+                target.approved = row['approved'] or ZERO
+                target.rejected = row['rejected'] or ZERO
+    return YieldReport(start, end, sorted(rows.values(), key=lambda row: (row.name.lower(), row.code)))
@@ -0,0 +1,172 @@
+"""
+Signal handlers keeping derived per-hub data in step with single-row saves.
+
+Bulk ``QuerySet.update``/``bulk_create`` paths do not send these signals and
+update the derived data explicitly (see services/counters.py,
+services/costing.py and services/versions.py).
+"""
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+
+from .models import BillOfMaterials, BOMLine, UnitOfMeasure
+from .services import costing, counters, units, versions
+
+_UNKNOWN = object()
+
+
+def _live_state(instance):
+    """``(is_live, status)`` read without triggering deferred-field loads."""
+    values = instance.__dict__
+    if 'is_deleted' not in values:
+        return _UNKNOWN
+    status_field = counters.STATUS_FIELDS.get(type(instance), (None,))[0]
+    if status_field and status_field not in values:
+        return _UNKNOWN
+    return (not values['is_deleted'], values.get(status_field) if status_field else None)
+
+
+def _remember(sender, instance, **kwargs):
+    instance._counter_state = _live_state(instance)
+
+
+def _track_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = None if created else getattr(instance, '_counter_state', _UNKNOWN)
+    after = _live_state(instance)
+    instance._counter_state = after
+    if before is _UNKNOWN or after is _UNKNOWN or before == after:
+        return
+    deltas = Counter()
+    if before is not None and before[0]:
+        deltas.update(counters.row_deltas(sender, before[1], sign=-1))
+    if after[0]:
+        deltas.update(counters.row_deltas(sender, after[1], sign=1))
+    counters.apply_deltas(instance.hub_id, deltas)
+
+
+def _track_delete(sender, instance, **kwargs):
+    state = _live_state(instance)
+    if state is not _UNKNOWN and state[0]:
+        counters.apply_deltas(instance.hub_id, counters.row_deltas(sender, state[1], sign=-1))
+
+
+for _model in counters.TOTAL_FIELDS:
+    post_init.connect(_remember, sender=_model, dispatch_uid=f'manufacturing_counters_init_{_model.__name__}')
+    post_save.connect(_track_save, sender=_model, dispatch_uid=f'manufacturing_counters_save_{_model.__name__}')
+    post_delete.connect(_track_delete, sender=_model, dispatch_uid=f'manufacturing_counters_delete_{_model.__name__}')
+
+
+# Change versions behind the list ETags: any write may change what a list shows.
+
+def _bump_version(sender, instance, raw=False, **kwargs):
+    if not raw:
+        versions.bump(instance.hub_id, sender)
+
+
+for _model in versions.VERSION_FIELDS:
+    post_save.connect(_bump_version, sender=_model, dispatch_uid=f'manufacturing_versions_save_{_model.__name__}')
+    post_delete.connect(_bump_version, sender=_model, dispatch_uid=f'manufacturing_versions_delete_{_model.__name__}')
+
+
+# Rolled-up BOM costs: a change to any field the cost depends on invalidates
+# the BOM(s) involved and their ancestors.
+
+COST_FIELDS = {
+    BillOfMaterials: ('output_quantity', 'is_deleted'),
+    BOMLine: ('bom_id', 'component_bom_id', 'quantity', 'unit_cost', 'is_deleted'),
+}
+
+
+def _cost_state(instance):
+    values = instance.__dict__
+    fields = COST_FIELDS[type(instance)]
+    if any(field not in values for field in fields):
+        return _UNKNOWN
+    return tuple(values[field] for field in fields)
+
+
+def _remember_cost(sender, instance, **kwargs):
+    instance._cost_state = _cost_state(instance)
+
+
+def _keep_cached_cost(sender, instance, raw=False, update_fields=None, **kwargs):
+    """
+    A full save of a BOM loaded before its cost was invalidated would write
+    the stale cost back; reload the current value instead.
+    """
+    if raw or instance._state.adding or instance.__dict__.get('unit_cost') is None:
+        return
+    if update_fields is not None and 'unit_cost' not in update_fields:
+        return
+    instance.unit_cost = (
+        BillOfMaterials.all_objects.filter(pk=instance.pk).values_list('unit_cost', flat=True).first()
+    )
+
+
+def _invalidate_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = None if created else getattr(instance, '_cost_state', _UNKNOWN)
+    after = _cost_state(instance)
+    instance._cost_state = after
+    if before == after and before is not _UNKNOWN:
+        return
+    if sender is BillOfMaterials:
+        bom_ids = {instance.pk}
+    else:
+        bom_ids = {instance.bom_id}
+        if before not in (None, _UNKNOWN):
+            bom_ids.add(before[0])
+    costing.invalidate_boms(bom_ids)
+
+
+def _invalidate_on_delete(sender, instance, **kwargs):
+    # Sent before the delete, while sub-assembly lines still point at a BOM.
+    costing.invalidate_boms({instance.pk} if sender is BillOfMaterials else {instance.bom_id})
+
+
+pre_save.connect(_keep_cached_cost, sender=BillOfMaterials, dispatch_uid='manufacturing_costing_keep')
+for _model in COST_FIELDS:
+    post_init.connect(_remember_cost, sender=_model, dispatch_uid=f'manufacturing_costing_init_{_model.__name__}')
+    post_save.connect(_invalidate_on_save, sender=_model, dispatch_uid=f'manufacturing_costing_save_{_model.__name__}')
+    pre_delete.connect(_invalidate_on_delete, sender=_model, dispatch_uid=f'manufacturing_costing_delete_{_model.__name__}')
+
+
+# Base-unit quantities: recomputed on every save that can change them, and
+# for the whole hub when one of its units is defined, changed or removed.
+
+def _normalize_quantity(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    sources = {units.QUANTITY_FIELDS[sender], 'unit'}
+    if update_fields is not None and not sources & set(update_fields):
+        return
+    units.normalize_instance(instance)
+    if update_fields is not None and 'base_quantity' not in update_fields:
+        sender.all_objects.filter(pk=instance.pk).update(
+            base_quantity=instance.base_quantity, base_unit=instance.base_unit,
+        )
+
+
+def _remember_unit(sender, instance, **kwargs):
+    instance._unit_code = instance.__dict__.get('code', _UNKNOWN)
+
+
+def _renormalize_unit(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    codes = {instance.code}
+    previous = getattr(instance, '_unit_code', _UNKNOWN)
+    if previous not in (_UNKNOWN, None):
+        codes.add(previous)
+    instance._unit_code = instance.code
+    units.renormalize(instance.hub_id, codes)
+
+
+for _model in units.QUANTITY_FIELDS:
+    pre_save.connect(_normalize_quantity, sender=_model, dispatch_uid=f'manufacturing_units_save_{_model.__name__}')
+post_init.connect(_remember_unit, sender=UnitOfMeasure, dispatch_uid='manufacturing_units_init')
+post_save.connect(_renormalize_unit, sender=UnitOfMeasure, dispatch_uid='manufacturing_units_changed')
+post_delete.connect(_renormalize_unit, sender=UnitOfMeasure, dispatch_uid='manufacturing_units_deleted')
@@ -0,0 +1,82 @@
+"""
+Rendered list-row fragment cache.
+
+    {% load manufacturing_rows %}
+    {% cached_row "production_order" item item.bom.updated_at %}
+        ...cells...
+    {% endcached_row %}
+
+The fragment is cached under the fragment name, the record's model, pk and
+``updated_at``, the active language and any extra values the row shows from
+other records (a related BOM, a cached cost). Every write that changes what
+a row shows moves one of these, so entries never need invalidating: stale
+ones just stop being read and age out.
+
+The cache is the ``MANUFACTURING_ROW_CACHE`` alias of ``CACHES`` when set,
+otherwise a process-local ``LocMemCache`` holding the most recently used
+``ROW_CACHE_ENTRIES`` rows (least recently used entries are culled first).
+"""
+import hashlib
+
+from django import template
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.translation import get_language
+
+register = template.Library()
+
+ROW_CACHE_ENTRIES = 5000
+ROW_CACHE_TIMEOUT = 24 * 60 * 60
+
+_local_cache = None
+
+
+def get_row_cache():
+    global _local_cache
+    alias = getattr(settings, 'MANUFACTURING_ROW_CACHE', None)
+    if alias:
+        return caches[alias]
+    if _local_cache is None:
+        _local_cache = LocMemCache('manufacturing-rows', {
+            'TIMEOUT': ROW_CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': ROW_CACHE_ENTRIES, 'CULL_FREQUENCY': 10},
+        })
+    return _local_cache
+
+
+def row_cache_key(name, obj, vary_on=()):
+    stamp = obj.updated_at.isoformat() if obj.updated_at else ''
+    vary = hashlib.md5(':'.join(str(value) for value in vary_on).encode(), usedforsecurity=False).hexdigest()
+    return f'manufacturing.row:{name}:{obj._meta.label_lower}:{obj.pk}:{stamp}:{get_language()}:{vary}'
+
+
+class CachedRowNode(template.Node):
+    def __init__(self, nodelist, name, record, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.record = record
+        self.vary_on = vary_on
+
+    def render(self, context):
+        obj = self.record.resolve(context)
+        key = row_cache_key(self.name.resolve(context), obj, [value.resolve(context) for value in self.vary_on])
+        cache = get_row_cache()
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = self.nodelist.render(context)
+            cache.set(key, fragment)
+        return fragment
+
+
+@register.tag('cached_row')
+def do_cached_row(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' takes a fragment name, the record and optional vary-on values")
+    nodelist = parser.parse(('endcached_row',))
+    parser.delete_first_token()
+    return CachedRowNode(
+        nodelist, parser.compile_filter(bits[1]), parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -79,10 +79,11 @@ def bill_of_materials(db, hub_id):
 
 
 @pytest.fixture
-def bom_line(db, hub_id):
-    """Create a test BOMLine."""
+def bom_line(db, hub_id, bill_of_materials):
+    """Create a test BOMLine on the test BillOfMaterials."""
     return BOMLine.objects.create(
         hub_id=hub_id,
+        bom=bill_of_materials,
         description='Test Description',
         quantity=Decimal('0.00'),
         unit='Test Unit',
@@ -96,8 +97,16 @@ def production_order(db, hub_id):
         hub_id=hub_id,
         order_number='NUM-001',
         quantity=Decimal('0.00'),
-        status='Test Status',
+        status='draft',
         start_date=timezone.now().date(),
         end_date=timezone.now().date(),
     )
 
+
+@pytest.fixture
+def sync_exports(settings, tmp_path, monkeypatch):
+    """Run background exports inline, writing to a temporary directory."""
+    from manufacturing.services import export_jobs
+    settings.MANUFACTURING_EXPORT_ROOT = str(tmp_path)
+    monkeypatch.setattr(export_jobs, '_executor', export_jobs.SyncExecutor())
+    return tmp_path
@@ -0,0 +1,52 @@
+"""
+Query-budget assertions.
+
+Pins the number of SQL queries a block of code may run, so N+1 regressions
+in views and templates fail loudly with the offending SQL listed.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def _format_queries(queries):
+    return '\n'.join(f'{i}. {q["sql"]}' for i, q in enumerate(queries, start=1))
+
+
+@contextmanager
+def query_budget(max_queries, label='block'):
+    """Fail if the wrapped block runs more than ``max_queries`` queries."""
+    with CaptureQueriesContext(connection) as ctx:
+        yield ctx
+    executed = len(ctx.captured_queries)
+    if executed > max_queries:
+        raise AssertionError(
+            f'{label} ran {executed} queries, budget is {max_queries}:\n'
+            f'{_format_queries(ctx.captured_queries)}'
+        )
+
+
+def count_queries(func, *args, **kwargs):
+    """Run ``func`` and return ``(result, number_of_queries)``."""
+    with CaptureQueriesContext(connection) as ctx:
+        result = func(*args, **kwargs)
+    return result, len(ctx.captured_queries)
+
+
+def assert_constant_queries(func, grow, max_queries, label='block'):
+    """
+    Fail if ``func`` runs a different number of queries after ``grow()``
+    adds more data, or more than ``max_queries``. Returns the query count.
+    """
+    _result, before = count_queries(func)
+    grow()
+    with query_budget(max_queries, label=label) as ctx:
+        func()
+    after = len(ctx.captured_queries)
+    if after != before:
+        raise AssertionError(
+            f'{label} went from {before} to {after} queries as rows were added:\n'
+            f'{_format_queries(ctx.captured_queries)}'
+        )
+    return after
@@ -1,8 +1,14 @@
 """Tests for manufacturing models."""
 import pytest
+from datetime import timedelta
+
+from django.db import connection
 from django.utils import timezone
 
-from manufacturing.models import BillOfMaterials, BOMLine, ProductionOrder
+from manufacturing.models import BillOfMaterials, BOMLine, ProductionBatch, ProductionOrder
+from manufacturing.views import (
+    BILL_OF_MATERIALS_SORT_FIELDS, BOM_LINE_SORT_FIELDS, PRODUCTION_ORDER_SORT_FIELDS,
+)
 
 
 @pytest.mark.django_db
@@ -101,3 +107,39 @@ class TestProductionOrder:
         assert ProductionOrder.objects.filter(hub_id=hub_id).count() == 0
 
 
+def _list_sorts():
+    for model, sort_fields in (
+        (BillOfMaterials, BILL_OF_MATERIALS_SORT_FIELDS),
+        (BOMLine, BOM_LINE_SORT_FIELDS),
+        (ProductionOrder, PRODUCTION_ORDER_SORT_FIELDS),
+    ):
+        for field in sort_fields.values():
+            if field == 'notes':
+                continue
+            for order_by in (field, f'-{field}'):
+                yield model, order_by
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='EXPLAIN output is backend specific')
+class TestListIndexes:
+    """List view access paths are served by the hub-scoped indexes."""
+
+    @pytest.mark.parametrize('model, order_by', list(_list_sorts()))
+    def test_sorted_page_uses_index(self, hub_id, model, order_by):
+        """Test sorted first page is read in index order without a temp B-tree."""
+        qs = model.objects.filter(hub_id=hub_id, is_deleted=False).order_by(order_by)[:10]
+        plan = qs.explain()
+        assert 'USING INDEX mfg_' in plan
+        assert 'TEMP B-TREE' not in plan
+
+    @pytest.mark.parametrize('model', [ProductionBatch, ProductionOrder])
+    def test_expiry_window_uses_index(self, hub_id, model):
+        """Test the expiry watch reads only the date range through the expiry index."""
+        today = timezone.localdate()
+        qs = model.objects.filter(
+            hub_id=hub_id, is_deleted=False, expiry_date__range=(today, today + timedelta(days=7)),
+        ).order_by('expiry_date')
+        plan = qs.explain()
+        assert 'hub_expiry_idx' in plan
+        assert 'expiry_date>?' in plan.replace(' ', '')
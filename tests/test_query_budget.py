@@ -0,0 +1,123 @@
+"""Query budgets for the manufacturing list and detail views."""
+import pytest
+from decimal import Decimal
+from django.urls import reverse
+
+from manufacturing.models import BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch
+
+from .query_budget import assert_constant_queries
+
+# Queries per request of each view, session, auth and navigation included.
+# A page of 100 rows (an order with 100 batches, a post of 200 records) must
+# run exactly as many queries as a page of 10 (1 batch, 10 records).
+VIEW_QUERY_BUDGETS = {
+    'manufacturing:bill_of_materialses_list': 8,
+    'manufacturing:bom_lines_list': 8,
+    'manufacturing:production_orders_list': 8,
+    'manufacturing:production_order_detail': 9,
+    'manufacturing:api_ingredients': 13,
+}
+
+DATATABLE = {'HTTP_HX_REQUEST': 'true', 'HTTP_HX_TARGET': 'datatable-body'}
+
+
+def _boms(hub_id, count, start=0):
+    return BillOfMaterials.objects.bulk_create([
+        BillOfMaterials(hub_id=hub_id, name=f'BOM {i}', code=f'B{i:04d}') for i in range(start, start + count)
+    ])
+
+
+def _bom_lines(hub_id, count, start=0):
+    boms = _boms(hub_id, count, start)
+    BOMLine.objects.bulk_create([
+        BOMLine(hub_id=hub_id, bom=bom, description=f'Line {i}', quantity=Decimal('1'), unit='kg')
+        for i, bom in enumerate(boms, start=start)
+    ])
+
+
+def _production_orders(hub_id, count, start=0):
+    boms = _boms(hub_id, count, start)
+    ProductionOrder.objects.bulk_create([
+        ProductionOrder(hub_id=hub_id, order_number=f'PO-{i:04d}', bom=bom, status='confirmed')
+        for i, bom in enumerate(boms, start=start)
+    ])
+
+
+@pytest.mark.django_db
+class TestListQueryBudget:
+    """List partials run a fixed number of queries, whatever the page size."""
+
+    @pytest.mark.parametrize('url_name, factory', [
+        ('manufacturing:bill_of_materialses_list', _boms),
+        ('manufacturing:bom_lines_list', _bom_lines),
+        ('manufacturing:production_orders_list', _production_orders),
+    ])
+    def test_list_page(self, auth_client, hub_id, url_name, factory):
+        """Test a page of 10 rows and a page of 100 run the same queries, within the view budget."""
+        url = reverse(url_name)
+        factory(hub_id, 10)
+        per_page = iter([10, 100])
+
+        def render():
+            size = next(per_page)
+            response = auth_client.get(url, {'per_page': size}, **DATATABLE)
+            assert response.status_code == 200
+            assert len(response.context['page_obj']) == size
+
+        assert_constant_queries(render, lambda: factory(hub_id, 90, start=10), VIEW_QUERY_BUDGETS[url_name], label=url_name)
+
+
+@pytest.mark.django_db
+class TestDetailQueryBudget:
+    """Production order detail runs a fixed number of queries."""
+
+    def test_detail(self, auth_client, hub_id):
+        """Test the detail page runs the same queries with 1 batch as with 100, within its budget."""
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Bread', code='BRD')
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', bom=bom)
+        url = reverse('manufacturing:production_order_detail', args=[order.pk])
+
+        def add_batches(start, count):
+            ProductionBatch.objects.bulk_create([
+                ProductionBatch(hub_id=hub_id, batch_number=f'L{i}', production_order=order, bom=bom)
+                for i in range(start, start + count)
+            ])
+
+        def render():
+            response = auth_client.get(url, HTTP_HX_REQUEST='true')
+            assert response.status_code == 200
+
+        add_batches(0, 1)
+        assert_constant_queries(
+            render, lambda: add_batches(1, 99),
+            VIEW_QUERY_BUDGETS['manufacturing:production_order_detail'], label='production_order_detail',
+        )
+
+
+@pytest.mark.django_db
+class TestBulkAPIQueryBudget:
+    """Bulk API writes run a fixed number of queries per request."""
+
+    def test_bulk_create_ingredients(self, auth_client, hub_id):
+        """Test posting 200 ingredients runs the same queries as posting 10, within the budget."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1')
+        batches = ProductionBatch.objects.bulk_create([
+            ProductionBatch(hub_id=hub_id, batch_number=f'L{i}', production_order=order) for i in range(2)
+        ])
+        url = reverse('manufacturing:api_ingredients')
+        sizes = iter([10, 200])
+
+        def post():
+            records = next(sizes)
+            payload = [
+                {
+                    'batch': str(batches[0].pk), 'description': f'Flour {i}', 'supplier_lot': f'F-{i}',
+                    'source_batch': str(batches[1].pk), 'quantity_used': '1.5', 'unit': 'kg',
+                }
+                for i in range(records)
+            ]
+            response = auth_client.post(url + '?fields=id', payload, content_type='application/json')
+            assert response.status_code == 201
+            assert len(response.json()['results']) == records
+
+        assert_constant_queries(post, lambda: None, VIEW_QUERY_BUDGETS['manufacturing:api_ingredients'], label='api_ingredients')
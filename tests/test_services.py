@@ -0,0 +1,1301 @@
+"""Tests for manufacturing services."""
+import pytest
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from manufacturing.models import (
+    ArchivedRecord, BatchIngredient, BillOfMaterials, BOMLine, ExportJob, ManufacturingCounters, ManufacturingSettings,
+    NumberSequence, ProductionBatch, ProductionOrder, UnitOfMeasure,
+)
+from manufacturing.services.archive import archive_hub
+from manufacturing.services.backflush import INSERT_BATCH_SIZE, backflush_batches, expected_rows
+from manufacturing.services.batches import BatchEntryError, record_batch
+from manufacturing.services.bom_explosion import (
+    BOMCycleError, BOMExploder, BOMGraph, Component, creates_cycle, explode_bom,
+)
+from manufacturing.services.bom_import import BOMImportError, import_bom_lines, read_rows
+from manufacturing.services.costing import bom_unit_cost, invalidate_boms, recost_boms
+from manufacturing.services.counters import bulk_soft_delete, get_counters
+from manufacturing.services.expiry import expiry_summary, expiry_watch
+from manufacturing.services.export_jobs import export_path, purge_exports, run_export, start_export
+from manufacturing.services.mrp import compute_requirements
+from manufacturing.services.numbering import NumberAllocator, NumberPattern, PatternError, reserve, save_numbered
+from manufacturing.services.scheduler import (
+    HUB_RESOURCE, Booking, Job, reschedule_order, schedule_hub, schedule_jobs,
+)
+from manufacturing.services.traceability import trace_batch, trace_lot
+from manufacturing.services.search import SQLiteFTSSearchBackend, get_search_backend, search_queryset
+from manufacturing.services.units import UnitRegistry, sum_base_quantities
+from manufacturing.services.versions import bump, get_versions
+from manufacturing.services.workflow import TransitionError, bulk_transition, check_transition
+from manufacturing.services.yields import annotate_yield, bom_yield_report
+
+
+def _bom(hub_id, name, output_quantity='1'):
+    return BillOfMaterials.objects.create(
+        hub_id=hub_id, name=name, code=name, output_quantity=Decimal(output_quantity),
+    )
+
+
+def _line(hub_id, bom, description, quantity, unit='kg', component_bom=None, unit_cost='0'):
+    return BOMLine.objects.create(
+        hub_id=hub_id, bom=bom, description=description,
+        quantity=Decimal(quantity), unit=unit, component_bom=component_bom,
+        unit_cost=Decimal(unit_cost),
+    )
+
+
+def _order(hub_id, number, quantity, bom=None, status='confirmed', batches=(), **fields):
+    """A production order; ``batches`` are ``(produced, quality_status[, deleted])`` tuples."""
+    order = ProductionOrder.objects.create(
+        hub_id=hub_id, order_number=number, quantity=Decimal(quantity), bom=bom, status=status, **fields,
+    )
+    for i, (produced, quality_status, *deleted) in enumerate(batches):
+        ProductionBatch.objects.create(
+            hub_id=hub_id, production_order=order, bom=bom, batch_number=f'{number}-{i}',
+            quantity_produced=Decimal(produced), quality_status=quality_status, is_deleted=bool(deleted),
+        )
+    return order
+
+
+@pytest.mark.django_db
+class TestBOMExplosion:
+    """Multi-level BOM explosion tests."""
+
+    def test_single_level(self, hub_id):
+        """Test leaf lines are scaled by quantity / output_quantity."""
+        bread = _bom(hub_id, 'BREAD', output_quantity='2')
+        _line(hub_id, bread, 'Flour', '1.00')
+        _line(hub_id, bread, 'Salt', '0.02')
+        result = explode_bom(bread, Decimal('10'))
+        assert result == {
+            Component('Flour', 'kg'): Decimal('5'),
+            Component('Salt', 'kg'): Decimal('0.1'),
+        }
+
+    def test_multi_level(self, hub_id):
+        """Test sub-assemblies are expanded down to leaf components."""
+        dough = _bom(hub_id, 'DOUGH', output_quantity='4')
+        _line(hub_id, dough, 'Flour', '3.00')
+        _line(hub_id, dough, 'Water', '2.00', unit='l')
+        pizza = _bom(hub_id, 'PIZZA')
+        _line(hub_id, pizza, 'Dough', '0.50', component_bom=dough)
+        _line(hub_id, pizza, 'Cheese', '0.20')
+        result = explode_bom(pizza, Decimal('8'))
+        assert result[Component('Flour', 'kg')] == Decimal('3')
+        assert result[Component('Water', 'l')] == Decimal('2')
+        assert result[Component('Cheese', 'kg')] == Decimal('1.6')
+        assert Component('Dough', 'kg') not in result
+
+    def test_shared_sub_assembly_expanded_once(self, hub_id):
+        """Test a shared intermediate is memoized across parents."""
+        base = _bom(hub_id, 'BASE')
+        _line(hub_id, base, 'Sugar', '1.00')
+        left = _bom(hub_id, 'LEFT')
+        _line(hub_id, left, 'Base', '1.00', component_bom=base)
+        right = _bom(hub_id, 'RIGHT')
+        _line(hub_id, right, 'Base', '2.00', component_bom=base)
+        top = _bom(hub_id, 'TOP')
+        _line(hub_id, top, 'Left', '1.00', component_bom=left)
+        _line(hub_id, top, 'Right', '1.00', component_bom=right)
+
+        exploder = BOMExploder(BOMGraph.load([top.pk], hub_id=hub_id))
+        assert exploder.explode(top.pk, 1) == {Component('Sugar', 'kg'): Decimal('3')}
+        assert exploder._per_unit[base.pk] is exploder.per_unit(base.pk)
+
+    def test_cycle_detected(self, hub_id):
+        """Test a BOM that contains itself raises BOMCycleError."""
+        a = _bom(hub_id, 'A')
+        b = _bom(hub_id, 'B')
+        _line(hub_id, a, 'B', '1.00', component_bom=b)
+        _line(hub_id, b, 'A', '1.00', component_bom=a)
+        with pytest.raises(BOMCycleError) as exc:
+            explode_bom(a, 1)
+        assert exc.value.path == [a.pk, b.pk, a.pk]
+
+    def test_creates_cycle(self, hub_id):
+        """Test a sub-assembly that already contains the line's BOM is reported as a cycle."""
+        a = _bom(hub_id, 'A')
+        b = _bom(hub_id, 'B')
+        c = _bom(hub_id, 'C')
+        _line(hub_id, a, 'B', '1.00', component_bom=b)
+        _line(hub_id, b, 'C', '1.00', component_bom=c)
+        assert creates_cycle(c.pk, a.pk)
+        assert creates_cycle(a.pk, a.pk)
+        assert not creates_cycle(a.pk, c.pk)
+        assert not creates_cycle(None, a.pk)
+
+    def test_queries_bounded_by_depth(self, hub_id, django_assert_num_queries):
+        """Test loading issues one query per BOM level, not per node."""
+        leaf = _bom(hub_id, 'LEAF')
+        _line(hub_id, leaf, 'Yeast', '1.00')
+        middles = []
+        for i in range(5):
+            middle = _bom(hub_id, f'MID-{i}')
+            _line(hub_id, middle, 'Leaf', '1.00', component_bom=leaf)
+            middles.append(middle)
+        top = _bom(hub_id, 'TOP')
+        for middle in middles:
+            _line(hub_id, top, middle.name, '1.00', component_bom=middle)
+
+        with django_assert_num_queries(3):
+            result = explode_bom(top, 1)
+        assert result == {Component('Yeast', 'kg'): Decimal('5')}
+
+
+@pytest.mark.django_db
+class TestMRP:
+    """Material requirements tests."""
+
+    def test_aggregates_open_orders_by_bucket(self, hub_id):
+        """Test open orders are exploded and summed per component and week."""
+        dough = _bom(hub_id, 'DOUGH', output_quantity='2')
+        _line(hub_id, dough, 'Flour', '1.00')
+        monday = date(2026, 3, 2)
+        _order(hub_id, 'PO-1', '4', dough, start_date=monday)
+        _order(hub_id, 'PO-2', '2', dough, status='in_progress', start_date=monday + timedelta(days=3))
+        _order(hub_id, 'PO-3', '6', dough, start_date=monday + timedelta(days=7))
+        _order(hub_id, 'PO-4', '100', dough, status='draft', start_date=monday)
+        _order(hub_id, 'PO-5', '100', dough, status='done', start_date=monday)
+
+        result = compute_requirements(hub_id, bucket='week')
+        assert result.orders_count == 3
+        assert result.buckets == [monday, monday + timedelta(days=7)]
+        [flour] = result.requirements
+        assert flour.component == Component('Flour', 'kg')
+        assert flour.buckets == [Decimal('3'), Decimal('3')]
+        assert flour.gross == Decimal('6')
+
+    def test_nets_on_hand(self, hub_id):
+        """Test on-hand stock is netted off the gross requirement."""
+        bom = _bom(hub_id, 'BOM')
+        _line(hub_id, bom, 'Flour', '2.00')
+        _order(hub_id, 'PO-1', '5', bom)
+        result = compute_requirements(hub_id, on_hand={Component('Flour', 'kg'): Decimal('4')})
+        assert result.requirements[0].net == Decimal('6')
+        assert result.buckets == [None]
+
+    def test_query_count_independent_of_orders(self, hub_id, django_assert_num_queries):
+        """Test the run is set-based rather than a per-order loop."""
+        bom = _bom(hub_id, 'BOM')
+        _line(hub_id, bom, 'Flour', '1.00')
+        for i in range(20):
+            _order(hub_id, f'PO-{i}', '1', bom, start_date=date(2026, 3, 2))
+        with django_assert_num_queries(2):
+            result = compute_requirements(hub_id)
+        assert result.requirements[0].gross == Decimal('20')
+
+
+@pytest.mark.django_db
+class TestCounters:
+    """Incremental dashboard counter tests."""
+
+    def _counters(self, hub_id):
+        return ManufacturingCounters.objects.get(pk=hub_id)
+
+    def test_create_and_soft_delete(self, hub_id):
+        """Test single-row saves keep totals in step."""
+        bom = _bom(hub_id, 'BOM')
+        _line(hub_id, bom, 'Flour', '1.00')
+        assert self._counters(hub_id).bill_of_materialses == 1
+        assert self._counters(hub_id).bom_lines == 1
+
+        bom.is_deleted = True
+        bom.deleted_at = timezone.now()
+        bom.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+        assert self._counters(hub_id).bill_of_materialses == 0
+
+    def test_status_change(self, hub_id):
+        """Test a status change moves the order between status counters."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1')
+        assert self._counters(hub_id).orders_draft == 1
+        order.status = 'confirmed'
+        order.save()
+        counters = self._counters(hub_id)
+        assert (counters.production_orders, counters.orders_draft, counters.orders_confirmed) == (1, 0, 1)
+
+    def test_bulk_soft_delete(self, hub_id):
+        """Test the bulk update path, which bypasses signals."""
+        for i in range(3):
+            ProductionOrder.objects.create(hub_id=hub_id, order_number=f'PO-{i}', status='confirmed')
+        qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False)
+        assert bulk_soft_delete(qs, hub_id) == 3
+        counters = self._counters(hub_id)
+        assert (counters.production_orders, counters.orders_confirmed) == (0, 0)
+
+    def test_reconcile_command(self, hub_id):
+        """Test the reconciliation command repairs drifted counters."""
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='done')
+        ManufacturingCounters.objects.filter(pk=hub_id).update(production_orders=42, orders_done=0)
+        call_command('manufacturing_reconcile_counters', stdout=StringIO())
+        counters = self._counters(hub_id)
+        assert (counters.production_orders, counters.orders_done) == (1, 1)
+
+    def test_get_counters_is_single_lookup(self, hub_id, django_assert_num_queries):
+        """Test reading seeded counters costs one primary-key query."""
+        get_counters(hub_id)
+        with django_assert_num_queries(1):
+            assert get_counters(hub_id).production_orders == 0
+
+
+@pytest.mark.django_db
+class TestSearch:
+    """Indexed list search tests."""
+
+    def _search(self, model, query):
+        return set(search_queryset(model.objects.all(), query).values_list('name', flat=True))
+
+    def test_substring_case_insensitive(self, hub_id):
+        """Test search keeps icontains semantics."""
+        _bom(hub_id, 'Sourdough Bread')
+        _bom(hub_id, 'Rye Loaf')
+        assert self._search(BillOfMaterials, 'DOUGH') == {'Sourdough Bread'}
+        assert self._search(BillOfMaterials, 'ye') == {'Rye Loaf'}
+        assert self._search(BillOfMaterials, '  ') == {'Sourdough Bread', 'Rye Loaf'}
+
+    def test_searches_notes_and_lines(self, hub_id):
+        """Test every searchable column of each list is matched."""
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Cake', notes='contains hazelnuts')
+        _line(hub_id, bom, 'Cocoa powder', '1.00')
+        assert self._search(BillOfMaterials, 'hazel') == {'Cake'}
+        lines = search_queryset(BOMLine.objects.all(), 'cocoa')
+        assert [line.description for line in lines] == ['Cocoa powder']
+
+    def test_bulk_update_and_soft_delete(self, hub_id):
+        """Test the index follows QuerySet.update and soft-deleted rows drop out."""
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Focaccia', code='BRD-7')
+        BillOfMaterials.objects.filter(pk=bom.pk).update(name='Ciabatta')
+        assert self._search(BillOfMaterials, 'focac') == set()
+        assert self._search(BillOfMaterials, 'ciab') == {'Ciabatta'}
+        BillOfMaterials.objects.filter(pk=bom.pk).update(is_deleted=True)
+        assert self._search(BillOfMaterials, 'ciab') == set()
+
+    def test_query_syntax_is_literal(self, hub_id):
+        """Test FTS operators and quotes in the query are matched literally."""
+        _bom(hub_id, 'Mix "A" OR B*')
+        assert self._search(BillOfMaterials, '"A" OR') == {'Mix "A" OR B*'}
+        assert self._search(BillOfMaterials, 'NEAR(') == set()
+
+    @pytest.mark.skipif(connection.vendor != 'sqlite', reason='SQLite FTS5 backend')
+    def test_sqlite_uses_fts_index(self, hub_id):
+        """Test SQLite searches go through the FTS5 table."""
+        assert isinstance(get_search_backend(), SQLiteFTSSearchBackend)
+        qs = search_queryset(ProductionOrder.objects.filter(hub_id=hub_id), 'PO-1')
+        assert 'manufacturing_productionorder_fts' in str(qs.query)
+        assert 'MATCH' in str(qs.query)
+
+    @pytest.mark.skipif(connection.vendor != 'sqlite', reason='SQLite FTS5 backend')
+    def test_missing_fts_table_is_cached(self, hub_id, monkeypatch, django_assert_num_queries):
+        """Test a table without its FTS index falls back to icontains and is looked up only once."""
+        from manufacturing.services import search
+        monkeypatch.setattr(search, 'fts_table', lambda table: f'{table}_missing_fts')
+        backend = SQLiteFTSSearchBackend()
+        with django_assert_num_queries(1):
+            backend.filter(BOMLine.objects.filter(hub_id=hub_id), 'flour')
+        with django_assert_num_queries(0):
+            qs = backend.filter(BOMLine.objects.filter(hub_id=hub_id), 'flour')
+        assert 'MATCH' not in str(qs.query)
+
+
+@pytest.mark.django_db
+class TestBOMImport:
+    """Bulk BOM line import tests."""
+
+    def _rows(self, text, filename='lines.csv'):
+        return read_rows(BytesIO(text.encode()), filename)
+
+    def test_imports_csv(self, hub_id):
+        """Test valid rows are inserted in chunks and counted."""
+        dough = _bom(hub_id, 'DOUGH')
+        pizza = _bom(hub_id, 'PIZZA')
+        rows = self._rows(
+            'BOM Code,Description,Quantity,Unit,Component Code\n'
+            'DOUGH,Flour,1.5,kg,\n'
+            'DOUGH,Water,0.75,l,\n'
+            'PIZZA,Dough,2,,DOUGH\n'
+        )
+        result = import_bom_lines(hub_id, rows, chunk_size=2)
+        assert (result.rows, result.created, result.errors) == (3, 3, [])
+        assert dough.lines.count() == 2
+        line = pizza.lines.get()
+        assert (line.component_bom_id, line.quantity) == (dough.pk, Decimal('2'))
+        assert ManufacturingCounters.objects.get(pk=hub_id).bom_lines == 3
+
+    def test_strict_reports_every_row_and_rolls_back(self, hub_id):
+        """Test invalid rows are reported by line number and nothing is kept."""
+        _bom(hub_id, 'DOUGH')
+        rows = self._rows(
+            'bom_code,description,quantity,unit\n'
+            'DOUGH,Flour,1,kg\n'
+            'NOPE,Salt,1,kg\n'
+            'DOUGH,,abc,kg\n'
+            'DOUGH,Yeast,0.001,kg\n'
+        )
+        result = import_bom_lines(hub_id, rows, chunk_size=1)
+        assert result.rolled_back and result.created == 0
+        assert [error.row for error in result.errors] == [3, 4, 5]
+        assert 'NOPE' in result.errors[0].message
+        assert BOMLine.objects.filter(hub_id=hub_id).count() == 0
+
+    def test_partial_keeps_valid_rows(self, hub_id):
+        """Test non-strict imports keep the valid rows."""
+        _bom(hub_id, 'DOUGH')
+        rows = self._rows('bom_code,description,quantity\nDOUGH,Flour,1\nNOPE,Salt,1\n')
+        result = import_bom_lines(hub_id, rows, strict=False)
+        assert (result.created, len(result.errors)) == (1, 1)
+
+    def test_two_level_cycle(self, hub_id):
+        """Test a row closing a cycle with an earlier row or a saved line is rejected."""
+        bread, dough, starter = _bom(hub_id, 'BREAD'), _bom(hub_id, 'DOUGH'), _bom(hub_id, 'STARTER')
+        _line(hub_id, starter, 'Bread crumbs', '1', component_bom=bread)
+        rows = self._rows(
+            'bom_code,description,quantity,component_code\n'
+            'BREAD,Dough,1,DOUGH\n'
+            'DOUGH,Bread,1,BREAD\n'
+            'DOUGH,Starter,1,STARTER\n'
+        )
+        result = import_bom_lines(hub_id, rows, strict=False)
+        assert result.created == 1
+        assert [error.row for error in result.errors] == [3, 4]
+        assert 'cannot contain itself' in result.errors[0].message
+        assert not dough.lines.exists()
+
+    def test_ambiguous_code(self, hub_id):
+        """Test a code shared by two BOMs is rejected rather than guessed."""
+        _bom(hub_id, 'DOUGH')
+        _bom(hub_id, 'DOUGH')
+        result = import_bom_lines(hub_id, self._rows('bom_code,description,quantity\nDOUGH,Flour,1\n'))
+        assert 'more than one BOM' in result.errors[0].message
+
+    def test_missing_columns(self, hub_id):
+        """Test a file without the required columns is refused."""
+        with pytest.raises(BOMImportError):
+            import_bom_lines(hub_id, self._rows('description,quantity\nFlour,1\n'))
+
+    def test_xlsx(self, hub_id, monkeypatch):
+        """Test XLSX workbooks are read in read-only mode and closed once read."""
+        openpyxl = pytest.importorskip('openpyxl')
+        _bom(hub_id, 'DOUGH')
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(['bom_code', 'description', 'quantity', 'unit'])
+        sheet.append(['DOUGH', 'Flour', 1.25, 'kg'])
+        buffer = BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+        closed = []
+        load_workbook = openpyxl.load_workbook
+
+        def tracked_load_workbook(*args, **kwargs):
+            loaded = load_workbook(*args, **kwargs)
+            close = loaded.close
+            loaded.close = lambda: (closed.append(True), close())
+            return loaded
+
+        monkeypatch.setattr(openpyxl, 'load_workbook', tracked_load_workbook)
+        result = import_bom_lines(hub_id, read_rows(buffer, 'lines.xlsx'))
+        assert result.created == 1
+        assert BOMLine.objects.get(hub_id=hub_id).quantity == Decimal('1.25')
+        assert closed == [True]
+
+    def test_query_count_independent_of_rows(self, hub_id, django_assert_max_num_queries):
+        """Test codes are resolved with one lookup and rows inserted in bulk, not per row."""
+        _bom(hub_id, 'DOUGH')
+        ManufacturingCounters.objects.get(pk=hub_id)
+        body = 'bom_code,description,quantity\n' + ''.join(f'DOUGH,Line {i},1\n' for i in range(500))
+        with django_assert_max_num_queries(20):
+            result = import_bom_lines(hub_id, self._rows(body), chunk_size=500)
+        assert result.created == 500
+
+
+@pytest.mark.django_db
+class TestTraceability:
+    """Lot traceability tests."""
+
+    @pytest.fixture
+    def genealogy(self, hub_id):
+        """FLOUR-1 -> DOUGH-1 -> BREAD-1, BREAD-2; SALT-9 -> DOUGH-1 and BREAD-2."""
+        def batch(number):
+            return ProductionBatch.objects.create(hub_id=hub_id, batch_number=number)
+
+        def use(into, description, quantity, lot='', source=None):
+            return BatchIngredient.objects.create(
+                hub_id=hub_id, batch=into, description=description, supplier_lot=lot,
+                source_batch=source, quantity_used=Decimal(quantity), unit='kg',
+            )
+
+        dough, bread1, bread2 = batch('DOUGH-1'), batch('BREAD-1'), batch('BREAD-2')
+        use(dough, 'Flour', '10', lot='FLOUR-1')
+        use(dough, 'Salt', '0.20', lot='SALT-9')
+        use(bread1, 'Dough', '4', source=dough)
+        use(bread2, 'Dough', '6', source=dough)
+        use(bread2, 'Salt', '0.05', lot='SALT-9')
+        return dough, bread1, bread2
+
+    def test_lot_forward(self, hub_id, genealogy):
+        """Test a supplier lot reaches every batch made from it, transitively."""
+        dough, bread1, bread2 = genealogy
+        result = trace_lot(hub_id, 'FLOUR-1')
+        assert {b.batch_number for b in result.batches} == {'DOUGH-1', 'BREAD-1', 'BREAD-2'}
+        [root] = result.roots
+        [dough_node] = root.children
+        assert (dough_node.batch, dough_node.quantity) == (dough, Decimal('10'))
+        assert {(c.label, c.quantity) for c in dough_node.children} == {('BREAD-1', Decimal('4')), ('BREAD-2', Decimal('6'))}
+
+    def test_shared_batch_expanded_once(self, hub_id, genealogy):
+        """Test a batch reached through two paths is expanded once and then marked repeated."""
+        result = trace_lot(hub_id, 'SALT-9')
+        [root] = result.roots
+        bread2, dough = root.children
+        assert [bread2.label, dough.label] == ['BREAD-2', 'DOUGH-1']
+        assert bread2.repeated is False
+        via_dough = [c for c in dough.children if c.label == 'BREAD-2'][0]
+        assert via_dough.repeated is True
+
+    def test_batch_backward(self, hub_id, genealogy):
+        """Test a batch resolves to every supplier lot that went into it."""
+        result = trace_batch(hub_id, 'BREAD-2', mode='sources')
+        assert result.lots == ['FLOUR-1', 'SALT-9']
+        [root] = result.roots
+        assert [(c.label, c.is_batch) for c in root.children] == [('DOUGH-1', True), ('SALT-9', False)]
+
+    def test_batch_uses(self, hub_id, genealogy):
+        """Test a batch resolves to the batches it was consumed in."""
+        result = trace_batch(hub_id, 'DOUGH-1', mode='uses')
+        assert {b.batch_number for b in result.batches} == {'DOUGH-1', 'BREAD-1', 'BREAD-2'}
+
+    def test_unknown_lot(self, hub_id, genealogy):
+        """Test an unknown lot yields an empty trace."""
+        assert not trace_lot(hub_id, 'NOPE')
+
+    def test_queries_bounded_by_depth(self, hub_id, django_assert_num_queries):
+        """Test one query per generation, not per batch."""
+        parents = [ProductionBatch.objects.create(hub_id=hub_id, batch_number=f'P-{i}') for i in range(10)]
+        for parent in parents:
+            BatchIngredient.objects.create(hub_id=hub_id, batch=parent, description='Milk', supplier_lot='MILK-1')
+            child = ProductionBatch.objects.create(hub_id=hub_id, batch_number=f'C-{parent.batch_number}')
+            BatchIngredient.objects.create(hub_id=hub_id, batch=child, description='Base', source_batch=parent)
+        # Seed lookup, generation 1 -> 2, generation 2 -> (none), batch load.
+        with django_assert_num_queries(4):
+            result = trace_lot(hub_id, 'MILK-1')
+        assert len(result.batches) == 20
+
+
+MONDAY = date(2026, 3, 2)
+
+
+@pytest.mark.django_db
+class TestScheduler:
+    """Finite-capacity scheduler tests."""
+
+    def test_earliest_due_date_first(self):
+        """Test jobs are loaded in due-date order and spill over into later days."""
+        jobs = [
+            Job(1, 'line', Decimal('25'), MONDAY + timedelta(days=7), 1),
+            Job(2, 'line', Decimal('5'), MONDAY + timedelta(days=1), 2),
+            Job(3, 'line', Decimal('1'), None, 0),
+        ]
+        result = schedule_jobs(jobs, {'line': Decimal('10')}, MONDAY)
+        assert result.scheduled == {
+            2: (MONDAY, MONDAY),
+            1: (MONDAY, MONDAY + timedelta(days=2)),
+            3: (MONDAY + timedelta(days=3), MONDAY + timedelta(days=3)),
+        }
+
+    def test_weekends_bookings_and_missing_capacity(self):
+        """Test weekends are skipped, in-progress bookings respected and capacity-less jobs reported."""
+        friday = MONDAY + timedelta(days=4)
+        jobs = [Job(1, 'line', Decimal('30'), friday, 1), Job(2, 'other', Decimal('1'), None, 2)]
+        bookings = [Booking('line', MONDAY, MONDAY + timedelta(days=3), Decimal('40'))]
+        result = schedule_jobs(jobs, {'line': Decimal('10'), 'other': None}, MONDAY, bookings)
+        assert result.scheduled[1] == (friday, MONDAY + timedelta(days=8))
+        assert result.late == [1]
+        assert result.unscheduled == [2]
+
+    def test_schedule_hub_writes_changed_dates(self, hub_id):
+        """Test the hub run saves dates and a second run changes nothing."""
+        ManufacturingSettings.objects.create(hub_id=hub_id, daily_capacity=Decimal('10'))
+        late = _order(hub_id, 'PO-1', '15', due_date=MONDAY + timedelta(days=10))
+        soon = _order(hub_id, 'PO-2', '10', due_date=MONDAY)
+        draft = _order(hub_id, 'PO-3', '10', status='draft')
+
+        result = schedule_hub(hub_id, today=MONDAY)
+        assert result.changed == 2
+        soon.refresh_from_db()
+        late.refresh_from_db()
+        draft.refresh_from_db()
+        assert (soon.start_date, soon.end_date) == (MONDAY, MONDAY)
+        assert (late.start_date, late.end_date) == (MONDAY + timedelta(days=1), MONDAY + timedelta(days=2))
+        assert draft.start_date is None
+        assert schedule_hub(hub_id, today=MONDAY).changed == 0
+
+    def test_dedicated_bom_capacity(self, hub_id):
+        """Test a BOM with its own capacity is planned on its own line."""
+        ManufacturingSettings.objects.create(hub_id=hub_id, daily_capacity=Decimal('10'))
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Cake', daily_capacity=Decimal('100'))
+        shared = _order(hub_id, 'PO-1', '10', due_date=MONDAY)
+        dedicated = _order(hub_id, 'PO-2', '100', due_date=MONDAY, bom=bom)
+        schedule_hub(hub_id, today=MONDAY)
+        shared.refresh_from_db()
+        dedicated.refresh_from_db()
+        assert shared.end_date == MONDAY
+        assert dedicated.end_date == MONDAY
+
+    def test_incremental_reschedule_touches_one_resource(self, hub_id, django_assert_max_num_queries):
+        """Test rescheduling one order only loads and replans its own line."""
+        ManufacturingSettings.objects.create(hub_id=hub_id, daily_capacity=Decimal('10'))
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Cake', daily_capacity=Decimal('5'))
+        other = _order(hub_id, 'PO-1', '10', due_date=MONDAY)
+        for i in range(3):
+            _order(hub_id, f'PO-B{i}', '5', due_date=MONDAY + timedelta(days=i), bom=bom)
+        schedule_hub(hub_id, today=MONDAY)
+
+        changed = _order(hub_id, 'PO-B9', '5', due_date=MONDAY - timedelta(days=1), bom=bom)
+        ProductionOrder.objects.filter(pk=other.pk).update(start_date=None, end_date=None)
+        with django_assert_max_num_queries(10):
+            result = reschedule_order(changed, today=MONDAY)
+        assert len(result) == 4
+        other.refresh_from_db()
+        assert other.start_date is None
+        assert ProductionOrder.objects.get(order_number='PO-B2').end_date == MONDAY + timedelta(days=3)
+
+    def test_benchmark_engine_10k_jobs(self):
+        """Benchmark: 10k synthetic jobs over four lines are placed in well under a second."""
+        rng = random.Random(42)
+        resources = {HUB_RESOURCE: Decimal('1000'), 'a': Decimal('300'), 'b': Decimal('250.50'), 'c': Decimal('50')}
+        jobs = [
+            Job(i, rng.choice(list(resources)), Decimal(rng.randint(1, 500)),
+                MONDAY + timedelta(days=rng.randint(0, 400)), i)
+            for i in range(10000)
+        ]
+        started = time.perf_counter()
+        result = schedule_jobs(jobs, resources, MONDAY)
+        elapsed = time.perf_counter() - started
+        assert len(result) == 10000
+        assert elapsed < 2.0, f'scheduling 10k jobs took {elapsed:.2f}s'
+
+    def test_benchmark_hub_10k_orders(self, hub_id):
+        """Benchmark: saving 10k scheduled orders issues one UPDATE per date pair, not per order."""
+        ManufacturingSettings.objects.create(hub_id=hub_id, daily_capacity=Decimal('500'))
+        rng = random.Random(7)
+        ProductionOrder.objects.bulk_create([
+            ProductionOrder(
+                hub_id=hub_id, order_number=f'PO-{i:05d}', status='confirmed',
+                quantity=Decimal(rng.randint(1, 200)), due_date=MONDAY + timedelta(days=rng.randint(0, 365)),
+            )
+            for i in range(10000)
+        ], batch_size=1000)
+        with CaptureQueriesContext(connection) as captured:
+            result = schedule_hub(hub_id, today=MONDAY)
+        assert result.changed == 10000
+        slots = ProductionOrder.objects.filter(hub_id=hub_id).values('start_date', 'end_date').distinct().count()
+        updates = [q for q in captured.captured_queries if q['sql'].startswith('UPDATE') and 'manufacturing_productionorder' in q['sql']]
+        assert slots < result.changed
+        assert len(updates) == slots
+
+
+@pytest.mark.django_db
+class TestCosting:
+    """Rolled-up BOM cost tests."""
+
+    @pytest.fixture
+    def catalog(self, hub_id):
+        dough = _bom(hub_id, 'DOUGH', output_quantity='2')
+        flour = _line(hub_id, dough, 'Flour', '1', unit_cost='2')
+        _line(hub_id, dough, 'Water', '1', unit='l', unit_cost='0.1')
+        bread = _bom(hub_id, 'BREAD')
+        _line(hub_id, bread, 'Dough', '2', unit='u', component_bom=dough)
+        _line(hub_id, bread, 'Bag', '1', unit='u', unit_cost='0.3')
+        cake = _bom(hub_id, 'CAKE')
+        _line(hub_id, cake, 'Sugar', '3', unit_cost='1')
+        return {'dough': dough, 'flour': flour, 'bread': bread, 'cake': cake}
+
+    def _costs(self, hub_id):
+        return dict(BillOfMaterials.objects.filter(hub_id=hub_id).values_list('code', 'unit_cost'))
+
+    def test_rollup_per_output_unit(self, hub_id, catalog):
+        """Test costs are summed bottom-up and divided by the output quantity."""
+        result = recost_boms(hub_id)
+        assert len(result) == 3
+        assert self._costs(hub_id) == {
+            'DOUGH': Decimal('1.0500'), 'BREAD': Decimal('2.4000'), 'CAKE': Decimal('3.0000'),
+        }
+
+    def test_line_change_invalidates_ancestors_only(self, hub_id, catalog):
+        """Test a component price change clears its BOM and the BOMs using it, and nothing else."""
+        recost_boms(hub_id)
+        flour = catalog['flour']
+        flour.unit_cost = Decimal('4')
+        flour.save()
+        assert self._costs(hub_id) == {'DOUGH': None, 'BREAD': None, 'CAKE': Decimal('3.0000')}
+
+        result = recost_boms(hub_id)
+        assert set(result.costs) == {catalog['dough'].pk, catalog['bread'].pk}
+        assert self._costs(hub_id)['BREAD'] == Decimal('4.4000')
+
+    def test_unrelated_save_keeps_cache(self, hub_id, catalog):
+        """Test saving a line without touching cost fields keeps the cached costs."""
+        recost_boms(hub_id)
+        flour = BOMLine.objects.get(pk=catalog['flour'].pk)
+        flour.description = 'Wheat flour'
+        flour.save()
+        assert self._costs(hub_id)['BREAD'] == Decimal('2.4000')
+
+    def test_stale_cost_not_written_back(self, hub_id, catalog):
+        """Test saving a BOM loaded before an invalidation does not restore its old cost."""
+        recost_boms(hub_id)
+        bread = BillOfMaterials.objects.get(pk=catalog['bread'].pk)
+        BOMLine.objects.filter(pk=catalog['flour'].pk).get().delete()
+        bread.name = 'Bread loaf'
+        bread.save()
+        assert self._costs(hub_id)['BREAD'] is None
+        assert bom_unit_cost(bread) == Decimal('0.4000')
+
+    def test_bulk_paths_invalidate_explicitly(self, hub_id, catalog):
+        """Test soft-deleting a sub-assembly in bulk makes its parent cost the line as a leaf."""
+        recost_boms(hub_id)
+        bulk_soft_delete(BillOfMaterials.objects.filter(pk=catalog['dough'].pk), hub_id)
+        invalidate_boms([catalog['dough'].pk])
+        recost_boms(hub_id)
+        assert self._costs(hub_id)['BREAD'] == Decimal('0.3000')
+
+    def test_write_recosts_on_commit(self, hub_id, catalog, django_capture_on_commit_callbacks):
+        """Test a cost change is recosted once the saving transaction commits."""
+        recost_boms(hub_id)
+        flour = catalog['flour']
+        flour.unit_cost = Decimal('4')
+        with django_capture_on_commit_callbacks(execute=True):
+            flour.save()
+        assert self._costs(hub_id)['BREAD'] == Decimal('4.4000')
+
+    def test_cycle_reported(self, hub_id):
+        """Test BOMs in a cycle stay stale and are reported."""
+        a = _bom(hub_id, 'A')
+        b = _bom(hub_id, 'B')
+        _line(hub_id, a, 'B', '1', component_bom=b)
+        _line(hub_id, b, 'A', '1', component_bom=a)
+        result = recost_boms(hub_id)
+        assert set(result.errors) == {a.pk, b.pk}
+        assert self._costs(hub_id) == {'A': None, 'B': None}
+
+    def test_parents_of_a_cycle_reported(self, hub_id):
+        """Test BOMs using a cycle, directly or through another BOM, are reported as stale too."""
+        a, b = _bom(hub_id, 'A'), _bom(hub_id, 'B')
+        _line(hub_id, a, 'B', '1', component_bom=b)
+        _line(hub_id, b, 'A', '1', component_bom=a)
+        middle = _bom(hub_id, 'MIDDLE')
+        _line(hub_id, middle, 'A', '1', component_bom=a)
+        top = _bom(hub_id, 'TOP')
+        _line(hub_id, top, 'Middle', '1', component_bom=middle)
+        result = recost_boms(hub_id)
+        assert set(result.errors) == {a.pk, b.pk, middle.pk, top.pk}
+        assert self._costs(hub_id) == {'A': None, 'B': None, 'MIDDLE': None, 'TOP': None}
+
+    def test_full_pass_is_batched(self, hub_id, django_assert_max_num_queries):
+        """Test recosting the whole catalog takes a constant number of queries."""
+        previous = None
+        for i in range(60):
+            bom = _bom(hub_id, f'LVL-{i:02d}')
+            _line(hub_id, bom, 'Raw', '1', unit_cost='1')
+            if previous is not None:
+                _line(hub_id, bom, 'Previous', '1', component_bom=previous)
+            previous = bom
+        recost_boms(hub_id)
+        with django_assert_max_num_queries(6):
+            result = recost_boms(hub_id, full=True)
+        assert len(result) == 60
+        assert self._costs(hub_id)['LVL-59'] == Decimal('60.0000')
+
+
+@pytest.mark.django_db
+class TestUnits:
+    """Unit-of-measure normalization tests."""
+
+    def test_registry(self):
+        """Test built-in units resolve case-insensitively and convert within a dimension only."""
+        registry = UnitRegistry()
+        assert registry.normalize(Decimal('500'), ' G ') == (Decimal('0.500'), 'kg')
+        assert registry.normalize(Decimal('2'), 'Box') == (Decimal('2'), 'box')
+        assert registry.convert(Decimal('1.5'), 'l', 'ml') == Decimal('1500')
+        with pytest.raises(ValueError):
+            registry.convert(1, 'kg', 'l')
+
+    def test_save_normalizes(self, hub_id):
+        """Test lines store their base-unit quantity on save."""
+        bom = _bom(hub_id, 'DOUGH')
+        line = _line(hub_id, bom, 'Flour', '500', unit='g')
+        line.refresh_from_db()
+        assert (line.base_quantity, line.base_unit) == (Decimal('0.5'), 'kg')
+        line.quantity = Decimal('2')
+        line.unit = 'lb'
+        line.save(update_fields=['quantity', 'unit'])
+        line.refresh_from_db()
+        assert (line.base_quantity, line.base_unit) == (Decimal('0.907185'), 'kg')
+
+    def test_explosion_sums_mixed_units(self, hub_id):
+        """Test grams and kilograms of one component are one requirement."""
+        bom = _bom(hub_id, 'DOUGH')
+        _line(hub_id, bom, 'Flour', '500', unit='g')
+        _line(hub_id, bom, 'Flour', '1', unit='KG')
+        _line(hub_id, bom, 'Milk', '250', unit='ml')
+        assert explode_bom(bom, 2) == {
+            Component('Flour', 'kg'): Decimal('3'),
+            Component('Milk', 'l'): Decimal('0.5'),
+        }
+
+    def test_custom_unit_renormalizes_hub(self, hub_id):
+        """Test defining and removing a hub unit recomputes existing rows in the database."""
+        bom = _bom(hub_id, 'DOUGH')
+        line = _line(hub_id, bom, 'Flour', '2', unit='Sack')
+        sack = UnitOfMeasure.objects.create(hub_id=hub_id, code='sack', dimension='mass', factor=Decimal('25'))
+        line.refresh_from_db()
+        assert (line.base_quantity, line.base_unit) == (Decimal('50'), 'kg')
+
+        sack.delete()
+        line.refresh_from_db()
+        assert (line.base_quantity, line.base_unit) == (Decimal('2'), 'sack')
+
+    def test_largest_quantity_and_factor_fit(self, hub_id):
+        """Test the largest quantity in the largest hub unit is stored, on save and on renormalization."""
+        bom = _bom(hub_id, 'DOUGH')
+        line = _line(hub_id, bom, 'Ore', '99999999.99', unit='shipload')
+        UnitOfMeasure.objects.create(hub_id=hub_id, code='shipload', dimension='mass', factor=Decimal('999999999'))
+        line.refresh_from_db()
+        # About 1e17: more integer digits than a (18, 6) column holds. Compared
+        # coarsely, as SQLite keeps it as a float.
+        assert line.base_quantity // 10 ** 9 == 99999999
+        line.save()
+        line.refresh_from_db()
+        assert line.base_quantity // 10 ** 9 == 99999999
+
+    def test_import_normalizes(self, hub_id):
+        """Test bulk-imported lines get base quantities with the hub's units."""
+        _bom(hub_id, 'DOUGH')
+        UnitOfMeasure.objects.create(hub_id=hub_id, code='sack', dimension='mass', factor=Decimal('25'))
+        body = 'bom_code,description,quantity,unit\nDOUGH,Flour,2,sack\nDOUGH,Salt,10,g\n'
+        import_bom_lines(hub_id, read_rows(BytesIO(body.encode()), 'lines.csv'))
+        assert dict(BOMLine.objects.filter(hub_id=hub_id).values_list('description', 'base_quantity')) == {
+            'Flour': Decimal('50'), 'Salt': Decimal('0.01'),
+        }
+
+    def test_consumption_is_one_sum(self, hub_id, django_assert_num_queries):
+        """Test ingredient consumption over mixed units is a single aggregate query."""
+        batch = ProductionBatch.objects.create(hub_id=hub_id, batch_number='B-1')
+        for quantity, unit in (('500', 'g'), ('1.5', 'kg'), ('2', 'l')):
+            BatchIngredient.objects.create(
+                hub_id=hub_id, batch=batch, description='Flour' if unit != 'l' else 'Water',
+                quantity_used=Decimal(quantity), unit=unit,
+            )
+        with django_assert_num_queries(1):
+            rows = list(sum_base_quantities(BatchIngredient.objects.filter(hub_id=hub_id), 'description'))
+        assert [(r['description'], r['quantity'], r['base_unit']) for r in rows] == [
+            ('Flour', Decimal('2'), 'kg'), ('Water', Decimal('2'), 'l'),
+        ]
+
+
+@pytest.mark.django_db
+class TestWorkflow:
+    """Production order status workflow tests."""
+
+    def test_check_transition(self):
+        """Test the transition table: forward one step, cancel before done, nothing after."""
+        check_transition('draft', 'confirmed')
+        check_transition('in_progress', 'cancelled')
+        check_transition(None, 'confirmed')
+        check_transition('Legacy', 'draft')
+        for current, target in (('draft', 'done'), ('done', 'cancelled'), ('cancelled', 'draft'), (None, 'done')):
+            with pytest.raises(TransitionError):
+                check_transition(current, target)
+        with pytest.raises(TransitionError):
+            check_transition('draft', 'shipped')
+
+    def test_bulk_transition_counts_and_counters(self, hub_id):
+        """Test allowed moves are applied, the rest counted per status, and counters follow."""
+        orders = [
+            ProductionOrder.objects.create(hub_id=hub_id, order_number=f'PO-{i}', status=status)
+            for i, status in enumerate(['draft', 'draft', 'confirmed', 'in_progress', 'done'])
+        ]
+        result = bulk_transition(hub_id, [o.pk for o in orders], 'cancelled')
+        assert result.moved == {'draft': 2, 'confirmed': 1, 'in_progress': 1}
+        assert result.rejected == {'done': 1}
+        counters = get_counters(hub_id)
+        assert (counters.orders_cancelled, counters.orders_draft, counters.orders_done) == (4, 0, 1)
+
+    def test_bulk_transition_is_constant_statements(self, hub_id, django_assert_max_num_queries):
+        """Test thousands of orders are confirmed with a fixed number of statements."""
+        ProductionOrder.objects.bulk_create([
+            ProductionOrder(hub_id=hub_id, order_number=f'PO-{i:05d}', status='draft' if i % 4 else 'done')
+            for i in range(2000)
+        ], batch_size=500)
+        ids = list(ProductionOrder.objects.filter(hub_id=hub_id).values_list('pk', flat=True))
+        get_counters(hub_id)
+        bump(hub_id, ProductionOrder)
+        with django_assert_max_num_queries(6):
+            result = bulk_transition(hub_id, ids, 'confirmed')
+        assert result.moved_total == 1500
+        assert result.rejected == {'done': 500}
+
+
+
+@pytest.mark.django_db
+class TestVersions:
+    """Per-hub change version tests."""
+
+    def test_single_saves_bump(self, hub_id):
+        """Test saves and deletes bump the version of their model only."""
+        assert get_versions(hub_id, BillOfMaterials, BOMLine) == (0, 0)
+        bom = _bom(hub_id, 'CAKE')
+        line = _line(hub_id, bom, 'Flour', '1')
+        boms, lines = get_versions(hub_id, BillOfMaterials, BOMLine)
+        assert boms >= 1 and lines == 1
+        line.delete()
+        assert get_versions(hub_id, BOMLine) == (2,)
+        assert get_versions(hub_id, ProductionOrder) == (0,)
+
+    def test_bulk_paths_bump(self, hub_id):
+        """Test bulk soft-delete, bulk transitions and recosting bump the versions."""
+        bom = _bom(hub_id, 'CAKE')
+        _line(hub_id, bom, 'Flour', '1', unit_cost='2')
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='draft')
+        before = get_versions(hub_id, BillOfMaterials, BOMLine, ProductionOrder)
+        recost_boms(hub_id)
+        bulk_soft_delete(BOMLine.objects.filter(hub_id=hub_id), hub_id)
+        bulk_transition(hub_id, [order.pk], 'confirmed')
+        after = get_versions(hub_id, BillOfMaterials, BOMLine, ProductionOrder)
+        assert all(new > old for old, new in zip(before, after))
+
+    def test_noop_bulk_paths_do_not_bump(self, hub_id):
+        """Test bulk paths that change nothing keep the version, so ETags stay valid."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='done')
+        before = get_versions(hub_id, ProductionOrder)
+        bulk_transition(hub_id, [order.pk], 'confirmed')
+        bulk_soft_delete(ProductionOrder.objects.filter(hub_id=hub_id, status='draft'), hub_id)
+        assert get_versions(hub_id, ProductionOrder) == before
+
+
+@pytest.mark.django_db
+class TestExportJobs:
+    """Background export job tests."""
+
+    def test_csv_export_in_chunks(self, hub_id, sync_exports, django_capture_on_commit_callbacks):
+        """Test a CSV export follows the search and sort, and reports its progress."""
+        for i in range(25):
+            _bom(hub_id, f'BOM-{i:02d}')
+        _bom(hub_id, 'Other')
+        with django_capture_on_commit_callbacks(execute=True):
+            job = start_export(hub_id, 'bill_of_materialses', 'csv', {'q': 'BOM', 'order_by': '-code'})
+        job.refresh_from_db()
+        assert (job.status, job.rows_total, job.rows_done, job.progress) == ('done', 25, 25, 100)
+        with open(export_path(job), encoding='utf-8') as handle:
+            lines = handle.read().splitlines()
+        assert lines[0].startswith('Code,Name')
+        assert len(lines) == 26
+        assert lines[1].startswith('BOM-24,')
+
+    def test_xlsx_export_of_batch_ingredients(self, hub_id, sync_exports, django_capture_on_commit_callbacks):
+        """Test the ingredient export writes one row per ingredient to a workbook."""
+        openpyxl = pytest.importorskip('openpyxl')
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='draft')
+        batch = ProductionBatch.objects.create(hub_id=hub_id, production_order=order, batch_number='B-1')
+        for description in ('Flour', 'Water'):
+            BatchIngredient.objects.create(
+                hub_id=hub_id, batch=batch, description=description, quantity_used=Decimal('500'), unit='g',
+            )
+        with django_capture_on_commit_callbacks(execute=True):
+            job = start_export(hub_id, 'production_ingredients', 'xlsx')
+        job.refresh_from_db()
+        assert job.status == 'done'
+        rows = list(openpyxl.load_workbook(export_path(job)).active.values)
+        assert len(rows) == 3
+        assert rows[1][0] == 'PO-1' and rows[1][5] == 'Flour' and rows[1][11] == 'kg'
+
+    def test_failure_is_recorded(self, hub_id, sync_exports):
+        """Test a failing export ends as failed with its error and no file."""
+        job = start_export(hub_id, 'bom_lines', 'csv', {'order_by': 'no_such_field'})
+        run_export(job.pk)
+        job.refresh_from_db()
+        assert job.status == 'failed' and job.error
+        assert not list(sync_exports.iterdir())
+
+    def test_job_claimed_once(self, hub_id, sync_exports):
+        """Test a job already claimed by another worker is not run again."""
+        job = start_export(hub_id, 'bom_lines', 'csv')
+        ExportJob.objects.filter(pk=job.pk).update(status='running')
+        assert run_export(job.pk) is None
+        assert not list(sync_exports.iterdir())
+        ExportJob.objects.filter(pk=job.pk).update(status='pending')
+        assert run_export(job.pk).status == 'done'
+        assert run_export(job.pk) is None
+
+    def test_purge(self, hub_id, sync_exports, django_capture_on_commit_callbacks):
+        """Test old jobs are purged together with their files."""
+        with django_capture_on_commit_callbacks(execute=True):
+            job = start_export(hub_id, 'production_orders', 'csv')
+        job.refresh_from_db()
+        assert purge_exports(timezone.now() + timedelta(seconds=1)) == 1
+        assert not list(sync_exports.iterdir())
+
+
+@pytest.mark.django_db
+class TestBatchEntry:
+    """Batch entry with ingredients tests."""
+
+    def test_records_batch_with_ingredients(self, hub_id):
+        """Test the batch and its ingredients are saved together, in base units."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='draft')
+        source = ProductionBatch.objects.create(hub_id=hub_id, batch_number='FLOUR-7')
+        batch = record_batch(order, {'batch_number': 'B-1', 'quantity_produced': '12'}, [
+            {'description': 'Flour', 'source_batch': 'FLOUR-7', 'quantity_used': '500', 'unit': 'g'},
+            {'description': '', 'quantity_used': ''},
+            {'description': 'Water', 'supplier_lot': 'W-1', 'quantity_used': '0.3', 'unit': 'l'},
+        ])
+        assert batch.ingredient_count == 2
+        batch.refresh_from_db()
+        assert (batch.production_order_id, batch.quantity_produced, batch.quality_status) == (order.pk, Decimal('12'), 'pending')
+        flour, water = batch.ingredients.order_by('description')
+        assert flour.source_batch_id == source.pk
+        assert (flour.base_quantity, flour.base_unit) == (Decimal('0.5'), 'kg')
+        assert (water.supplier_lot, water.base_unit) == ('W-1', 'l')
+
+    def test_invalid_rows_save_nothing(self, hub_id):
+        """Test every problem is reported and nothing is written when any row is invalid."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='draft')
+        with pytest.raises(BatchEntryError) as exc:
+            record_batch(order, {'batch_number': 'B-1', 'expiry_date': 'soon'}, [
+                {'description': 'Flour', 'quantity_used': '1'},
+                {'description': 'Salt', 'quantity_used': '-1'},
+                {'description': 'Yeast', 'quantity_used': '1', 'source_batch': 'MISSING'},
+            ])
+        assert [error.row for error in exc.value.errors] == [None, 2, 3]
+        assert not ProductionBatch.objects.filter(hub_id=hub_id).exists()
+        assert not BatchIngredient.objects.filter(hub_id=hub_id).exists()
+
+    def test_queries_do_not_grow_with_rows(self, hub_id, django_assert_max_num_queries):
+        """Test forty ingredients are recorded with a fixed number of queries."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', status='draft')
+        ProductionBatch.objects.create(hub_id=hub_id, batch_number='FLOUR-7')
+        get_counters(hub_id)
+        bump(hub_id, ProductionBatch, BatchIngredient)
+        rows = [
+            {'description': f'Ingredient {i}', 'source_batch': 'FLOUR-7', 'quantity_used': '250', 'unit': 'g'}
+            for i in range(40)
+        ]
+        with django_assert_max_num_queries(12):
+            batch = record_batch(order, {'batch_number': 'B-1'}, rows)
+        assert batch.ingredients.count() == 40
+
+
+@pytest.mark.django_db
+class TestBackflush:
+    """Ingredient backflush tests."""
+
+    def test_scaled_with_exact_decimals(self, hub_id):
+        """Test the BOM usage is scaled to the quantity produced and rounded once."""
+        bom = _bom(hub_id, 'BREAD', output_quantity='7')
+        _line(hub_id, bom, 'Flour', '3', unit='kg')
+        _line(hub_id, bom, 'Salt', '0.01', unit='kg')
+        assert expected_rows(bom.pk, Decimal('10')) == [
+            {'description': 'Flour', 'quantity_used': '4.29', 'unit': 'kg'},
+            {'description': 'Salt', 'quantity_used': '0.01', 'unit': 'kg'},
+        ]
+        assert expected_rows(bom.pk, Decimal('1')) == [{'description': 'Flour', 'quantity_used': '0.43', 'unit': 'kg'}]
+
+    def test_record_batch_merges_operator_rows(self, hub_id):
+        """Test operator rows add lots to, override or extend the BOM ingredients."""
+        bom = _bom(hub_id, 'BREAD', output_quantity='10')
+        _line(hub_id, bom, 'Flour', '5', unit='kg')
+        _line(hub_id, bom, 'Water', '3', unit='l')
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', bom=bom, status='draft')
+        batch = record_batch(order, {'batch_number': 'B-1', 'quantity_produced': '20'}, [
+            {'description': 'flour', 'supplier_lot': 'F-9', 'unit': 'kg'},
+            {'description': 'Water', 'quantity_used': '6500', 'unit': 'ml'},
+            {'description': 'Seeds', 'quantity_used': '1', 'unit': 'kg'},
+        ], backflush=True)
+        rows = {
+            ingredient.description: (ingredient.supplier_lot, ingredient.quantity_used, ingredient.base_quantity)
+            for ingredient in batch.ingredients.all()
+        }
+        assert rows == {
+            'Flour': ('F-9', Decimal('10.00'), Decimal('10')),
+            'Water': ('', Decimal('6500.00'), Decimal('6.5')),
+            'Seeds': ('', Decimal('1.00'), Decimal('1')),
+        }
+
+    def test_backflush_historical_batches(self, hub_id, django_assert_max_num_queries):
+        """Test batches without ingredients are backflushed in one pass, with queries bounded by the insert chunks."""
+        bom = _bom(hub_id, 'BREAD', output_quantity='2')
+        _line(hub_id, bom, 'Flour', '1', unit='kg')
+        _line(hub_id, bom, 'Yeast', '20', unit='g')
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', bom=bom, status='done')
+        ProductionBatch.objects.bulk_create([
+            ProductionBatch(hub_id=hub_id, production_order=order, batch_number=f'B-{i:03d}', quantity_produced=Decimal(i))
+            for i in range(300)
+        ])
+        done = ProductionBatch.objects.get(hub_id=hub_id, batch_number='B-001')
+        BatchIngredient.objects.create(hub_id=hub_id, batch=done, description='Flour', quantity_used=Decimal('1'))
+        bump(hub_id, BatchIngredient)
+        # Six queries whatever the batch count, plus one INSERT per chunk the backend allows.
+        per_insert = connection.ops.bulk_batch_size(BatchIngredient._meta.concrete_fields, [None] * 596)
+        inserts = -(-596 // min(INSERT_BATCH_SIZE, per_insert or INSERT_BATCH_SIZE))
+        with django_assert_max_num_queries(6 + inserts):
+            result = backflush_batches(hub_id)
+        assert (result.batches, result.ingredients) == (298, 596)
+        yeast = BatchIngredient.objects.get(batch__batch_number='B-005', description='Yeast')
+        assert (yeast.quantity_used, yeast.base_quantity) == (Decimal('50.00'), Decimal('0.05'))
+        assert backflush_batches(hub_id).ingredients == 0
+
+
+@pytest.mark.django_db
+class TestExpiry:
+    """Expiry watch tests."""
+
+    def _batch(self, hub_id, number, days, status='approved', **kwargs):
+        return ProductionBatch.objects.create(
+            hub_id=hub_id, batch_number=number, quality_status=status,
+            expiry_date=date(2026, 3, 1) + timedelta(days=days), **kwargs,
+        )
+
+    def test_watch_groups_window_by_status(self, hub_id):
+        """Test only live batches inside the window are listed, grouped by status and soonest first."""
+        self._batch(hub_id, 'B-LATE', 5)
+        self._batch(hub_id, 'B-SOON', 1)
+        self._batch(hub_id, 'B-QC', 7, status='pending')
+        self._batch(hub_id, 'B-PAST', -1)
+        self._batch(hub_id, 'B-FAR', 8)
+        self._batch(hub_id, 'B-GONE', 2, is_deleted=True)
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', expiry_date=date(2026, 3, 3))
+        watch = expiry_watch(hub_id, 7, today=date(2026, 3, 1))
+        assert [(group.status, [b.batch_number for b in group.batches]) for group in watch.groups] == [
+            ('pending', ['B-QC']),
+            ('approved', ['B-SOON', 'B-LATE']),
+        ]
+        assert [order.order_number for order in watch.orders] == ['PO-1']
+        summary = expiry_summary(hub_id, 7, today=date(2026, 3, 1))
+        assert [(status, count) for status, _label, count in summary] == [
+            ('pending', 1), ('approved', 2), ('rejected', 0), ('quarantine', 0),
+        ]
+
+    def test_digest_command(self, hub_id):
+        """Test the digest lists the window of every hub with batches, in date order."""
+        self._batch(hub_id, 'B-2', 3)
+        self._batch(hub_id, 'B-1', 1)
+        self._batch(hub_id, 'B-9', 30)
+        ManufacturingSettings.objects.create(hub_id=hub_id, expiry_warning_days=5)
+        out = StringIO()
+        call_command('manufacturing_expiry_digest', '--date', '2026-03-01', stdout=out)
+        lines = out.getvalue().splitlines()
+        assert lines[0] == f'{hub_id}: 2 batches expiring from 2026-03-01 to 2026-03-06'
+        assert [line.split()[1] for line in lines[1:3]] == ['B-1', 'B-2']
+        out = StringIO()
+        call_command('manufacturing_expiry_digest', '--hub', str(hub_id), '--days', '60', '--date', '2026-03-01', stdout=out)
+        assert 'B-9' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestYield:
+    """Planned-vs-actual yield tests."""
+
+    def test_annotated_columns(self, hub_id, django_assert_num_queries):
+        """Test produced, approved, rejected, yield and variance come with the page in one rounded query."""
+        _order(hub_id, 'PO-1', '10', batches=[('6', 'approved'), ('3', 'rejected'), ('5', 'approved', True)])
+        _order(hub_id, 'PO-2', '4', batches=[('5', 'pending')])
+        _order(hub_id, 'PO-3', '0')
+        _order(hub_id, 'PO-4', '3', batches=[('1', 'approved')])
+        qs = annotate_yield(ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False))
+        with django_assert_num_queries(1):
+            rows = {
+                order.order_number: (
+                    order.produced_quantity, order.approved_quantity, order.rejected_quantity,
+                    order.yield_percent, order.variance,
+                )
+                for order in qs.order_by('order_number')[:10]
+            }
+        assert rows == {
+            'PO-1': (Decimal('9'), Decimal('6'), Decimal('3'), Decimal('90.0'), Decimal('-1')),
+            'PO-2': (Decimal('5'), Decimal('0'), Decimal('0'), Decimal('125.0'), Decimal('1')),
+            'PO-3': (Decimal('0'), Decimal('0'), Decimal('0'), None, Decimal('0')),
+            'PO-4': (Decimal('1'), Decimal('1'), Decimal('0'), Decimal('33.3'), Decimal('-2')),
+        }
+        # Read back at the fields' precision, whatever the backend returns.
+        assert [str(value) for value in rows['PO-4']] == ['1.00', '1.00', '0.00', '33.3', '-2.00']
+        assert [order.order_number for order in qs.order_by('-yield_percent')[:2]] == ['PO-2', 'PO-1']
+
+    def test_bom_report(self, hub_id):
+        """Test the per-BOM report totals the orders ending in the range only."""
+        bread, cake = _bom(hub_id, 'BREAD'), _bom(hub_id, 'CAKE')
+        _order(hub_id, 'PO-1', '10', bread, end_date=date(2026, 3, 2), batches=[('8', 'approved'), ('1', 'rejected')])
+        _order(hub_id, 'PO-2', '10', bread, end_date=date(2026, 3, 9), batches=[('11', 'approved')])
+        _order(hub_id, 'PO-3', '5', cake, end_date=date(2026, 3, 5), batches=[('5', 'pending')])
+        _order(hub_id, 'PO-4', '10', bread, end_date=date(2026, 4, 1), batches=[('1', 'approved')])
+        report = bom_yield_report(hub_id, date(2026, 3, 1), date(2026, 3, 31))
+        rows = {row.name: (row.orders, row.planned, row.produced, row.approved, row.rejected, row.yield_percent) for row in report}
+        assert rows == {
+            'BREAD': (2, Decimal('20'), Decimal('20'), Decimal('19'), Decimal('1'), Decimal('100.0')),
+            'CAKE': (1, Decimal('5'), Decimal('5'), Decimal('0'), Decimal('0'), Decimal('100.0')),
+        }
+        assert (report.total.orders, report.total.variance) == (3, Decimal('0'))
+
+
+@pytest.mark.django_db
+class TestNumbering:
+    """Order and batch number sequence tests."""
+
+    def test_pattern(self):
+        """Test date tokens and the padded sequence render, and the prefix keeps the sequence slot."""
+        pattern = NumberPattern('PO-{YYYY}{MM}-{seq:06}')
+        assert pattern.render(date(2026, 3, 2), 42) == 'PO-202603-000042'
+        assert pattern.render(date(2026, 3, 2), 1234567) == 'PO-202603-1234567'
+        assert pattern.prefix(date(2026, 3, 2)) == 'PO-202603-{seq}'
+        assert NumberPattern('B{seq}').render(date(2026, 3, 2), 7) == 'B7'
+
+    @pytest.mark.parametrize('pattern', ['PO-{YYYY}', '{seq}-{seq}', 'PO-{week}-{seq}', 'PO-{seq', 'X' * 50 + '{seq}'])
+    def test_invalid_pattern(self, pattern):
+        """Test patterns without exactly one sequence, with unknown tokens or too long are rejected."""
+        with pytest.raises(PatternError):
+            NumberPattern(pattern)
+
+    def test_sequence_per_prefix(self, hub_id):
+        """Test numbers continue per hub and prefix, and a new year starts again from 1."""
+        today = date(2026, 3, 2)
+        assert reserve(hub_id, 'order', 2, today) == ['PO-2026-000001', 'PO-2026-000002']
+        assert reserve(hub_id, 'order', 1, today) == ['PO-2026-000003']
+        assert reserve(hub_id, 'batch', 1, today) == ['LOT-2026-000001']
+        assert reserve(hub_id, 'order', 1, date(2027, 1, 1)) == ['PO-2027-000001']
+        other_hub = uuid.uuid4()
+        assert reserve(other_hub, 'order', 1, today) == ['PO-2026-000001']
+        assert NumberSequence.objects.get(hub_id=hub_id, key='order:PO-2026-{seq}').last_value == 3
+
+    def test_allocator_reserves_blocks(self, hub_id):
+        """Test an allocator takes the sequence row once per block and hands the block out in order."""
+        allocator = NumberAllocator(hub_id, 'order', block_size=10, pattern='T-{seq:03}')
+        numbers = [allocator.next() for _i in range(12)]
+        assert numbers == [f'T-{i:03d}' for i in range(1, 13)]
+        assert NumberSequence.objects.get(hub_id=hub_id).last_value == 20
+
+    def test_skips_numbers_typed_by_hand(self, hub_id):
+        """Test automatic numbering steps over a live number entered manually."""
+        ManufacturingSettings.objects.create(hub_id=hub_id, order_number_pattern='T-{seq}')
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='T-1')
+        order = save_numbered(ProductionOrder(hub_id=hub_id), 'order')
+        assert order.order_number == 'T-2'
+
+    def test_batch_numbered_on_entry(self, hub_id):
+        """Test a batch recorded without a number gets one, and a taken number is an entry error."""
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1')
+        batch = record_batch(order, {'quantity_produced': '5'})
+        assert batch.batch_number.startswith('LOT-')
+        with pytest.raises(BatchEntryError) as exc:
+            record_batch(order, {'batch_number': batch.batch_number})
+        assert exc.value.errors[0].message == f'Batch number "{batch.batch_number}" is already used.'
+
+    def test_live_numbers_unique(self, hub_id):
+        """Test the unique constraint covers live rows only."""
+        from django.db import IntegrityError, transaction
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', is_deleted=True)
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1')
+        with pytest.raises(IntegrityError), transaction.atomic():
+            ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1')
+
+
+def _allocate(allocate, count):
+    from django.db import connection
+    try:
+        return [allocate() for _i in range(count)]
+    finally:
+        connection.close()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestNumberingConcurrency:
+    """Concurrent number allocation stress tests."""
+
+    def test_shared_allocator_threads(self, hub_id):
+        """Stress: eight threads sharing one allocator get 4000 distinct numbers at hundreds per second."""
+        allocator = NumberAllocator(hub_id, 'order', block_size=100, pattern='PO-{seq:06}')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(_allocate, allocator.next, 500) for _i in range(8)]
+            numbers = [number for future in futures for number in future.result()]
+        elapsed = time.perf_counter() - started
+        assert len(numbers) == len(set(numbers)) == 4000
+        assert NumberSequence.objects.get(hub_id=hub_id).last_value == 4000
+        assert elapsed < 4.0, f'allocating 4000 numbers took {elapsed:.2f}s'
+
+    @pytest.mark.skipif(connection.vendor == 'sqlite', reason='SQLite serialises writers with a database lock')
+    def test_row_lock_threads(self, hub_id):
+        """Stress: eight workers reserving one number at a time on the same row never collide."""
+        def allocate():
+            return reserve(hub_id, 'order', 1, pattern='PO-{seq:06}')[0]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(_allocate, allocate, 100) for _i in range(8)]
+            numbers = [number for future in futures for number in future.result()]
+        elapsed = time.perf_counter() - started
+        assert len(numbers) == len(set(numbers)) == 800
+        assert NumberSequence.objects.get(hub_id=hub_id).last_value == 800
+        assert elapsed < 4.0, f'allocating 800 numbers one at a time took {elapsed:.2f}s'
+
+
+@pytest.mark.django_db
+class TestArchive:
+    """Archival of deleted and closed records."""
+
+    def _closed_order(self, hub_id, number, days_ago=400):
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number=number, status='done')
+        ProductionOrder.objects.filter(pk=order.pk).update(updated_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def test_closed_orders_archived_and_traceable(self, hub_id):
+        """Test a closed order moves out with its batches and ingredients, and its lots still trace."""
+        order = self._closed_order(hub_id, 'PO-OLD')
+        recent = self._closed_order(hub_id, 'PO-NEW', days_ago=10)
+        batch = ProductionBatch.objects.create(hub_id=hub_id, production_order=order, batch_number='B-OLD')
+        BatchIngredient.objects.create(
+            hub_id=hub_id, batch=batch, description='Flour', supplier_lot='FLOUR-1', quantity_used=Decimal('2.50'), unit='kg',
+        )
+        result = archive_hub(hub_id, closed_before=timezone.now() - timedelta(days=365))
+        assert result.rows == {'productionorder': 1, 'productionbatch': 1, 'batchingredient': 1}
+        assert list(ProductionOrder.all_objects.filter(hub_id=hub_id)) == [recent]
+        assert not ProductionBatch.all_objects.filter(hub_id=hub_id).exists()
+        assert get_counters(hub_id).batches == 0
+
+        [root] = trace_lot(hub_id, 'FLOUR-1').roots
+        [node] = root.children
+        assert (node.batch.pk, node.batch.is_archived, node.quantity) == (batch.pk, True, Decimal('2.50'))
+        assert trace_batch(hub_id, 'B-OLD').lots == ['FLOUR-1']
+
+    def test_batch_consumed_by_live_batch_kept(self, hub_id):
+        """Test a closed order stays while one of its batches is an ingredient of a live batch."""
+        order = self._closed_order(hub_id, 'PO-OLD')
+        dough = ProductionBatch.objects.create(hub_id=hub_id, production_order=order, batch_number='DOUGH-1')
+        bread = ProductionBatch.objects.create(hub_id=hub_id, batch_number='BREAD-1')
+        BatchIngredient.objects.create(hub_id=hub_id, batch=bread, description='Dough', source_batch=dough)
+        result = archive_hub(hub_id, closed_before=timezone.now())
+        assert result.total == 0
+        assert ProductionOrder.objects.filter(pk=order.pk).exists()
+
+    def test_deleted_rows_after_retention(self, hub_id):
+        """Test deleted rows older than the cutoff are archived unless live rows still point to them."""
+        long_ago = timezone.now() - timedelta(days=200)
+        unused, used = _bom(hub_id, 'UNUSED'), _bom(hub_id, 'USED')
+        _line(hub_id, unused, 'Flour', '1')
+        ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-1', bom=used)
+        fresh = _bom(hub_id, 'FRESH')
+        BillOfMaterials.objects.filter(pk__in=[unused.pk, used.pk]).update(is_deleted=True, deleted_at=long_ago)
+        BillOfMaterials.objects.filter(pk=fresh.pk).update(is_deleted=True, deleted_at=timezone.now())
+        result = archive_hub(hub_id, deleted_before=timezone.now() - timedelta(days=90))
+        assert result.rows == {'billofmaterials': 1, 'bomline': 1}
+        assert set(BillOfMaterials.all_objects.filter(hub_id=hub_id).values_list('name', flat=True)) == {'USED', 'FRESH'}
+        record = ArchivedRecord.objects.get(model='billofmaterials')
+        assert (record.record_id, record.data['name']) == (unused.pk, 'UNUSED')
@@ -54,6 +54,14 @@ class TestBillOfMaterialsViews:
         response = auth_client.get(url, {'sort': 'created_at', 'dir': 'desc'})
         assert response.status_code == 200
 
+    def test_list_does_not_recost(self, auth_client, bill_of_materials):
+        """Test reading the list leaves stale costs alone instead of recosting."""
+        from manufacturing.models import BillOfMaterials
+        url = reverse('manufacturing:bill_of_materialses_list')
+        response = auth_client.get(url, {'sort': 'unit_cost'})
+        assert response.status_code == 200
+        assert BillOfMaterials.objects.get(pk=bill_of_materials.pk).unit_cost is None
+
     def test_export_csv(self, auth_client):
         """Test CSV export."""
         url = reverse('manufacturing:bill_of_materialses_list')
@@ -122,6 +130,18 @@ class TestBillOfMaterialsViews:
         bill_of_materials.refresh_from_db()
         assert bill_of_materials.is_active != original
 
+    def test_mutations_swap_single_rows(self, auth_client, bill_of_materials):
+        """Test edits answer with the row out of band, or a list refresh when the row may move."""
+        toggle = reverse('manufacturing:bill_of_materials_toggle_status', args=[bill_of_materials.pk])
+        response = auth_client.post(toggle, {'sort': 'code'})
+        assert response['HX-Reswap'] == 'none'
+        assert f'id="bill_of_materials-row-{bill_of_materials.pk}" hx-swap-oob="true"' in response.content.decode()
+        response = auth_client.post(toggle, {'sort': 'is_active'})
+        assert response['HX-Trigger'] == 'bill_of_materialses-changed'
+        delete = reverse('manufacturing:bill_of_materials_delete', args=[bill_of_materials.pk])
+        response = auth_client.post(delete)
+        assert 'hx-swap-oob="delete"' in response.content.decode()
+
     def test_bulk_delete(self, auth_client, bill_of_materials):
         """Test bulk delete."""
         url = reverse('manufacturing:bill_of_materialses_bulk_action')
@@ -178,6 +198,37 @@ class TestBOMLineViews:
         response = auth_client.get(url, {'export': 'excel'})
         assert response.status_code == 200
 
+    def test_conditional_get(self, auth_client, bom_line):
+        """Test an unchanged list partial is answered with 304 and a change invalidates it."""
+        url = reverse('manufacturing:bom_lines_list')
+        headers = {'HTTP_HX_REQUEST': 'true', 'HTTP_HX_TARGET': 'datatable-body'}
+        response = auth_client.get(url, **headers)
+        assert response.status_code == 200
+        etag = response['ETag']
+        response = auth_client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        assert response.status_code == 304
+        bom_line.description = 'Changed'
+        bom_line.save()
+        response = auth_client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_background_export(self, auth_client, bom_line, sync_exports, django_capture_on_commit_callbacks):
+        """Test a background export is queued, polled and downloaded."""
+        from manufacturing.models import ExportJob
+        url = reverse('manufacturing:bom_lines_list')
+        with django_capture_on_commit_callbacks(execute=True):
+            response = auth_client.get(url, {'export': 'csv', 'background': '1'})
+        assert response.status_code == 200
+        job = ExportJob.objects.get()
+        response = auth_client.get(reverse('manufacturing:export_job_status', args=[job.pk]))
+        assert response.status_code == 200
+        assert 'every 2s' not in response.content.decode()
+        response = auth_client.get(reverse('manufacturing:export_job_download', args=[job.pk]))
+        assert response.status_code == 200
+        content = b''.join(response.streaming_content)
+        assert b'Test Description' in content and bom_line.bom.name.encode() in content
+
     def test_add_form_loads(self, auth_client):
         """Test add form loads."""
         url = reverse('manufacturing:bom_line_add')
@@ -212,6 +263,23 @@ class TestBOMLineViews:
         response = auth_client.post(url, data)
         assert response.status_code == 200
 
+    def test_edit_rejects_invalid_sub_assembly(self, auth_client, hub_id):
+        """Test a malformed or cyclic sub-assembly re-renders the panel with an error."""
+        from manufacturing.models import BillOfMaterials, BOMLine
+        dough = BillOfMaterials.objects.create(hub_id=hub_id, name='Dough', code='DGH')
+        pizza = BillOfMaterials.objects.create(hub_id=hub_id, name='Pizza', code='PZZ')
+        BOMLine.objects.create(hub_id=hub_id, bom=pizza, component_bom=dough, description='Dough', quantity=1)
+        line = BOMLine.objects.create(hub_id=hub_id, bom=dough, description='Flour', quantity=1, unit='kg')
+        url = reverse('manufacturing:bom_line_edit', args=[line.pk])
+        data = {'description': 'Flour', 'quantity': '1', 'unit': 'kg'}
+        for component in ('not-a-uuid', str(pizza.pk)):
+            response = auth_client.post(url, {**data, 'component_bom': component})
+            assert response.status_code == 200
+            assert response['HX-Retarget'] == '#bom_line-panel-content'
+            assert response.context['error']
+        line.refresh_from_db()
+        assert line.component_bom_id is None
+
     def test_delete(self, auth_client, bom_line):
         """Test soft delete via POST."""
         url = reverse('manufacturing:bom_line_delete', args=[bom_line.pk])
@@ -228,6 +296,30 @@ class TestBOMLineViews:
         bom_line.refresh_from_db()
         assert bom_line.is_deleted is True
 
+    def test_import_form_loads(self, auth_client):
+        """Test import panel loads."""
+        url = reverse('manufacturing:bom_lines_import')
+        response = auth_client.get(url)
+        assert response.status_code == 200
+
+    def test_import_post(self, auth_client, bill_of_materials):
+        """Test uploading a CSV creates the lines."""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from manufacturing.models import BOMLine
+        upload = SimpleUploadedFile('lines.csv', b'bom_code,description,quantity,unit\nTST-001,Flour,2,kg\n')
+        url = reverse('manufacturing:bom_lines_import')
+        response = auth_client.post(url, {'file': upload})
+        assert response.status_code == 200
+        assert response.context['result'].created == 1
+        assert BOMLine.objects.filter(bom=bill_of_materials, description='Flour').exists()
+
+    def test_import_without_file(self, auth_client):
+        """Test posting without a file shows an error."""
+        url = reverse('manufacturing:bom_lines_import')
+        response = auth_client.post(url, {})
+        assert response.status_code == 200
+        assert response.context['error']
+
     def test_list_requires_auth(self, client):
         """Test list requires authentication."""
         url = reverse('manufacturing:bom_lines_list')
@@ -288,12 +380,23 @@ class TestProductionOrderViews:
         data = {
             'order_number': 'New Order Number',
             'quantity': '100.00',
-            'status': 'New Status',
+            'status': 'draft',
             'start_date': '2025-01-15',
         }
         response = auth_client.post(url, data)
         assert response.status_code == 200
 
+    def test_add_numbers_orders(self, auth_client, hub_id, production_order):
+        """Test an order added without a number is numbered, and a used number sends the panel back."""
+        from manufacturing.models import ProductionOrder
+        url = reverse('manufacturing:production_order_add')
+        response = auth_client.post(url, {'order_number': '', 'quantity': '1'}, HTTP_HX_REQUEST='true')
+        assert response.status_code == 200
+        assert ProductionOrder.objects.filter(hub_id=hub_id, order_number__startswith='PO-').exists()
+        response = auth_client.post(url, {'order_number': 'NUM-001', 'quantity': '1'}, HTTP_HX_REQUEST='true')
+        assert response['HX-Retarget'] == '#production_order-panel-content'
+        assert ProductionOrder.objects.filter(hub_id=hub_id, order_number='NUM-001').count() == 1
+
     def test_edit_form_loads(self, auth_client, production_order):
         """Test edit form loads."""
         url = reverse('manufacturing:production_order_edit', args=[production_order.pk])
@@ -306,11 +409,36 @@ class TestProductionOrderViews:
         data = {
             'order_number': 'Updated Order Number',
             'quantity': '100.00',
-            'status': 'Updated Status',
+            'status': 'confirmed',
             'start_date': '2025-01-15',
         }
         response = auth_client.post(url, data)
         assert response.status_code == 200
+        production_order.refresh_from_db()
+        assert production_order.status == 'confirmed'
+
+    def test_edit_rejects_invalid_transition(self, auth_client, production_order):
+        """Test a draft order cannot jump to done and the panel is sent back with the error."""
+        url = reverse('manufacturing:production_order_edit', args=[production_order.pk])
+        response = auth_client.post(url, {'order_number': 'NUM-001', 'quantity': '1', 'status': 'done'})
+        assert response.status_code == 200
+        assert response['HX-Retarget'] == '#production_order-panel-content'
+        production_order.refresh_from_db()
+        assert production_order.status == 'draft'
+
+    def test_bulk_transition(self, auth_client, hub_id, production_order):
+        """Test bulk confirm moves drafts and reports the rejected orders per status."""
+        from manufacturing.models import ProductionOrder
+        done = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-D', status='done')
+        url = reverse('manufacturing:production_orders_bulk_action')
+        response = auth_client.post(url, {
+            'ids': f'{production_order.pk},{done.pk}', 'action': 'transition', 'status': 'confirmed',
+        })
+        assert response.status_code == 200
+        assert response.context['result'].moved == {'draft': 1}
+        assert response.context['result'].rejected == {'done': 1}
+        production_order.refresh_from_db()
+        assert production_order.status == 'confirmed'
 
     def test_delete(self, auth_client, production_order):
         """Test soft delete via POST."""
@@ -328,6 +456,77 @@ class TestProductionOrderViews:
         production_order.refresh_from_db()
         assert production_order.is_deleted is True
 
+    def test_schedule(self, auth_client, hub_id):
+        """Test scheduling fills in dates of confirmed orders."""
+        from decimal import Decimal
+        from manufacturing.models import ManufacturingSettings, ProductionOrder
+        ManufacturingSettings.objects.create(hub_id=hub_id, daily_capacity=Decimal('10'))
+        order = ProductionOrder.objects.create(hub_id=hub_id, order_number='PO-S', status='confirmed')
+        url = reverse('manufacturing:production_orders_schedule')
+        response = auth_client.post(url)
+        assert response.status_code == 200
+        order.refresh_from_db()
+        assert order.start_date is not None and order.end_date is not None
+
+    def test_yield_columns(self, auth_client, production_order):
+        """Test the list sorts and exports by the yield columns."""
+        from decimal import Decimal
+        from manufacturing.models import ProductionBatch
+        ProductionBatch.objects.create(
+            hub_id=production_order.hub_id, production_order=production_order,
+            batch_number='B-1', quantity_produced=Decimal('3'),
+        )
+        url = reverse('manufacturing:production_orders_list')
+        response = auth_client.get(url, {'sort': 'yield', 'dir': 'desc'}, HTTP_HX_REQUEST='true', HTTP_HX_TARGET='datatable-body')
+        assert response.status_code == 200
+        assert response.context['production_orders'][0].produced_quantity == Decimal('3')
+        response = auth_client.get(url, {'export': 'csv', 'sort': 'variance'})
+        header, row = b''.join(response.streaming_content).decode().splitlines()[:2]
+        assert header.endswith('Produced,Approved,Rejected,Yield %,Variance')
+        assert row.endswith(',3.00,0.00,0.00,,3.00')
+
+    def test_yield_report(self, auth_client):
+        """Test the per-BOM yield report loads for a date range."""
+        url = reverse('manufacturing:yield_report')
+        response = auth_client.get(url, {'start': '2026-03-01', 'end': '2026-03-31'})
+        assert response.status_code == 200
+        assert len(response.context['report']) == 0
+
+    def test_add_batch_with_ingredients(self, auth_client, production_order):
+        """Test a batch form post records its ingredient rows, or returns the panel with errors."""
+        url = reverse('manufacturing:batch_add', args=[production_order.pk])
+        response = auth_client.post(url, {
+            'batch_number': 'B-1', 'quantity_produced': '10',
+            'ingredient_description': ['Flour', 'Salt'],
+            'ingredient_quantity_used': ['500', ''],
+            'ingredient_unit': ['g', 'g'],
+        }, HTTP_HX_REQUEST='true')
+        assert response.status_code == 200
+        assert response['HX-Retarget'] == '#batch-panel-content'
+        assert not production_order.batches.exists()
+        response = auth_client.post(url, {
+            'batch_number': 'B-1', 'quantity_produced': '10',
+            'ingredient_description': ['Flour', ''],
+            'ingredient_quantity_used': ['500', ''],
+            'ingredient_unit': ['g', ''],
+        }, HTTP_HX_REQUEST='true')
+        assert response.status_code == 200
+        assert 'HX-Retarget' not in response
+        batch = production_order.batches.get()
+        assert batch.ingredients.get().base_unit == 'kg'
+
+    def test_add_batch_json(self, auth_client, production_order):
+        """Test a JSON batch post answers 201, or 400 with row errors."""
+        url = reverse('manufacturing:batch_add', args=[production_order.pk])
+        payload = {'batch_number': 'B-1', 'ingredients': [{'description': 'Flour', 'quantity_used': 0}]}
+        response = auth_client.post(url, payload, content_type='application/json')
+        assert response.status_code == 400
+        assert response.json()['errors'][0]['row'] == 1
+        payload['ingredients'][0]['quantity_used'] = 2
+        response = auth_client.post(url, payload, content_type='application/json')
+        assert response.status_code == 201
+        assert response.json()['ingredients'] == 1
+
     def test_list_requires_auth(self, client):
         """Test list requires authentication."""
         url = reverse('manufacturing:production_orders_list')
@@ -345,9 +544,398 @@ class TestSettings:
         response = auth_client.get(url)
         assert response.status_code == 200
 
+    def test_settings_save(self, auth_client, hub_id):
+        """Test scheduling settings are saved per hub."""
+        from manufacturing.models import ManufacturingSettings
+        url = reverse('manufacturing:settings')
+        response = auth_client.post(url, {'daily_capacity': '120', 'work_on_weekends': 'on'})
+        assert response.status_code == 200
+        settings = ManufacturingSettings.objects.get(pk=hub_id)
+        assert settings.daily_capacity == 120
+        assert settings.work_on_weekends and not settings.auto_schedule
+
+    def test_unit_add_and_delete(self, auth_client, hub_id):
+        """Test custom units are added, rejected when invalid and deleted."""
+        from manufacturing.models import UnitOfMeasure
+        url = reverse('manufacturing:unit_add')
+        response = auth_client.post(url, {'code': 'Sack', 'dimension': 'mass', 'factor': '25'})
+        assert response.status_code == 200
+        unit = UnitOfMeasure.objects.get(hub_id=hub_id)
+        assert (unit.code, unit.factor) == ('sack', 25)
+        for factor in ('-1', 'NaN', 'Infinity', '1234567890', '0.0000000001'):
+            response = auth_client.post(url, {'code': 'tray', 'dimension': 'mass', 'factor': factor})
+            assert response.status_code == 200 and response.context['unit_error']
+        assert UnitOfMeasure.objects.filter(hub_id=hub_id).count() == 1
+        response = auth_client.post(reverse('manufacturing:unit_delete', args=[unit.pk]))
+        assert response.status_code == 200
+        assert not UnitOfMeasure.objects.filter(hub_id=hub_id).exists()
+
     def test_settings_requires_auth(self, client):
         """Test settings requires authentication."""
         url = reverse('manufacturing:settings')
         response = client.get(url)
         assert response.status_code == 302
 
+
+
+@pytest.mark.django_db
+class TestMRPView:
+    """Material requirements view tests."""
+
+    def test_mrp_loads(self, auth_client):
+        """Test MRP page loads."""
+        url = reverse('manufacturing:mrp')
+        response = auth_client.get(url, {'bucket': 'month'})
+        assert response.status_code == 200
+
+    def test_mrp_requires_auth(self, client):
+        """Test MRP requires authentication."""
+        url = reverse('manufacturing:mrp')
+        response = client.get(url)
+        assert response.status_code == 302
+
+
+@pytest.mark.django_db
+class TestExpiryView:
+    """Expiry watch view tests."""
+
+    def test_expiry_loads(self, auth_client, hub_id):
+        """Test the expiry watch lists batches expiring in the chosen window."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from manufacturing.models import ProductionBatch
+        ProductionBatch.objects.create(
+            hub_id=hub_id, batch_number='B-EXP', expiry_date=timezone.localdate() + timedelta(days=3),
+        )
+        url = reverse('manufacturing:expiry')
+        response = auth_client.get(url, {'days': '14'})
+        assert response.status_code == 200
+        assert response.context['watch'].batches_count == 1
+        assert response.context['days'] == 14
+
+    def test_dashboard_widget(self, auth_client, hub_id):
+        """Test the dashboard counts batches expiring within the hub warning."""
+        from django.utils import timezone
+        from manufacturing.models import ProductionBatch
+        ProductionBatch.objects.create(hub_id=hub_id, batch_number='B-EXP', expiry_date=timezone.localdate())
+        response = auth_client.get(reverse('manufacturing:dashboard'))
+        assert response.status_code == 200
+        assert dict((status, count) for status, _label, count in response.context['expiring'])['pending'] == 1
+
+
+@pytest.mark.django_db
+class TestTraceView:
+    """Lot traceability view tests."""
+
+    def test_trace_loads(self, auth_client):
+        """Test trace page loads without a query."""
+        url = reverse('manufacturing:trace')
+        response = auth_client.get(url)
+        assert response.status_code == 200
+        assert response.context['result'] is None
+
+    @pytest.mark.parametrize('mode', ['lot', 'sources', 'uses'])
+    def test_trace_query(self, auth_client, hub_id, mode):
+        """Test each trace mode renders."""
+        from manufacturing.models import BatchIngredient, ProductionBatch
+        batch = ProductionBatch.objects.create(hub_id=hub_id, batch_number='B-1')
+        BatchIngredient.objects.create(hub_id=hub_id, batch=batch, description='Milk', supplier_lot='L-1')
+        url = reverse('manufacturing:trace')
+        response = auth_client.get(url, {'q': 'L-1' if mode == 'lot' else 'B-1', 'mode': mode})
+        assert response.status_code == 200
+        assert response.context['result']
+
+    def test_trace_requires_auth(self, client):
+        """Test trace requires authentication."""
+        url = reverse('manufacturing:trace')
+        response = client.get(url)
+        assert response.status_code == 302
+
+
+@pytest.mark.django_db
+class TestCursorPagination:
+    """Keyset pagination tests."""
+
+    @pytest.fixture
+    def orders(self, hub_id):
+        from datetime import date, timedelta
+        from manufacturing.models import ProductionOrder
+        return [
+            ProductionOrder.objects.create(
+                hub_id=hub_id, order_number=f'PO-{i:03d}', quantity=i % 7,
+                start_date=None if i % 5 == 0 else date(2026, 1, 1) + timedelta(days=i % 4),
+            )
+            for i in range(23)
+        ]
+
+    @pytest.mark.parametrize('sort_field', ['order_number', 'quantity', 'start_date'])
+    @pytest.mark.parametrize('descending', [False, True])
+    def test_walks_every_row_once(self, hub_id, orders, sort_field, descending):
+        """Test forward and backward cursors cover all rows in sort order."""
+        from manufacturing.models import ProductionOrder
+        from manufacturing.pagination import keyset_paginate
+
+        qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False)
+        pages, cursor = [], ''
+        while True:
+            page = keyset_paginate(qs, sort_field, descending, cursor, 10)
+            pages.append([o.pk for o in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        seen = [pk for page_ids in pages for pk in page_ids]
+        assert len(seen) == len(orders) == len(set(seen))
+        assert [len(p) for p in pages] == [10, 10, 3]
+
+        back = keyset_paginate(qs, sort_field, descending, page.previous_cursor, 10)
+        assert [o.pk for o in back] == pages[1]
+        back = keyset_paginate(qs, sort_field, descending, back.previous_cursor, 10)
+        assert [o.pk for o in back] == pages[0]
+        assert not back.has_previous()
+
+    def test_list_cursor_mode(self, auth_client, orders):
+        """Test list view serves cursor pages to the datatable body."""
+        url = reverse('manufacturing:production_orders_list')
+        response = auth_client.get(
+            url, {'cursor': '', 'sort': 'start_date', 'dir': 'desc'},
+            HTTP_HX_REQUEST='true', HTTP_HX_TARGET='datatable-body',
+        )
+        assert response.status_code == 200
+        page = response.context['page_obj']
+        assert page.is_keyset and page.has_next()
+        response = auth_client.get(
+            url, {'cursor': page.next_cursor, 'sort': 'start_date', 'dir': 'desc'},
+            HTTP_HX_REQUEST='true', HTTP_HX_TARGET='datatable-body',
+        )
+        assert response.status_code == 200
+
+    def test_invalid_cursor_starts_over(self, auth_client, orders):
+        """Test a malformed cursor falls back to the first page."""
+        url = reverse('manufacturing:bom_lines_list')
+        response = auth_client.get(url, {'cursor': 'not-a-cursor'})
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db
+class TestJSONAPI:
+    """JSON API tests."""
+
+    def test_bulk_create_orders(self, auth_client, hub_id, bill_of_materials):
+        """Test orders are created together, blank numbers taken from the hub sequence."""
+        from manufacturing.models import ProductionOrder
+        from manufacturing.services.counters import get_counters
+        url = reverse('manufacturing:api_orders')
+        records = [{'order_number': 'PO-HAND', 'bom': str(bill_of_materials.pk), 'quantity': 5}]
+        records += [{'bom': str(bill_of_materials.pk), 'quantity': i, 'status': 'confirmed'} for i in range(1, 4)]
+        response = auth_client.post(
+            url + '?fields=id,order_number,status', {'records': records}, content_type='application/json',
+        )
+        assert response.status_code == 201
+        results = response.json()['results']
+        assert [set(r) for r in results] == [{'id', 'order_number', 'status'}] * 4
+        assert results[0]['order_number'] == 'PO-HAND'
+        assert len({r['order_number'] for r in results}) == 4
+        assert ProductionOrder.objects.filter(hub_id=hub_id).count() == 4
+        counters = get_counters(hub_id)
+        assert (counters.production_orders, counters.orders_confirmed) == (4, 3)
+
+    def test_bulk_create_is_all_or_nothing(self, auth_client, hub_id, production_order):
+        """Test one invalid record rejects the request with every error, by record."""
+        from manufacturing.models import ProductionOrder
+        url = reverse('manufacturing:api_orders')
+        response = auth_client.post(url, [
+            {'quantity': 1},
+            {'order_number': production_order.order_number},
+            {'quantity': 'lots', 'status': 'done', 'colour': 'red'},
+            {'bom': '00000000-0000-0000-0000-000000000000'},
+        ], content_type='application/json')
+        assert response.status_code == 400
+        assert [error['row'] for error in response.json()['errors']] == [2, 3, 4]
+        assert ProductionOrder.objects.filter(hub_id=hub_id).count() == 1
+
+    def test_bulk_lines_reject_cycles(self, auth_client, hub_id):
+        """Test lines closing a two-level cycle, within the request or with saved lines, are rejected by record."""
+        from manufacturing.models import BillOfMaterials, BOMLine
+        bread = BillOfMaterials.objects.create(hub_id=hub_id, name='Bread', code='BREAD')
+        dough = BillOfMaterials.objects.create(hub_id=hub_id, name='Dough', code='DOUGH')
+        url = reverse('manufacturing:api_lines')
+        response = auth_client.post(url, [
+            {'bom': str(bread.pk), 'component_bom': str(dough.pk), 'description': 'Dough', 'quantity': 1},
+            {'bom': str(dough.pk), 'component_bom': str(bread.pk), 'description': 'Bread', 'quantity': 1},
+        ], content_type='application/json')
+        assert response.status_code == 400
+        assert [error['row'] for error in response.json()['errors']] == [2]
+        assert not BOMLine.objects.filter(hub_id=hub_id).exists()
+
+        line = BOMLine.objects.create(hub_id=hub_id, bom=bread, component_bom=dough, description='Dough', quantity=1)
+        response = auth_client.post(url, [
+            {'bom': str(dough.pk), 'component_bom': str(bread.pk), 'description': 'Bread', 'quantity': 1},
+        ], content_type='application/json')
+        assert response.status_code == 400
+        assert BOMLine.objects.filter(hub_id=hub_id).get() == line
+
+    def test_bulk_update_follows_workflow(self, auth_client, hub_id, production_order):
+        """Test updates change only the fields sent and respect the status workflow."""
+        from manufacturing.services.counters import get_counters
+        url = reverse('manufacturing:api_orders')
+        record = {'id': str(production_order.pk), 'status': 'done'}
+        response = auth_client.patch(url, [record], content_type='application/json')
+        assert response.status_code == 400
+        record['status'] = 'confirmed'
+        response = auth_client.patch(url, [record], content_type='application/json')
+        assert response.status_code == 200
+        production_order.refresh_from_db()
+        assert (production_order.status, production_order.order_number) == ('confirmed', 'NUM-001')
+        assert get_counters(hub_id).orders_confirmed == 1
+
+    def test_lines_and_ingredients_in_base_units(self, auth_client, hub_id, bill_of_materials, production_order):
+        """Test bulk lines and ingredients get their base-unit quantities and stale the BOM cost."""
+        from manufacturing.models import BatchIngredient, BillOfMaterials, BOMLine
+        BillOfMaterials.objects.filter(pk=bill_of_materials.pk).update(unit_cost=1)
+        response = auth_client.post(reverse('manufacturing:api_lines'), [
+            {'bom': str(bill_of_materials.pk), 'description': f'Flour {i}', 'quantity': 500, 'unit': 'g'}
+            for i in range(3)
+        ], content_type='application/json')
+        assert response.status_code == 201
+        assert set(BOMLine.objects.filter(hub_id=hub_id).values_list('base_unit', flat=True)) == {'kg'}
+        assert BillOfMaterials.objects.get(pk=bill_of_materials.pk).unit_cost is None
+
+        response = auth_client.post(reverse('manufacturing:api_batches'), [
+            {'production_order': str(production_order.pk), 'quantity_produced': 10},
+        ], content_type='application/json')
+        assert response.status_code == 201
+        batch = response.json()['results'][0]
+        assert batch['batch_number']
+        response = auth_client.post(reverse('manufacturing:api_ingredients'), [
+            {'batch': batch['id'], 'description': 'Flour', 'supplier_lot': 'F-1', 'quantity_used': 1500, 'unit': 'g'},
+        ], content_type='application/json')
+        assert response.status_code == 201
+        assert BatchIngredient.objects.get(hub_id=hub_id).base_quantity == 1.5
+
+    def test_list_cursor_and_fields(self, auth_client, hub_id):
+        """Test list pages follow the cursor and return only the fields asked for."""
+        from manufacturing.models import BillOfMaterials
+        BillOfMaterials.objects.bulk_create([
+            BillOfMaterials(hub_id=hub_id, name=f'BOM {i}', code=f'B{i:02d}') for i in range(5)
+        ])
+        url = reverse('manufacturing:api_boms')
+        codes, cursor = [], ''
+        while True:
+            response = auth_client.get(url, {'fields': 'code', 'sort': '-code', 'limit': 2, 'cursor': cursor})
+            assert response.status_code == 200
+            page = response.json()
+            codes += [row['code'] for row in page['results']]
+            cursor = page['next']
+            if not cursor:
+                break
+        assert codes == ['B04', 'B03', 'B02', 'B01', 'B00']
+        assert auth_client.get(url, {'fields': 'code,secret'}).status_code == 400
+        assert auth_client.get(url, {'sort': 'notes'}).status_code == 400
+
+    def test_api_requires_auth(self, client):
+        """Test the API requires authentication."""
+        response = client.get(reverse('manufacturing:api_boms'))
+        assert response.status_code == 302
+
+
+@pytest.mark.django_db
+class TestStreamingExport:
+    """Streaming CSV export tests."""
+
+    def _lines(self, hub_id, count):
+        from decimal import Decimal
+        from manufacturing.models import BillOfMaterials, BOMLine
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Dough', code='DGH')
+        BOMLine.objects.bulk_create([
+            BOMLine(hub_id=hub_id, bom=bom, description=f'Line {i}', quantity=Decimal('1.50'), unit='kg')
+            for i in range(count)
+        ])
+
+    def _export(self, auth_client):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('manufacturing:bom_lines_list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = auth_client.get(url, {'export': 'csv'})
+            body = b''.join(response.streaming_content).decode()
+        return response, body, len(ctx.captured_queries)
+
+    def test_streams_generator(self, auth_client, hub_id):
+        """Test CSV export is a streaming response with joined BOM names."""
+        self._lines(hub_id, 3)
+        response, body, _queries = self._export(auth_client)
+        assert response.streaming
+        assert 'text/csv' in response['Content-Type']
+        rows = body.strip().splitlines()
+        assert rows[0] == 'BillOfMaterials,Quantity,Description,Unit'
+        assert len(rows) == 4
+        assert rows[1].startswith('Dough,1.50,')
+
+    def test_query_count_independent_of_rows(self, auth_client, hub_id):
+        """Test row count does not change the number of queries."""
+        self._lines(hub_id, 5)
+        _response, _body, few = self._export(auth_client)
+        self._lines(hub_id, 120)
+        _response, body, many = self._export(auth_client)
+        assert len(body.strip().splitlines()) == 126
+        assert many == few
+
+
+@pytest.mark.django_db
+class TestRowCache:
+    """Rendered row fragment cache tests."""
+
+    @pytest.fixture
+    def fresh_cache(self, monkeypatch):
+        from manufacturing.templatetags import manufacturing_rows
+        monkeypatch.setattr(manufacturing_rows, '_local_cache', None)
+        return manufacturing_rows
+
+    @pytest.fixture
+    def orders(self, hub_id):
+        from manufacturing.models import BillOfMaterials, ProductionOrder
+        bom = BillOfMaterials.objects.create(hub_id=hub_id, name='Bread', code='BRD')
+        return [
+            ProductionOrder.objects.create(hub_id=hub_id, order_number=f'PO-{i:03d}', bom=bom, status='draft')
+            for i in range(100)
+        ]
+
+    def _render(self, hub_id):
+        from django.core.paginator import Paginator
+        from django.template.loader import render_to_string
+        from manufacturing.models import ProductionOrder
+        qs = ProductionOrder.objects.filter(hub_id=hub_id).select_related('bom').order_by('order_number')
+        page = Paginator(qs, 100).get_page(1)
+        return render_to_string('manufacturing/partials/production_orders_list.html', {
+            'production_orders': page, 'page_obj': page, 'per_page': 100,
+        })
+
+    def test_rows_follow_record_and_related_changes(self, hub_id, orders, fresh_cache):
+        """Test a cached row is re-rendered once its record or its BOM changes."""
+        assert 'PO-000' in self._render(hub_id)
+        order = orders[0]
+        order.order_number = 'PO-RENAMED'
+        order.save()
+        order.bom.name = 'Sourdough'
+        order.bom.save()
+        html = self._render(hub_id)
+        assert 'PO-RENAMED' in html and 'Bread' not in html
+
+    def test_benchmark_cold_vs_warm_page(self, hub_id, orders, fresh_cache, monkeypatch):
+        """Benchmark: a warm 100-row page takes every row from the cache and renders none."""
+        cache = fresh_cache.get_row_cache()
+        lookups = []
+        get = cache.get
+
+        def counted_get(key, *args, **kwargs):
+            fragment = get(key, *args, **kwargs)
+            lookups.append(fragment is not None)
+            return fragment
+
+        monkeypatch.setattr(cache, 'get', counted_get)
+        cold_html = self._render(hub_id)
+        assert lookups == [False] * 100
+        lookups.clear()
+        warm_html = self._render(hub_id)
+        assert lookups == [True] * 100
+        assert warm_html == cold_html
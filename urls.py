@@ -25,6 +25,7 @@ urlpatterns = [
     path('bom_lines/<uuid:pk>/edit/', views.bom_line_edit, name='bom_line_edit'),
     path('bom_lines/<uuid:pk>/delete/', views.bom_line_delete, name='bom_line_delete'),
     path('bom_lines/bulk/', views.bom_lines_bulk_action, name='bom_lines_bulk_action'),
+    path('bom_lines/import/', views.bom_lines_import, name='bom_lines_import'),
 
     # ProductionOrder
     path('production_orders/', views.production_orders_list, name='production_orders_list'),
@@ -32,15 +33,41 @@ urlpatterns = [
     path('production_orders/<uuid:pk>/edit/', views.production_order_edit, name='production_order_edit'),
     path('production_orders/<uuid:pk>/delete/', views.production_order_delete, name='production_order_delete'),
     path('production_orders/bulk/', views.production_orders_bulk_action, name='production_orders_bulk_action'),
+    path('production_orders/schedule/', views.production_orders_schedule, name='production_orders_schedule'),
 
     # Production Order Detail
     path('production/<uuid:pk>/', views.production_order_detail, name='production_order_detail'),
 
+    # Material requirements
+    path('production/mrp/', views.mrp_view, name='mrp'),
+    path('production/trace/', views.trace_view, name='trace'),
+    path('production/expiry/', views.expiry_view, name='expiry'),
+    path('production/yield/', views.yield_report_view, name='yield_report'),
+
     # Batches
     path('production/<uuid:pk>/batches/add/', views.batch_add, name='batch_add'),
     path('production/<uuid:pk>/batches/panel/', views.batch_add_panel, name='batch_add_panel'),
+    path('production/<uuid:pk>/batches/backflush/', views.batches_backflush, name='batches_backflush'),
     path('production/<uuid:pk>/batches/<uuid:batch_pk>/delete/', views.batch_delete, name='batch_delete'),
 
+    # Background exports
+    path('exports/<uuid:pk>/', views.export_job_status, name='export_job_status'),
+    path('exports/<uuid:pk>/download/', views.export_job_download, name='export_job_download'),
+
+    # JSON API
+    path('api/v1/boms/', views.api_collection, {'resource': 'boms'}, name='api_boms'),
+    path('api/v1/boms/<uuid:pk>/', views.api_detail, {'resource': 'boms'}, name='api_bom'),
+    path('api/v1/lines/', views.api_collection, {'resource': 'lines'}, name='api_lines'),
+    path('api/v1/lines/<uuid:pk>/', views.api_detail, {'resource': 'lines'}, name='api_line'),
+    path('api/v1/orders/', views.api_collection, {'resource': 'orders'}, name='api_orders'),
+    path('api/v1/orders/<uuid:pk>/', views.api_detail, {'resource': 'orders'}, name='api_order'),
+    path('api/v1/batches/', views.api_collection, {'resource': 'batches'}, name='api_batches'),
+    path('api/v1/batches/<uuid:pk>/', views.api_detail, {'resource': 'batches'}, name='api_batch'),
+    path('api/v1/ingredients/', views.api_collection, {'resource': 'ingredients'}, name='api_ingredients'),
+    path('api/v1/ingredients/<uuid:pk>/', views.api_detail, {'resource': 'ingredients'}, name='api_ingredient'),
+
     # Settings
     path('settings/', views.settings_view, name='settings'),
+    path('settings/units/add/', views.unit_add, name='unit_add'),
+    path('settings/units/<uuid:pk>/delete/', views.unit_delete, name='unit_delete'),
 ]
@@ -1,23 +1,110 @@
 """
 Manufacturing & BOM Module Views
 """
+import json
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import zip_longest
+
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import Count
 from django.shortcuts import get_object_or_404, render as django_render
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
 
 from apps.accounts.decorators import login_required, permission_required
 from apps.core.htmx import htmx_view
-from apps.core.services import export_to_csv, export_to_excel
+from apps.core.services import export_to_excel
 from apps.modules_runtime.navigation import with_module_nav
 
-from .models import BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch, BatchIngredient
+from .conditional import versioned_etag
+from .exports import stream_csv
+from .models import (
+    PROD_STATUS, UNIT_DIMENSIONS, BillOfMaterials, BOMLine, ProductionOrder, ProductionBatch, BatchIngredient,
+    ExportJob, ManufacturingSettings, UnitOfMeasure,
+)
+from .pagination import keyset_paginate
+from .services.api import RESOURCES as API_RESOURCES, BulkError, FieldSelectionError
+from .services.api import bulk_create as api_bulk_create, bulk_update as api_bulk_update
+from .services.backflush import backflush_batches
+from .services.batches import BATCH_FIELDS, INGREDIENT_FIELDS, BatchEntryError, record_batch
+from .services.bom_explosion import creates_cycle
+from .services.bom_import import BOMImportError, import_bom_lines, read_rows
+from .services.costing import invalidate_boms, recost_boms
+from .services.counters import bulk_soft_delete, get_counters
+from .services.expiry import clamp_days, expiry_summary, expiry_watch
+from .services.export_jobs import export_path, start_export
+from .services.mrp import BUCKETS as MRP_BUCKETS, compute_requirements
+from .services.numbering import PatternError, parse_pattern, save_numbered
+from .services.scheduler import SCHEDULED_STATUSES, reschedule_order, schedule_hub
+from .services.search import search_queryset
+from .services.versions import bump as bump_version
+from .services.traceability import MODES as TRACE_MODES, trace
+from .services.units import sum_base_quantities, unit_key
+from .services.workflow import TransitionError, bulk_transition, check_transition, status_choices
+from .services.yields import YIELD_SORT_FIELDS, annotate_yield, bom_yield_report
 
 PER_PAGE_CHOICES = [10, 25, 50, 100]
 
 
+def _background_export(request, hub_id, kind, export_format, search_query, order_by):
+    """Queue the export as a job (``?background=1``) and render its progress card."""
+    job = start_export(hub_id, kind, 'xlsx' if export_format == 'excel' else 'csv', {
+        'q': search_query, 'order_by': order_by,
+    })
+    return django_render(request, 'manufacturing/partials/export_job.html', {'job': job})
+
+
+def _list_refresh(event):
+    """No swap; the list re-requests itself with the client's page, search and sort."""
+    response = HttpResponse('')
+    response['HX-Reswap'] = 'none'
+    response['HX-Trigger'] = event
+    return response
+
+
+def _sort_keys(obj, sort_fields):
+    return {field: getattr(obj, f'{field}_id', None) or getattr(obj, field) for field in set(sort_fields.values())}
+
+
+def _row_response(request, obj, row, event, sort_fields, default_sort, sort_keys=None, others_changed=False, annotate=None):
+    """
+    Answer a mutation of one list row with that row only, swapped out of
+    band so the client keeps its page, search and sort. The row is removed
+    when it is deleted or no longer matches the client's search; the whole
+    list refreshes when other rows changed with it or the row may have
+    moved (it is new or its sort key changed). ``annotate`` adds the list's
+    computed columns to the reloaded row.
+    """
+    if annotate is None:
+        obj.refresh_from_db()
+    else:
+        obj = annotate(type(obj).all_objects.filter(pk=obj.pk)).get()
+    if others_changed:
+        return _list_refresh(event)
+    query = request.POST.get('q', '').strip()
+    if obj.is_deleted or (query and not search_queryset(type(obj).objects.filter(pk=obj.pk), query).exists()):
+        response = HttpResponse(f'<template><tr id="{row}-row-{obj.pk}" hx-swap-oob="delete"></tr></template>')
+        response['HX-Reswap'] = 'none'
+        return response
+    field = sort_fields.get(request.POST.get('sort', ''), default_sort)
+    if sort_keys is None or _sort_keys(obj, sort_fields)[field] != sort_keys[field]:
+        return _list_refresh(event)
+    response = django_render(request, f'manufacturing/partials/{row}_row.html', {'item': obj, 'oob': True})
+    response['HX-Reswap'] = 'none'
+    return response
+
+
+def _cursor_mode(request):
+    """Keyset pagination is opt-in with ``?cursor=`` (``paginate=cursor`` keeps it on)."""
+    return 'cursor' in request.GET or request.GET.get('paginate') == 'cursor'
+
+
 # ======================================================================
 # Dashboard
 # ======================================================================
@@ -27,10 +114,15 @@ PER_PAGE_CHOICES = [10, 25, 50, 100]
 @htmx_view('manufacturing/pages/index.html', 'manufacturing/partials/dashboard_content.html')
 def dashboard(request):
     hub_id = request.session.get('hub_id')
+    hub_counters = get_counters(hub_id)
+    expiry_days = ManufacturingSettings.for_hub(hub_id).expiry_warning_days
     return {
-        'total_bill_of_materialses': BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False).count(),
-        'total_bom_lines': BOMLine.objects.filter(hub_id=hub_id, is_deleted=False).count(),
-        'total_production_orders': ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False).count(),
+        'counters': hub_counters,
+        'expiry_days': expiry_days,
+        'expiring': expiry_summary(hub_id, expiry_days) if hub_counters and hub_counters.batches else None,
+        'total_bill_of_materialses': hub_counters.bill_of_materialses if hub_counters else 0,
+        'total_bom_lines': hub_counters.bom_lines if hub_counters else 0,
+        'total_production_orders': hub_counters.production_orders if hub_counters else 0,
     }
 
 
@@ -43,10 +135,25 @@ BILL_OF_MATERIALS_SORT_FIELDS = {
     'name': 'name',
     'is_active': 'is_active',
     'output_quantity': 'output_quantity',
+    'unit_cost': 'unit_cost',
     'notes': 'notes',
     'created_at': 'created_at',
 }
 
+def _bill_of_materials_row(request, obj, sort_keys=None, others_changed=False):
+    return _row_response(
+        request, obj, 'bill_of_materials', 'bill_of_materialses-changed',
+        BILL_OF_MATERIALS_SORT_FIELDS, 'code', sort_keys, others_changed,
+    )
+
+def _recosted_others(hub_id, obj):
+    """
+    Recost the hub's stale BOMs right after saving ``obj``, in the same
+    transaction (before the on-commit recost); True when BOMs other than
+    ``obj`` changed cost.
+    """
+    return bool(set(recost_boms(hub_id).costs) - {obj.pk})
+
 def _build_bill_of_materialses_context(hub_id, per_page=10):
     qs = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False).order_by('code')
     paginator = Paginator(qs, per_page)
@@ -66,6 +173,7 @@ def _render_bill_of_materialses_list(request, hub_id, per_page=10):
     return django_render(request, 'manufacturing/partials/bill_of_materialses_list.html', ctx)
 
 @login_required
+@versioned_etag(BillOfMaterials)
 @with_module_nav('manufacturing', 'bom')
 @htmx_view('manufacturing/pages/bill_of_materialses.html', 'manufacturing/partials/bill_of_materialses_content.html')
 def bill_of_materialses_list(request):
@@ -82,7 +190,7 @@ def bill_of_materialses_list(request):
     qs = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False)
 
     if search_query:
-        qs = qs.filter(Q(name__icontains=search_query) | Q(code__icontains=search_query) | Q(notes__icontains=search_query))
+        qs = search_queryset(qs, search_query)
 
     order_by = BILL_OF_MATERIALS_SORT_FIELDS.get(sort_field, 'code')
     if sort_dir == 'desc':
@@ -90,11 +198,13 @@ def bill_of_materialses_list(request):
     qs = qs.order_by(order_by)
 
     export_format = request.GET.get('export')
+    if export_format in ('csv', 'excel') and request.GET.get('background'):
+        return _background_export(request, hub_id, 'bill_of_materialses', export_format, search_query, order_by)
     if export_format in ('csv', 'excel'):
-        fields = ['code', 'name', 'is_active', 'output_quantity', 'notes']
-        headers = ['Code', 'Name', 'Is Active', 'Output Quantity', 'Notes']
+        fields = ['code', 'name', 'is_active', 'output_quantity', 'unit_cost', 'notes']
+        headers = ['Code', 'Name', 'Is Active', 'Output Quantity', 'Unit Cost', 'Notes']
         if export_format == 'csv':
-            return export_to_csv(qs, fields=fields, headers=headers, filename='bill_of_materialses.csv')
+            return stream_csv(qs, fields, headers, filename='bill_of_materialses.csv')
         return export_to_excel(qs, fields=fields, headers=headers, filename='bill_of_materialses.xlsx')
 
     paginator = Paginator(qs, per_page)
@@ -122,14 +232,16 @@ def bill_of_materials_add(request):
         output_quantity = request.POST.get('output_quantity', '0') or '0'
         notes = request.POST.get('notes', '').strip()
         is_active = request.POST.get('is_active') == 'on'
+        daily_capacity = request.POST.get('daily_capacity') or None
         obj = BillOfMaterials(hub_id=hub_id)
         obj.name = name
         obj.code = code
         obj.output_quantity = output_quantity
         obj.notes = notes
         obj.is_active = is_active
+        obj.daily_capacity = daily_capacity
         obj.save()
-        return _render_bill_of_materialses_list(request, hub_id)
+        return _bill_of_materials_row(request, obj)
     return django_render(request, 'manufacturing/partials/panel_bill_of_materials_add.html', {})
 
 @login_required
@@ -137,13 +249,17 @@ def bill_of_materials_edit(request, pk):
     hub_id = request.session.get('hub_id')
     obj = get_object_or_404(BillOfMaterials, pk=pk, hub_id=hub_id, is_deleted=False)
     if request.method == 'POST':
+        sort_keys = _sort_keys(obj, BILL_OF_MATERIALS_SORT_FIELDS)
         obj.name = request.POST.get('name', '').strip()
         obj.code = request.POST.get('code', '').strip()
         obj.output_quantity = request.POST.get('output_quantity', '0') or '0'
         obj.notes = request.POST.get('notes', '').strip()
         obj.is_active = request.POST.get('is_active') == 'on'
-        obj.save()
-        return _render_bill_of_materialses_list(request, hub_id)
+        obj.daily_capacity = request.POST.get('daily_capacity') or None
+        with transaction.atomic():
+            obj.save()
+            others_changed = _recosted_others(hub_id, obj)
+        return _bill_of_materials_row(request, obj, sort_keys, others_changed)
     return django_render(request, 'manufacturing/partials/panel_bill_of_materials_edit.html', {'obj': obj})
 
 @login_required
@@ -153,17 +269,20 @@ def bill_of_materials_delete(request, pk):
     obj = get_object_or_404(BillOfMaterials, pk=pk, hub_id=hub_id, is_deleted=False)
     obj.is_deleted = True
     obj.deleted_at = timezone.now()
-    obj.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
-    return _render_bill_of_materialses_list(request, hub_id)
+    with transaction.atomic():
+        obj.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+        others_changed = _recosted_others(hub_id, obj)
+    return _bill_of_materials_row(request, obj, others_changed=others_changed)
 
 @login_required
 @require_POST
 def bill_of_materials_toggle_status(request, pk):
     hub_id = request.session.get('hub_id')
     obj = get_object_or_404(BillOfMaterials, pk=pk, hub_id=hub_id, is_deleted=False)
+    sort_keys = _sort_keys(obj, BILL_OF_MATERIALS_SORT_FIELDS)
     obj.is_active = not obj.is_active
     obj.save(update_fields=['is_active', 'updated_at'])
-    return _render_bill_of_materialses_list(request, hub_id)
+    return _bill_of_materials_row(request, obj, sort_keys)
 
 @login_required
 @require_POST
@@ -173,11 +292,15 @@ def bill_of_materialses_bulk_action(request):
     action = request.POST.get('action', '')
     qs = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False, id__in=ids)
     if action == 'activate':
-        qs.update(is_active=True)
+        if qs.update(is_active=True, updated_at=timezone.now()):
+            bump_version(hub_id, BillOfMaterials)
     elif action == 'deactivate':
-        qs.update(is_active=False)
+        if qs.update(is_active=False, updated_at=timezone.now()):
+            bump_version(hub_id, BillOfMaterials)
     elif action == 'delete':
-        qs.update(is_deleted=True, deleted_at=timezone.now())
+        bom_ids = list(qs.values_list('pk', flat=True))
+        bulk_soft_delete(qs, hub_id)
+        invalidate_boms(bom_ids)
     return _render_bill_of_materialses_list(request, hub_id)
 
 
@@ -193,8 +316,11 @@ BOM_LINE_SORT_FIELDS = {
     'created_at': 'created_at',
 }
 
+def _bom_line_row(request, obj, sort_keys=None):
+    return _row_response(request, obj, 'bom_line', 'bom_lines-changed', BOM_LINE_SORT_FIELDS, 'bom', sort_keys)
+
 def _build_bom_lines_context(hub_id, per_page=10):
-    qs = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False).order_by('bom')
+    qs = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False).select_related('bom').order_by('bom')
     paginator = Paginator(qs, per_page)
     page_obj = paginator.get_page(1)
     return {
@@ -212,6 +338,7 @@ def _render_bom_lines_list(request, hub_id, per_page=10):
     return django_render(request, 'manufacturing/partials/bom_lines_list.html', ctx)
 
 @login_required
+@versioned_etag(BOMLine, BillOfMaterials)
 @with_module_nav('manufacturing', 'bom')
 @htmx_view('manufacturing/pages/bom_lines.html', 'manufacturing/partials/bom_lines_content.html')
 def bom_lines_list(request):
@@ -225,10 +352,10 @@ def bom_lines_list(request):
     if per_page not in PER_PAGE_CHOICES:
         per_page = 10
 
-    qs = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False)
+    qs = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False).select_related('bom')
 
     if search_query:
-        qs = qs.filter(Q(description__icontains=search_query) | Q(unit__icontains=search_query))
+        qs = search_queryset(qs, search_query)
 
     order_by = BOM_LINE_SORT_FIELDS.get(sort_field, 'bom')
     if sort_dir == 'desc':
@@ -236,15 +363,24 @@ def bom_lines_list(request):
     qs = qs.order_by(order_by)
 
     export_format = request.GET.get('export')
+    if export_format in ('csv', 'excel') and request.GET.get('background'):
+        return _background_export(request, hub_id, 'bom_lines', export_format, search_query, order_by)
     if export_format in ('csv', 'excel'):
         fields = ['bom', 'quantity', 'description', 'unit']
         headers = ['BillOfMaterials', 'Quantity', 'Description', 'Unit']
         if export_format == 'csv':
-            return export_to_csv(qs, fields=fields, headers=headers, filename='bom_lines.csv')
+            columns = ['bom__name', 'quantity', 'description', 'unit']
+            return stream_csv(qs, columns, headers, filename='bom_lines.csv')
         return export_to_excel(qs, fields=fields, headers=headers, filename='bom_lines.xlsx')
 
-    paginator = Paginator(qs, per_page)
-    page_obj = paginator.get_page(page_number)
+    if _cursor_mode(request):
+        page_obj = keyset_paginate(
+            qs, BOM_LINE_SORT_FIELDS.get(sort_field, 'bom'), sort_dir == 'desc',
+            request.GET.get('cursor'), per_page,
+        )
+    else:
+        paginator = Paginator(qs, per_page)
+        page_obj = paginator.get_page(page_number)
 
     if request.htmx and request.htmx.target == 'datatable-body':
         return django_render(request, 'manufacturing/partials/bom_lines_list.html', {
@@ -259,6 +395,33 @@ def bom_lines_list(request):
         'sort_dir': sort_dir, 'current_view': current_view, 'per_page': per_page,
     }
 
+def _component_bom_choices(hub_id):
+    return BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False).order_by('code', 'name')
+
+COMPONENT_INVALID = _('Select a valid sub-assembly.')
+COMPONENT_CYCLE = _('This sub-assembly contains the BOM of this line; a BOM cannot contain itself.')
+
+def _set_component_bom(obj, hub_id, pk):
+    """Set the sub-assembly of line ``obj`` to the hub's live BOM ``pk``; returns an error message or None."""
+    component = None
+    if pk:
+        try:
+            component = BillOfMaterials.objects.filter(hub_id=hub_id, is_deleted=False, pk=pk).first()
+        except (ValidationError, ValueError):
+            component = None
+        if component is None:
+            return COMPONENT_INVALID
+        if creates_cycle(obj.bom_id, component.pk):
+            return COMPONENT_CYCLE
+    obj.component_bom = component
+    return None
+
+def _render_bom_line_panel_error(request, template, ctx):
+    response = django_render(request, template, ctx)
+    response['HX-Retarget'] = '#bom_line-panel-content'
+    response['HX-Reswap'] = 'innerHTML'
+    return response
+
 @login_required
 def bom_line_add(request):
     hub_id = request.session.get('hub_id')
@@ -270,21 +433,39 @@ def bom_line_add(request):
         obj.description = description
         obj.quantity = quantity
         obj.unit = unit
+        obj.unit_cost = request.POST.get('unit_cost', '0') or '0'
+        error = _set_component_bom(obj, hub_id, request.POST.get('component_bom'))
+        if error:
+            return _render_bom_line_panel_error(request, 'manufacturing/partials/panel_bom_line_add.html', {
+                'component_boms': _component_bom_choices(hub_id), 'error': error,
+            })
         obj.save()
-        return _render_bom_lines_list(request, hub_id)
-    return django_render(request, 'manufacturing/partials/panel_bom_line_add.html', {})
+        return _bom_line_row(request, obj)
+    return django_render(request, 'manufacturing/partials/panel_bom_line_add.html', {
+        'component_boms': _component_bom_choices(hub_id),
+    })
 
 @login_required
 def bom_line_edit(request, pk):
     hub_id = request.session.get('hub_id')
     obj = get_object_or_404(BOMLine, pk=pk, hub_id=hub_id, is_deleted=False)
     if request.method == 'POST':
+        sort_keys = _sort_keys(obj, BOM_LINE_SORT_FIELDS)
         obj.description = request.POST.get('description', '').strip()
         obj.quantity = request.POST.get('quantity', '0') or '0'
         obj.unit = request.POST.get('unit', '').strip()
+        obj.unit_cost = request.POST.get('unit_cost', '0') or '0'
+        error = _set_component_bom(obj, hub_id, request.POST.get('component_bom'))
+        if error:
+            return _render_bom_line_panel_error(request, 'manufacturing/partials/panel_bom_line_edit.html', {
+                'obj': obj, 'component_boms': _component_bom_choices(hub_id), 'error': error,
+            })
         obj.save()
-        return _render_bom_lines_list(request, hub_id)
-    return django_render(request, 'manufacturing/partials/panel_bom_line_edit.html', {'obj': obj})
+        return _bom_line_row(request, obj, sort_keys)
+    return django_render(request, 'manufacturing/partials/panel_bom_line_edit.html', {
+        'obj': obj,
+        'component_boms': _component_bom_choices(hub_id),
+    })
 
 @login_required
 @require_POST
@@ -294,7 +475,7 @@ def bom_line_delete(request, pk):
     obj.is_deleted = True
     obj.deleted_at = timezone.now()
     obj.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
-    return _render_bom_lines_list(request, hub_id)
+    return _bom_line_row(request, obj)
 
 @login_required
 @require_POST
@@ -304,14 +485,49 @@ def bom_lines_bulk_action(request):
     action = request.POST.get('action', '')
     qs = BOMLine.objects.filter(hub_id=hub_id, is_deleted=False, id__in=ids)
     if action == 'delete':
-        qs.update(is_deleted=True, deleted_at=timezone.now())
+        bom_ids = set(qs.values_list('bom_id', flat=True))
+        bulk_soft_delete(qs, hub_id)
+        invalidate_boms(bom_ids)
     return _render_bom_lines_list(request, hub_id)
 
+IMPORT_ERRORS_SHOWN = 100
+
+@login_required
+def bom_lines_import(request):
+    hub_id = request.session.get('hub_id')
+    ctx = {'strict': True}
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        ctx['strict'] = request.POST.get('mode', 'strict') != 'partial'
+        if upload is None:
+            ctx['error'] = _('Choose a CSV or XLSX file to import.')
+        else:
+            try:
+                rows = read_rows(upload, upload.name)
+                result = import_bom_lines(hub_id, rows, strict=ctx['strict'])
+            except BOMImportError as exc:
+                ctx['error'] = str(exc)
+            else:
+                ctx['result'] = result
+                ctx['errors'] = result.errors[:IMPORT_ERRORS_SHOWN]
+                ctx['hidden_errors'] = max(len(result.errors) - IMPORT_ERRORS_SHOWN, 0)
+    return django_render(request, 'manufacturing/partials/panel_bom_lines_import.html', ctx)
+
 
 # ======================================================================
 # ProductionOrder
 # ======================================================================
 
+# (target status, button label, icon) of the list's bulk status actions.
+BULK_TRANSITIONS = [
+    ('confirmed', _('Confirm'), 'checkmark-outline'),
+    ('in_progress', _('Start'), 'play-outline'),
+    ('done', _('Complete'), 'checkmark-done-outline'),
+    ('cancelled', _('Cancel'), 'close-circle-outline'),
+]
+
+ORDER_NUMBER_TAKEN = _('Order number "%s" is already used.')
+
 PRODUCTION_ORDER_SORT_FIELDS = {
     'order_number': 'order_number',
     'bom': 'bom',
@@ -322,8 +538,19 @@ PRODUCTION_ORDER_SORT_FIELDS = {
     'created_at': 'created_at',
 }
 
+def _production_order_row(request, obj, sort_keys=None, others_changed=False):
+    if request.POST.get('sort') in YIELD_SORT_FIELDS:
+        # The yield columns depend on the quantity; the row may have moved.
+        sort_keys = None
+    return _row_response(
+        request, obj, 'production_order', 'production_orders-changed',
+        PRODUCTION_ORDER_SORT_FIELDS, 'order_number', sort_keys, others_changed,
+        annotate=lambda qs: annotate_yield(qs.select_related('bom')),
+    )
+
 def _build_production_orders_context(hub_id, per_page=10):
-    qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False).order_by('order_number')
+    qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False).select_related('bom')
+    qs = annotate_yield(qs).order_by('order_number')
     paginator = Paginator(qs, per_page)
     page_obj = paginator.get_page(1)
     return {
@@ -341,6 +568,7 @@ def _render_production_orders_list(request, hub_id, per_page=10):
     return django_render(request, 'manufacturing/partials/production_orders_list.html', ctx)
 
 @login_required
+@versioned_etag(ProductionOrder, BillOfMaterials, ProductionBatch)
 @with_module_nav('manufacturing', 'production')
 @htmx_view('manufacturing/pages/production_orders.html', 'manufacturing/partials/production_orders_content.html')
 def production_orders_list(request):
@@ -354,26 +582,42 @@ def production_orders_list(request):
     if per_page not in PER_PAGE_CHOICES:
         per_page = 10
 
-    qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False)
+    qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False).select_related('bom')
 
     if search_query:
-        qs = qs.filter(Q(order_number__icontains=search_query) | Q(status__icontains=search_query) | Q(notes__icontains=search_query))
+        qs = search_queryset(qs, search_query)
+    qs = annotate_yield(qs)
 
-    order_by = PRODUCTION_ORDER_SORT_FIELDS.get(sort_field, 'order_number')
+    order_by = PRODUCTION_ORDER_SORT_FIELDS.get(sort_field) or YIELD_SORT_FIELDS.get(sort_field, 'order_number')
     if sort_dir == 'desc':
         order_by = f'-{order_by}'
     qs = qs.order_by(order_by)
 
     export_format = request.GET.get('export')
+    if export_format in ('csv', 'excel') and request.GET.get('background'):
+        kind = 'production_ingredients' if request.GET.get('rows') == 'ingredients' else 'production_orders'
+        return _background_export(request, hub_id, kind, export_format, search_query, order_by)
     if export_format in ('csv', 'excel'):
-        fields = ['order_number', 'bom', 'status', 'quantity', 'start_date', 'end_date']
-        headers = ['Order Number', 'BillOfMaterials', 'Status', 'Quantity', 'Start Date', 'End Date']
+        yield_columns = ['produced_quantity', 'approved_quantity', 'rejected_quantity', 'yield_percent', 'variance']
+        fields = ['order_number', 'bom', 'status', 'quantity', 'start_date', 'end_date', *yield_columns]
+        headers = [
+            'Order Number', 'BillOfMaterials', 'Status', 'Quantity', 'Start Date', 'End Date',
+            'Produced', 'Approved', 'Rejected', 'Yield %', 'Variance',
+        ]
         if export_format == 'csv':
-            return export_to_csv(qs, fields=fields, headers=headers, filename='production_orders.csv')
+            columns = ['order_number', 'bom__name', 'status', 'quantity', 'start_date', 'end_date', *yield_columns]
+            return stream_csv(qs, columns, headers, filename='production_orders.csv')
         return export_to_excel(qs, fields=fields, headers=headers, filename='production_orders.xlsx')
 
-    paginator = Paginator(qs, per_page)
-    page_obj = paginator.get_page(page_number)
+    # Keyset pages need a column to seek on; yield sorts page with OFFSET.
+    if _cursor_mode(request) and sort_field not in YIELD_SORT_FIELDS:
+        page_obj = keyset_paginate(
+            qs, PRODUCTION_ORDER_SORT_FIELDS.get(sort_field, 'order_number'), sort_dir == 'desc',
+            request.GET.get('cursor'), per_page,
+        )
+    else:
+        paginator = Paginator(qs, per_page)
+        page_obj = paginator.get_page(page_number)
 
     if request.htmx and request.htmx.target == 'datatable-body':
         return django_render(request, 'manufacturing/partials/production_orders_list.html', {
@@ -386,6 +630,7 @@ def production_orders_list(request):
         'production_orders': page_obj, 'page_obj': page_obj,
         'search_query': search_query, 'sort_field': sort_field,
         'sort_dir': sort_dir, 'current_view': current_view, 'per_page': per_page,
+        'bulk_transitions': BULK_TRANSITIONS,
     }
 
 @login_required
@@ -394,9 +639,10 @@ def production_order_add(request):
     if request.method == 'POST':
         order_number = request.POST.get('order_number', '').strip()
         quantity = request.POST.get('quantity', '0') or '0'
-        status = request.POST.get('status', '').strip()
+        status = request.POST.get('status', '').strip() or 'draft'
         start_date = request.POST.get('start_date') or None
         end_date = request.POST.get('end_date') or None
+        due_date = request.POST.get('due_date') or None
         notes = request.POST.get('notes', '').strip()
         obj = ProductionOrder(hub_id=hub_id)
         obj.order_number = order_number
@@ -404,25 +650,73 @@ def production_order_add(request):
         obj.status = status
         obj.start_date = start_date
         obj.end_date = end_date
+        obj.due_date = due_date
         obj.notes = notes
-        obj.save()
-        return _render_production_orders_list(request, hub_id)
-    return django_render(request, 'manufacturing/partials/panel_production_order_add.html', {})
+        try:
+            check_transition(None, status)
+        except TransitionError as exc:
+            return _render_order_panel_error(request, 'manufacturing/partials/panel_production_order_add.html', {
+                'obj': obj, 'status_choices': status_choices(), 'error': str(exc),
+            })
+        if not _save_order(obj):
+            return _render_order_panel_error(request, 'manufacturing/partials/panel_production_order_add.html', {
+                'obj': obj, 'status_choices': status_choices(), 'error': ORDER_NUMBER_TAKEN % obj.order_number,
+            })
+        _auto_schedule(obj, None)
+        return _production_order_row(request, obj)
+    return django_render(request, 'manufacturing/partials/panel_production_order_add.html', {
+        'status_choices': status_choices(),
+    })
 
 @login_required
 def production_order_edit(request, pk):
     hub_id = request.session.get('hub_id')
     obj = get_object_or_404(ProductionOrder, pk=pk, hub_id=hub_id, is_deleted=False)
     if request.method == 'POST':
+        sort_keys = _sort_keys(obj, PRODUCTION_ORDER_SORT_FIELDS)
+        previous_status = obj.status
         obj.order_number = request.POST.get('order_number', '').strip()
         obj.quantity = request.POST.get('quantity', '0') or '0'
-        obj.status = request.POST.get('status', '').strip()
+        obj.status = request.POST.get('status', '').strip() or previous_status
         obj.start_date = request.POST.get('start_date') or None
         obj.end_date = request.POST.get('end_date') or None
+        obj.due_date = request.POST.get('due_date') or None
         obj.notes = request.POST.get('notes', '').strip()
-        obj.save()
-        return _render_production_orders_list(request, hub_id)
-    return django_render(request, 'manufacturing/partials/panel_production_order_edit.html', {'obj': obj})
+        try:
+            check_transition(previous_status, obj.status)
+        except TransitionError as exc:
+            return _render_order_panel_error(request, 'manufacturing/partials/panel_production_order_edit.html', {
+                'obj': obj, 'status_choices': status_choices(previous_status), 'error': str(exc),
+            })
+        if not _save_order(obj):
+            return _render_order_panel_error(request, 'manufacturing/partials/panel_production_order_edit.html', {
+                'obj': obj, 'status_choices': status_choices(previous_status),
+                'error': ORDER_NUMBER_TAKEN % obj.order_number,
+            })
+        rescheduled = _auto_schedule(obj, previous_status)
+        return _production_order_row(request, obj, sort_keys, rescheduled)
+    return django_render(request, 'manufacturing/partials/panel_production_order_edit.html', {
+        'obj': obj, 'status_choices': status_choices(obj.status),
+    })
+
+def _save_order(obj):
+    """Save ``obj``, numbering it from the hub's pattern when left blank; False when its number is taken."""
+    try:
+        if obj.order_number:
+            with transaction.atomic():
+                obj.save()
+        else:
+            save_numbered(obj, 'order')
+    except IntegrityError:
+        return False
+    return True
+
+def _render_order_panel_error(request, template, ctx):
+    # The form targets the list; send the panel back into the side sheet instead.
+    response = django_render(request, template, ctx)
+    response['HX-Retarget'] = '#production_order-panel-content'
+    response['HX-Reswap'] = 'innerHTML'
+    return response
 
 @login_required
 @require_POST
@@ -432,7 +726,7 @@ def production_order_delete(request, pk):
     obj.is_deleted = True
     obj.deleted_at = timezone.now()
     obj.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
-    return _render_production_orders_list(request, hub_id)
+    return _production_order_row(request, obj)
 
 @login_required
 @require_POST
@@ -442,7 +736,44 @@ def production_orders_bulk_action(request):
     action = request.POST.get('action', '')
     qs = ProductionOrder.objects.filter(hub_id=hub_id, is_deleted=False, id__in=ids)
     if action == 'delete':
-        qs.update(is_deleted=True, deleted_at=timezone.now())
+        bulk_soft_delete(qs, hub_id)
+    elif action == 'transition':
+        return _bulk_transition(request, hub_id, ids, request.POST.get('status', ''))
+    return _render_production_orders_list(request, hub_id)
+
+def _bulk_transition(request, hub_id, ids, target):
+    ctx = {'target': target}
+    try:
+        result = bulk_transition(hub_id, ids, target)
+    except TransitionError as exc:
+        ctx['error'] = str(exc)
+    else:
+        labels = dict(PROD_STATUS)
+        ctx.update({
+            'result': result,
+            'target_label': labels.get(target, target),
+            'moved': [(labels.get(s, s), n) for s, n in sorted(result.moved.items())],
+            'rejected': [(labels.get(s, s or '-'), n) for s, n in sorted(result.rejected.items())],
+        })
+        scheduled = set(SCHEDULED_STATUSES)
+        if result.moved and (target in scheduled or scheduled & set(result.moved)):
+            if ManufacturingSettings.for_hub(hub_id).auto_schedule:
+                schedule_hub(hub_id)
+    return django_render(request, 'manufacturing/partials/production_orders_transition.html', ctx)
+
+def _auto_schedule(order, previous_status):
+    """Reschedule after ``order`` changed if the hub wants it; True when any order moved."""
+    if previous_status not in SCHEDULED_STATUSES and order.status not in SCHEDULED_STATUSES:
+        return False
+    if ManufacturingSettings.for_hub(order.hub_id).auto_schedule:
+        return bool(reschedule_order(order).changed)
+    return False
+
+@login_required
+@require_POST
+def production_orders_schedule(request):
+    hub_id = request.session.get('hub_id')
+    schedule_hub(hub_id)
     return _render_production_orders_list(request, hub_id)
 
 
@@ -451,43 +782,94 @@ def production_orders_bulk_action(request):
 # ======================================================================
 
 @login_required
+@versioned_etag(ProductionOrder, BillOfMaterials, ProductionBatch, BatchIngredient)
 @with_module_nav('manufacturing', 'production')
 @htmx_view('manufacturing/pages/production_order_detail.html', 'manufacturing/partials/production_order_detail_content.html')
 def production_order_detail(request, pk):
     hub_id = request.session.get('hub_id')
-    order = get_object_or_404(ProductionOrder, pk=pk, hub_id=hub_id, is_deleted=False)
+    order = get_object_or_404(
+        ProductionOrder.objects.select_related('bom'),
+        pk=pk, hub_id=hub_id, is_deleted=False,
+    )
     return {
         'order': order,
-        'batches': ProductionBatch.objects.filter(production_order=order, is_deleted=False).order_by('-production_date'),
+        'batches': _order_batches(order),
+        'consumption': _order_consumption(order),
     }
 
 
+def _order_batches(order):
+    return ProductionBatch.objects.filter(production_order=order, is_deleted=False).order_by('-production_date')
+
+
+def _order_consumption(order):
+    """Ingredients used by the order's batches, summed per ingredient in base units."""
+    return sum_base_quantities(
+        BatchIngredient.objects.filter(
+            hub_id=order.hub_id, batch__production_order=order, batch__is_deleted=False, is_deleted=False,
+        ),
+        'description',
+    )
+
+
 def _render_batches_list(request, order):
-    batches = ProductionBatch.objects.filter(production_order=order, is_deleted=False).order_by('-production_date')
     return django_render(request, 'manufacturing/partials/batches_list.html', {
         'order': order,
-        'batches': batches,
+        'batches': _order_batches(order),
+        'consumption': _order_consumption(order),
     })
 
 
 @login_required
 @require_POST
 def batch_add(request, pk):
+    """
+    Record a batch with its ingredients. Form posts send the ingredient rows
+    as parallel ``ingredient_<field>`` lists; a JSON body carries the batch
+    fields plus an ``ingredients`` list of objects.
+    """
     hub_id = request.session.get('hub_id')
     order = get_object_or_404(ProductionOrder, pk=pk, hub_id=hub_id, is_deleted=False)
-    batch = ProductionBatch(hub_id=hub_id)
-    batch.production_order = order
-    batch.bom = order.bom
-    batch.batch_number = request.POST.get('batch_number', '').strip()
-    batch.quantity_produced = request.POST.get('quantity_produced', '0') or '0'
-    batch.production_date = request.POST.get('production_date') or None
-    batch.expiry_date = request.POST.get('expiry_date') or None
-    batch.quality_status = request.POST.get('quality_status', 'pending').strip()
-    batch.notes = request.POST.get('notes', '').strip()
-    batch.save()
+    if request.content_type == 'application/json':
+        return _batch_add_json(request, order)
+    data = {name: request.POST.get(name, '') for name in BATCH_FIELDS}
+    columns = [request.POST.getlist(f'ingredient_{name}') for name in INGREDIENT_FIELDS]
+    ingredients = [dict(zip(INGREDIENT_FIELDS, values)) for values in zip_longest(*columns, fillvalue='')]
+    backflush = ManufacturingSettings.for_hub(hub_id).auto_backflush
+    try:
+        record_batch(order, data, ingredients, backflush=backflush)
+    except BatchEntryError as exc:
+        response = django_render(request, 'manufacturing/partials/panel_batch_add.html', {
+            'order': order, 'data': data, 'ingredients': exc.rows, 'errors': exc.errors, 'backflush': backflush,
+        })
+        response['HX-Retarget'] = '#batch-panel-content'
+        response['HX-Reswap'] = 'innerHTML'
+        return response
     return _render_batches_list(request, order)
 
 
+def _batch_add_json(request, order):
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict) or not isinstance(payload.get('ingredients', []), list):
+        return JsonResponse({'errors': [{'row': None, 'message': 'Expected a JSON object with an "ingredients" list.'}]}, status=400)
+    rows = payload.get('ingredients', [])
+    if not all(isinstance(row, dict) for row in rows):
+        return JsonResponse({'errors': [{'row': None, 'message': 'Every ingredient must be a JSON object.'}]}, status=400)
+    backflush = ManufacturingSettings.for_hub(order.hub_id).auto_backflush
+    try:
+        batch = record_batch(order, payload, rows, backflush=backflush)
+    except BatchEntryError as exc:
+        return JsonResponse({'errors': [error._asdict() for error in exc.errors]}, status=400)
+    return JsonResponse({
+        'id': str(batch.pk),
+        'batch_number': batch.batch_number,
+        'ingredients': batch.ingredient_count,
+    }, status=201)
+
+
 @login_required
 @require_POST
 def batch_delete(request, pk, batch_pk):
@@ -500,17 +882,357 @@ def batch_delete(request, pk, batch_pk):
     return _render_batches_list(request, order)
 
 
+@login_required
+@require_POST
+def batches_backflush(request, pk):
+    hub_id = request.session.get('hub_id')
+    order = get_object_or_404(ProductionOrder, pk=pk, hub_id=hub_id, is_deleted=False)
+    backflush_batches(hub_id, order.batches.filter(is_deleted=False).values_list('pk', flat=True))
+    return _render_batches_list(request, order)
+
+
 @login_required
 def batch_add_panel(request, pk):
     hub_id = request.session.get('hub_id')
     order = get_object_or_404(ProductionOrder, pk=pk, hub_id=hub_id, is_deleted=False)
-    return django_render(request, 'manufacturing/partials/panel_batch_add.html', {'order': order})
+    backflush = ManufacturingSettings.for_hub(hub_id).auto_backflush
+    ingredients = []
+    if backflush and order.bom_id:
+        # One row per BOM ingredient for the operator to add lots to; the
+        # quantities are worked out from the quantity produced on save.
+        ingredients = [
+            {'description': description, 'unit': unit}
+            for description, unit in BOMLine.objects.filter(bom_id=order.bom_id, is_deleted=False)
+            .order_by('created_at', 'pk').values_list('description', 'unit')
+        ]
+    return django_render(request, 'manufacturing/partials/panel_batch_add.html', {
+        'order': order, 'ingredients': ingredients, 'backflush': backflush,
+    })
+
+
+# ======================================================================
+# Material Requirements (MRP)
+# ======================================================================
+
+@login_required
+@with_module_nav('manufacturing', 'production')
+@htmx_view('manufacturing/pages/mrp.html', 'manufacturing/partials/mrp_content.html')
+def mrp_view(request):
+    hub_id = request.session.get('hub_id')
+    bucket = request.GET.get('bucket', 'week')
+    if bucket not in MRP_BUCKETS:
+        bucket = 'week'
+    return {
+        'result': compute_requirements(hub_id, bucket=bucket),
+        'bucket': bucket,
+    }
+
+
+# ======================================================================
+# Yield Report
+# ======================================================================
+
+YIELD_REPORT_DAYS = 30
+
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
 
 
+@login_required
+@with_module_nav('manufacturing', 'production')
+@htmx_view('manufacturing/pages/yield_report.html', 'manufacturing/partials/yield_report_content.html')
+def yield_report_view(request):
+    hub_id = request.session.get('hub_id')
+    end = _parse_date(request.GET.get('end')) or timezone.localdate()
+    start = _parse_date(request.GET.get('start')) or end - timedelta(days=YIELD_REPORT_DAYS)
+    if start > end:
+        start, end = end, start
+    return {'report': bom_yield_report(hub_id, start, end)}
+
+
+# ======================================================================
+# Expiry Watch
+# ======================================================================
+
+@login_required
+@with_module_nav('manufacturing', 'production')
+@htmx_view('manufacturing/pages/expiry.html', 'manufacturing/partials/expiry_content.html')
+def expiry_view(request):
+    hub_id = request.session.get('hub_id')
+    days = clamp_days(request.GET.get('days'), ManufacturingSettings.for_hub(hub_id).expiry_warning_days)
+    return {
+        'watch': expiry_watch(hub_id, days),
+        'days': days,
+    }
+
+
+# ======================================================================
+# Lot Traceability
+# ======================================================================
+
+@login_required
+@with_module_nav('manufacturing', 'production')
+@htmx_view('manufacturing/pages/trace.html', 'manufacturing/partials/trace_content.html')
+def trace_view(request):
+    hub_id = request.session.get('hub_id')
+    query = request.GET.get('q', '').strip()
+    mode = request.GET.get('mode', 'lot')
+    if mode not in TRACE_MODES:
+        mode = 'lot'
+    return {
+        'result': trace(hub_id, query, mode) if query else None,
+        'query': query,
+        'mode': mode,
+    }
+
+
+# ======================================================================
+# Background exports
+# ======================================================================
+
+@login_required
+def export_job_status(request, pk):
+    hub_id = request.session.get('hub_id')
+    job = get_object_or_404(ExportJob, pk=pk, hub_id=hub_id, is_deleted=False)
+    return django_render(request, 'manufacturing/partials/export_job.html', {'job': job})
+
+
+@login_required
+def export_job_download(request, pk):
+    hub_id = request.session.get('hub_id')
+    job = get_object_or_404(ExportJob, pk=pk, hub_id=hub_id, is_deleted=False, status='done')
+    try:
+        handle = open(export_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404('Export file no longer available')
+    return FileResponse(handle, as_attachment=True, filename=job.file_name)
+
+
+# ======================================================================
+# JSON API
+# ======================================================================
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+
+def _api_error(message, status=400):
+    return JsonResponse({'errors': [{'row': None, 'message': message}]}, status=status)
+
+
+def _api_records(request):
+    """The records of a JSON list body, or of its ``records`` list; None when malformed."""
+    try:
+        payload = json.loads(request.body or b'null')
+    except ValueError:
+        return None
+    if isinstance(payload, dict):
+        payload = payload.get('records')
+    if not isinstance(payload, list) or not all(isinstance(record, dict) for record in payload):
+        return None
+    return payload
+
+
+def _api_list(request, hub_id, spec, fields):
+    qs = spec.model.objects.filter(hub_id=hub_id, is_deleted=False)
+    try:
+        for param, lookup in spec.filters.items():
+            value = request.GET.get(param, '').strip()
+            if value:
+                qs = qs.filter(**{lookup: value})
+    except ValidationError:
+        return _api_error(f'Invalid value for "{param}".')
+    updated_since = request.GET.get('updated_since', '').strip()
+    if updated_since:
+        try:
+            since = parse_datetime(updated_since)
+        except ValueError:
+            since = None
+        if since is None:
+            return _api_error('Invalid value for "updated_since".')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        qs = qs.filter(updated_at__gte=since)
+
+    sort = request.GET.get('sort', 'created_at').strip()
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in spec.sort_fields:
+        return _api_error('Sort by one of: %s.' % ', '.join(spec.sort_fields))
+    try:
+        limit = min(max(int(request.GET.get('limit', API_PAGE_SIZE)), 1), API_MAX_PAGE_SIZE)
+    except ValueError:
+        limit = API_PAGE_SIZE
+
+    qs = qs.only(*dict.fromkeys((*fields, sort)))
+    page = keyset_paginate(qs, sort, descending, request.GET.get('cursor', ''), limit)
+    return JsonResponse({
+        'results': [spec.serialize(obj, fields) for obj in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+        'count': page.count,
+    })
+
+
+@login_required
+@require_http_methods(['GET', 'POST', 'PATCH'])
+def api_collection(request, resource):
+    """
+    ``GET`` lists a resource a cursor page at a time (``cursor``, ``limit``,
+    ``sort``, filters and ``updated_since``). ``POST`` creates and ``PATCH``
+    updates up to ``MAX_RECORDS`` records sent as a JSON list or as
+    ``{"records": [...]}``, validated together and saved only if all are
+    valid; updates name their record by ``id`` and carry only the fields to
+    change. ``fields`` selects the fields returned.
+    """
+    hub_id = request.session.get('hub_id')
+    spec = API_RESOURCES[resource]
+    try:
+        fields = spec.select(request.GET.get('fields'))
+    except FieldSelectionError as exc:
+        return _api_error(str(exc))
+    if request.method == 'GET':
+        return _api_list(request, hub_id, spec, fields)
+
+    records = _api_records(request)
+    if records is None:
+        return _api_error('Expected a JSON list of records, or an object with a "records" list.')
+    try:
+        if request.method == 'POST':
+            result = api_bulk_create(hub_id, spec, records)
+        else:
+            result = api_bulk_update(hub_id, spec, records)
+    except BulkError as exc:
+        return JsonResponse({'errors': [error._asdict() for error in exc.errors]}, status=400)
+    objects = result.objects
+    if spec.model is ProductionOrder and _api_auto_schedule(hub_id, result):
+        # Scheduling moved dates; answer with what was saved.
+        saved = ProductionOrder.objects.in_bulk([obj.pk for obj in objects])
+        objects = [saved[obj.pk] for obj in objects]
+    return JsonResponse(
+        {'results': [spec.serialize(obj, fields) for obj in objects]},
+        status=201 if request.method == 'POST' else 200,
+    )
+
+
+def _api_auto_schedule(hub_id, result):
+    """Reschedule the hub once when orders entered or left a scheduled status; True when it did."""
+    scheduled = set(SCHEDULED_STATUSES)
+    if not any(
+        obj.status in scheduled or (original and original['status'] in scheduled)
+        for obj, original in result.changed
+    ):
+        return False
+    if not ManufacturingSettings.for_hub(hub_id).auto_schedule:
+        return False
+    schedule_hub(hub_id)
+    return True
+
+
+@login_required
+@require_GET
+def api_detail(request, resource, pk):
+    hub_id = request.session.get('hub_id')
+    spec = API_RESOURCES[resource]
+    try:
+        fields = spec.select(request.GET.get('fields'))
+    except FieldSelectionError as exc:
+        return _api_error(str(exc))
+    obj = spec.model.objects.filter(pk=pk, hub_id=hub_id, is_deleted=False).only(*fields).first()
+    if obj is None:
+        return _api_error('Not found.', status=404)
+    return JsonResponse(spec.serialize(obj, fields))
+
+
+# ======================================================================
+# Settings
+# ======================================================================
+
 @login_required
 @permission_required('manufacturing.manage_settings')
 @with_module_nav('manufacturing', 'settings')
 @htmx_view('manufacturing/pages/settings.html', 'manufacturing/partials/settings_content.html')
 def settings_view(request):
-    return {}
+    hub_id = request.session.get('hub_id')
+    settings = ManufacturingSettings.for_hub(hub_id)
+    saved = False
+    pattern_error = None
+    if request.method == 'POST' and hub_id:
+        settings.daily_capacity = request.POST.get('daily_capacity') or None
+        settings.work_on_weekends = request.POST.get('work_on_weekends') == 'on'
+        settings.auto_schedule = request.POST.get('auto_schedule') == 'on'
+        settings.auto_backflush = request.POST.get('auto_backflush') == 'on'
+        settings.expiry_warning_days = clamp_days(
+            request.POST.get('expiry_warning_days'), settings.expiry_warning_days,
+        )
+        for name in ('archive_deleted_days', 'archive_closed_days'):
+            try:
+                setattr(settings, name, max(int(request.POST.get(name)), 0))
+            except (TypeError, ValueError):
+                pass
+        try:
+            for name in ('order_number_pattern', 'batch_number_pattern'):
+                value = request.POST.get(name, '').strip() or settings._meta.get_field(name).get_default()
+                parse_pattern(value)
+                setattr(settings, name, value)
+        except PatternError as exc:
+            pattern_error = str(exc)
+        else:
+            settings.save()
+            saved = True
+    return {'settings': settings, 'saved': saved, 'pattern_error': pattern_error, **_units_context(hub_id)}
+
+
+def _units_context(hub_id, error=None):
+    return {
+        'units': UnitOfMeasure.objects.filter(hub_id=hub_id, is_deleted=False),
+        'dimensions': UNIT_DIMENSIONS,
+        'unit_error': error,
+    }
+
+
+def _render_units_list(request, hub_id, error=None):
+    return django_render(request, 'manufacturing/partials/units_list.html', _units_context(hub_id, error))
+
+
+@login_required
+@permission_required('manufacturing.manage_settings')
+@require_POST
+def unit_add(request):
+    hub_id = request.session.get('hub_id')
+    code = unit_key(request.POST.get('code'))
+    dimension = request.POST.get('dimension', '')
+    try:
+        factor = Decimal(request.POST.get('factor', '').strip())
+    except InvalidOperation:
+        factor = None
+    if not code or dimension not in dict(UNIT_DIMENSIONS) or factor is None or not factor.is_finite() or factor <= 0:
+        return _render_units_list(request, hub_id, _('Enter a code, a dimension and a positive factor.'))
+    try:
+        UnitOfMeasure._meta.get_field('factor').run_validators(factor)
+    except ValidationError:
+        return _render_units_list(request, hub_id, _('Enter a factor with at most 9 digits before and after the decimal point.'))
+    if UnitOfMeasure.objects.filter(hub_id=hub_id, is_deleted=False, code__iexact=code).exists():
+        return _render_units_list(request, hub_id, _('This unit already exists.'))
+    UnitOfMeasure.objects.create(
+        hub_id=hub_id, code=code, dimension=dimension, factor=factor,
+        name=request.POST.get('name', '').strip(),
+    )
+    return _render_units_list(request, hub_id)
+
+
+@login_required
+@permission_required('manufacturing.manage_settings')
+@require_POST
+def unit_delete(request, pk):
+    hub_id = request.session.get('hub_id')
+    obj = get_object_or_404(UnitOfMeasure, pk=pk, hub_id=hub_id, is_deleted=False)
+    obj.is_deleted = True
+    obj.deleted_at = timezone.now()
+    obj.save(update_fields=['is_deleted', 'deleted_at', 'updated_at'])
+    return _render_units_list(request, hub_id)
 